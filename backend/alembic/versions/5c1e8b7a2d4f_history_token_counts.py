@@ -0,0 +1,45 @@
+"""history token counts and rolling summaries
+
+Revision ID: 5c1e8b7a2d4f
+Revises: 9290fad6ca4e
+Create Date: 2026-10-18 10:12:41.318205
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e8b7a2d4f'
+down_revision: Union[str, Sequence[str], None] = '9290fad6ca4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # existing rows keep a NULL count and are counted when they are read
+    op.add_column(
+        'chat_conversations', sa.Column('token_count', sa.Integer(), nullable=True)
+    )
+    op.create_table(
+        'conversation_summaries',
+        sa.Column('conversation_id', sa.String(length=100), nullable=False),
+        sa.Column('summary', sa.Text(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=False),
+        sa.Column('token_count', sa.Integer(), nullable=False),
+        sa.Column(
+            'updated_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint('conversation_id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('conversation_summaries')
+    op.drop_column('chat_conversations', 'token_count')
@@ -0,0 +1,46 @@
+"""conversation message seq
+
+Revision ID: 8a3f6d21c9b7
+Revises: 5c1e8b7a2d4f
+Create Date: 2026-10-18 14:37:05.902114
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '8a3f6d21c9b7'
+down_revision: Union[str, Sequence[str], None] = '5c1e8b7a2d4f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # messages are identified by their position in the conversation, which the
+    # Redis hot history assigns before the row is written
+    op.add_column('chat_conversations', sa.Column('seq', sa.Integer(), nullable=True))
+    # makes the write-behind inserts idempotent; rows stored before have a
+    # NULL seq and never conflict
+    op.create_index(
+        'ix_chat_conversations_conversation_id_seq',
+        'chat_conversations',
+        ['conversation_id', 'seq'],
+        unique=True,
+    )
+    op.alter_column(
+        'conversation_summaries', 'last_message_id', new_column_name='last_seq'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column(
+        'conversation_summaries', 'last_seq', new_column_name='last_message_id'
+    )
+    op.drop_index(
+        'ix_chat_conversations_conversation_id_seq', table_name='chat_conversations'
+    )
+    op.drop_column('chat_conversations', 'seq')
@@ -0,0 +1,50 @@
+"""chat conversation indexes
+
+Revision ID: b47e0c3d91a5
+Revises: 8a3f6d21c9b7
+Create Date: 2026-10-18 16:21:48.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b47e0c3d91a5'
+down_revision: Union[str, Sequence[str], None] = '8a3f6d21c9b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # built concurrently so a large chat_conversations table keeps taking writes,
+    # which cannot happen inside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_chat_conversations_conversation_id_created_at_id',
+            'chat_conversations',
+            ['conversation_id', 'created_at', 'id'],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_chat_conversations_bot_id_user_id',
+            'chat_conversations',
+            ['bot_id', 'user_id'],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_chat_conversations_bot_id_user_id',
+            table_name='chat_conversations',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_chat_conversations_conversation_id_created_at_id',
+            table_name='chat_conversations',
+            postgresql_concurrently=True,
+        )
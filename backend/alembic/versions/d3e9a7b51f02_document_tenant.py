@@ -0,0 +1,34 @@
+"""document tenant
+
+Revision ID: d3e9a7b51f02
+Revises: b47e0c3d91a5
+Create Date: 2026-10-18 18:04:12.907316
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3e9a7b51f02'
+down_revision: Union[str, Sequence[str], None] = 'b47e0c3d91a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # documents stored before tenants belong to the only bot there was
+    op.add_column(
+        'documents',
+        sa.Column(
+            'bot_id', sa.String(length=100), server_default='Meddy', nullable=False
+        ),
+    )
+    op.alter_column('documents', 'bot_id', server_default=None)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'bot_id')
@@ -0,0 +1,78 @@
+"""Benchmark the local Vietnamese chunker against the LLM chunking path.
+
+Run from the backend/ directory:
+
+    python -m scripts.benchmark_chunking docs/*.txt [--llm]
+
+With --llm the single-prompt and the parallel windowed LLM strategies are
+timed as well, which shows both the wall-clock gain of windowing and the
+coverage lost when one prompt hits the output token limit.
+"""
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from loguru import logger
+from src.chunking import (chunk_by_llm, chunk_by_llm_windowed,
+                          chunk_by_vietnamese_sentences,
+                          split_vietnamese_sentences)
+
+
+def coverage(text, chunks):
+    # share of input sentences that made it into at least one chunk; the LLM
+    # path drops the tail of documents whose JSON output hits max_tokens
+    sentences = split_vietnamese_sentences(" ".join(text.split()))
+    joined = "\n".join(" ".join(chunk.split()) for chunk in chunks)
+    found = sum(len(s) for s in sentences if s in joined)
+    return found / max(sum(len(s) for s in sentences), 1)
+
+
+def run_strategy(name, chunker, texts, repeat):
+    timings, chunk_counts, chunk_lengths, coverages = [], [], [], []
+    for text in texts:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            nodes = chunker(text)
+            timings.append(time.perf_counter() - start)
+        chunks = [node.text for node in nodes]
+        chunk_counts.append(len(chunks))
+        chunk_lengths.extend(len(chunk) for chunk in chunks)
+        coverages.append(coverage(text, chunks))
+
+    total_chars = sum(len(text) for text in texts) * repeat
+    logger.info(
+        f"{name:>10}: {sum(timings):.3f}s total, "
+        f"{statistics.median(timings) * 1000:.1f} ms/doc median, "
+        f"{total_chars / sum(timings):,.0f} chars/s, "
+        f"{statistics.mean(chunk_counts):.1f} chunks/doc, "
+        f"avg/max chunk {statistics.mean(chunk_lengths):.0f}/{max(chunk_lengths)} chars, "
+        f"coverage {statistics.mean(coverages):.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", type=Path, help="UTF-8 text documents")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per document")
+    parser.add_argument(
+        "--llm",
+        action="store_true",
+        help="Also benchmark the single-prompt and windowed LLM paths (calls OpenAI)",
+    )
+    args = parser.parse_args()
+
+    texts = [path.read_text(encoding="utf-8") for path in args.paths]
+    logger.info(
+        f"Benchmarking {len(texts)} documents, {sum(map(len, texts)):,} characters"
+    )
+
+    run_strategy("vietnamese", chunk_by_vietnamese_sentences, texts, args.repeat)
+    if args.llm:
+        run_strategy("llm", chunk_by_llm, texts, repeat=1)
+        run_strategy("llm_window", chunk_by_llm_windowed, texts, repeat=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare per-call client construction with the shared client registry.
+
+Run from the backend/ directory next to the running services:
+
+    python -m scripts.benchmark_clients --iterations 200 [--openai]
+
+For each service the same cheap request is sent with a freshly built client
+(the old behaviour: new connection, TLS handshake, Redis PING) and with the
+pooled client returned by the get_*_client helpers.
+"""
+
+import argparse
+import statistics
+import time
+
+from loguru import logger
+from src.brain import create_openai_client, get_openai_client
+from src.cache import create_redis_client, get_redis_client
+from src.config import get_backend_settings
+from src.vectorize import create_qdrant_client, get_qdrant_client
+
+settings = get_backend_settings()
+
+
+def time_calls(call, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(service, fresh, shared):
+    fresh_ms = statistics.median(fresh) * 1000
+    shared_ms = statistics.median(shared) * 1000
+    logger.info(
+        f"{service:>7}: fresh client {fresh_ms:.2f} ms/call, shared client "
+        f"{shared_ms:.2f} ms/call, {fresh_ms - shared_ms:.2f} ms saved per call"
+    )
+
+
+def fresh_redis_call():
+    client = create_redis_client()
+    client.ping()  # the old get_redis_client pinged on every call
+    client.get("benchmark")
+    client.close()
+
+
+def fresh_qdrant_call():
+    client = create_qdrant_client()
+    client.get_collections()
+    client.close()
+
+
+def fresh_openai_call():
+    client = create_openai_client()
+    client.models.retrieve(settings.openai_model)
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument(
+        "--openai", action="store_true", help="Also benchmark OpenAI (network calls)"
+    )
+    args = parser.parse_args()
+
+    report(
+        "redis",
+        time_calls(fresh_redis_call, args.iterations),
+        time_calls(lambda: get_redis_client().get("benchmark"), args.iterations),
+    )
+    report(
+        "qdrant",
+        time_calls(fresh_qdrant_call, args.iterations),
+        time_calls(lambda: get_qdrant_client().get_collections(), args.iterations),
+    )
+    if args.openai:
+        iterations = min(args.iterations, 20)
+        report(
+            "openai",
+            time_calls(fresh_openai_call, iterations),
+            time_calls(
+                lambda: get_openai_client().models.retrieve(settings.openai_model),
+                iterations,
+            ),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Measure /chat/complete sync-mode throughput at increasing concurrency.
+
+Run from the backend/ directory against a running API:
+
+    python -m scripts.benchmark_concurrency --levels 1 4 16 32 --requests 64
+
+Every level sends the same number of sync requests with at most `level` in
+flight. With the async pipeline, throughput should grow with the level until
+an upstream rate limit is hit, instead of staying flat as it does when each
+request blocks the event loop.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from loguru import logger
+
+DEFAULT_API_URL = "http://localhost:8000"
+DEFAULT_QUESTIONS = [
+    "Triệu chứng của bệnh tiểu đường là gì?",
+    "Làm thế nào để phòng ngừa cảm cúm?",
+    "Sốt xuất huyết có nguy hiểm không?",
+    "Người bị cao huyết áp nên kiêng ăn gì?",
+]
+
+
+async def send_request(client, api_url, index, semaphore, latencies):
+    payload = {
+        "bot_id": "benchmark",
+        # one conversation per request so that histories do not grow
+        "user_id": f"benchmark_user_{index}",
+        "user_message": DEFAULT_QUESTIONS[index % len(DEFAULT_QUESTIONS)],
+        "is_sync_request": True,
+    }
+    async with semaphore:
+        start = time.perf_counter()
+        response = await client.post(f"{api_url}/chat/complete", json=payload)
+        latencies.append(time.perf_counter() - start)
+    response.raise_for_status()
+
+
+async def run_level(api_url, level, num_requests, timeout):
+    semaphore = asyncio.Semaphore(level)
+    latencies = []
+    limits = httpx.Limits(max_connections=level, max_keepalive_connections=level)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                send_request(client, api_url, i, semaphore, latencies)
+                for i in range(num_requests)
+            ),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - start
+
+    errors = sum(isinstance(result, Exception) for result in results)
+    latencies.sort()
+    logger.info(
+        f"concurrency {level:>3}: {num_requests / elapsed:6.2f} req/s, "
+        f"median {statistics.median(latencies):.2f}s, "
+        f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.2f}s, "
+        f"{errors} errors"
+    )
+
+
+async def main_async(args):
+    for level in args.levels:
+        await run_level(args.api_url, level, args.requests, args.timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url", default=DEFAULT_API_URL)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
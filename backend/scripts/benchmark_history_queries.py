@@ -0,0 +1,205 @@
+"""Benchmark conversation history queries before and after the composite indexes.
+
+Run from the backend/ directory against a migrated Postgres database:
+
+    python -m scripts.benchmark_history_queries [--rows 5000000] [--seed 0]
+
+A scratch copy of chat_conversations is seeded server-side with generate_series
+and only a primary key, the state of the table before the indexes migration.
+The queries are timed on it, the (conversation_id, created_at, id) and
+(bot_id, user_id) indexes are built, and the same queries are timed again.
+The full-row history query used before is reported next to the keyset
+paginated, column-projected one. The scratch table is dropped at the end
+unless --keep is given.
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from loguru import logger
+from sqlalchemy import text
+from src.database import engine
+
+# the scratch table name is spelled out in every statement so that no SQL is
+# built from strings; values are always bound parameters
+DROP_SQL = "DROP TABLE IF EXISTS chat_conversations_benchmark"
+
+# columns and defaults only: no indexes are copied
+CREATE_SQL = """
+CREATE TABLE chat_conversations_benchmark (LIKE chat_conversations INCLUDING DEFAULTS)
+"""
+
+SEED_SQL = """
+INSERT INTO chat_conversations_benchmark (
+    id, conversation_id, bot_id, user_id, message, is_request,
+    is_completed, token_count, seq, created_at, updated_at
+)
+SELECT g,
+       -- consecutive rows belong to different conversations, so each
+       -- conversation is spread over the table as it is in production
+       'conversation_' || (g % :conversations),
+       'Meddy',
+       'user_' || (g % :conversations % :users),
+       repeat('Tin nhắn ' || g || ' ', 8),
+       g / :conversations % 2 = 0,
+       g / :conversations % 2 = 1,
+       24,
+       g / :conversations,
+       now() - make_interval(secs => :rows - g),
+       now() - make_interval(secs => :rows - g)
+FROM generate_series(:start, :stop) AS g
+"""
+
+# the same indexes as the chat_conversation_indexes migration
+INDEX_SQL = [
+    """
+    CREATE INDEX chat_conversations_benchmark_conversation_id_created_at_id
+    ON chat_conversations_benchmark (conversation_id, created_at, id)
+    """,
+    """
+    CREATE INDEX chat_conversations_benchmark_bot_id_user_id
+    ON chat_conversations_benchmark (bot_id, user_id)
+    """,
+]
+
+FULL_HISTORY_SQL = """
+SELECT * FROM chat_conversations_benchmark
+WHERE conversation_id = :conversation_id
+ORDER BY created_at, id
+"""
+
+FIRST_PAGE_SQL = """
+SELECT id, seq, message, is_request, token_count, created_at
+FROM chat_conversations_benchmark
+WHERE conversation_id = :conversation_id
+ORDER BY created_at, id
+LIMIT :limit
+"""
+
+NEXT_PAGE_SQL = """
+SELECT id, seq, message, is_request, token_count, created_at
+FROM chat_conversations_benchmark
+WHERE conversation_id = :conversation_id AND (created_at, id) > (:created_at, :id)
+ORDER BY created_at, id
+LIMIT :limit
+"""
+
+USER_CONVERSATIONS_SQL = """
+SELECT DISTINCT conversation_id FROM chat_conversations_benchmark
+WHERE bot_id = :bot_id AND user_id = :user_id
+"""
+
+
+def seed(conn, rows, conversations, users, batch_size):
+    conn.execute(text(DROP_SQL))
+    conn.execute(text(CREATE_SQL))
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        conn.execute(
+            text(SEED_SQL),
+            {
+                "start": offset,
+                "stop": min(offset + batch_size, rows) - 1,
+                "rows": rows,
+                "conversations": conversations,
+                "users": users,
+            },
+        )
+        logger.info(f"seeded {min(offset + batch_size, rows):,}/{rows:,} rows")
+    conn.execute(text("ALTER TABLE chat_conversations_benchmark ADD PRIMARY KEY (id)"))
+    conn.execute(text("ANALYZE chat_conversations_benchmark"))
+    logger.info(f"seeded {rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+
+def create_indexes(conn):
+    start = time.perf_counter()
+    for index_sql in INDEX_SQL:
+        conn.execute(text(index_sql))
+    conn.execute(text("ANALYZE chat_conversations_benchmark"))
+    logger.info(f"built indexes in {time.perf_counter() - start:.1f}s")
+
+
+def read_full_history(conn, conversation_id, page_size):
+    return conn.execute(
+        text(FULL_HISTORY_SQL), {"conversation_id": conversation_id}
+    ).all()
+
+
+def read_keyset_history(conn, conversation_id, page_size):
+    params = {"conversation_id": conversation_id, "limit": page_size}
+    page = conn.execute(text(FIRST_PAGE_SQL), params).all()
+    rows = list(page)
+    while len(page) == page_size:
+        params.update(created_at=page[-1].created_at, id=page[-1].id)
+        page = conn.execute(text(NEXT_PAGE_SQL), params).all()
+        rows += page
+    return rows
+
+
+def read_user_conversations(conn, user_id, page_size):
+    return conn.execute(
+        text(USER_CONVERSATIONS_SQL), {"bot_id": "Meddy", "user_id": user_id}
+    ).all()
+
+
+def time_query(conn, name, query, keys, page_size):
+    latencies = []
+    for key in keys:
+        start = time.perf_counter()
+        query(conn, key, page_size)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    logger.info(
+        f"{name:>32}: median {statistics.median(latencies) * 1000:8.2f} ms, "
+        f"p95 {latencies[int(0.95 * (len(latencies) - 1))] * 1000:8.2f} ms"
+    )
+
+
+def run_queries(conn, label, conversation_ids, user_ids, page_size):
+    logger.info(f"--- {label} ---")
+    time_query(conn, "full history", read_full_history, conversation_ids, page_size)
+    time_query(
+        conn, "keyset pages, projected", read_keyset_history, conversation_ids, page_size
+    )
+    time_query(conn, "conversations of a user", read_user_conversations, user_ids, page_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--messages-per-conversation", type=int, default=40)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=500_000)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=20, help="Lookups per query")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch table")
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed picking the looked-up keys"
+    )
+    args = parser.parse_args()
+
+    # the same seed looks up the same keys, so runs can be compared; the keys
+    # are not secrets, a non-cryptographic generator is what is wanted
+    rng = random.Random(args.seed)  # noqa: S311
+    conversations = max(args.rows // args.messages_per_conversation, 1)
+    conversation_ids = [
+        f"conversation_{rng.randrange(conversations)}" for _ in range(args.queries)
+    ]
+    user_ids = [f"user_{rng.randrange(args.users)}" for _ in range(args.queries)]
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        seed(conn, args.rows, conversations, args.users, args.batch_size)
+        try:
+            run_queries(conn, "primary key only", conversation_ids, user_ids, args.page_size)
+            create_indexes(conn)
+            run_queries(conn, "composite indexes", conversation_ids, user_ids, args.page_size)
+        finally:
+            if not args.keep:
+                conn.execute(text(DROP_SQL))
+
+
+if __name__ == "__main__":
+    main()
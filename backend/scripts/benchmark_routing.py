@@ -0,0 +1,104 @@
+"""Benchmark the local embedding intent router against the LLM router.
+
+Run from the backend/ directory:
+
+    python -m scripts.benchmark_routing labeled.jsonl [--exemplars other.json]
+
+Each line of the labeled file is {"question": "...", "route": "medical" | "general"}.
+The embedding router is reported on its own and with the LLM fallback for
+low-margin queries, so the share of turns that still pay for an LLM call is
+visible next to the accuracy.
+"""
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+from loguru import logger
+from src.brain import detect_route
+from src.config import get_backend_settings
+from src.embedding_cache import get_cached_embedding
+from src.intent_router import EmbeddingRouter, load_route_exemplars
+
+settings = get_backend_settings()
+
+
+def report(name, predictions, labels, latencies, llm_calls):
+    accuracy = statistics.mean(p == label for p, label in zip(predictions, labels))
+    latencies = sorted(latencies)
+    logger.info(
+        f"{name:>18}: accuracy {accuracy:.1%}, "
+        f"median {statistics.median(latencies) * 1000:.1f} ms, "
+        f"p95 {latencies[int(0.95 * (len(latencies) - 1))] * 1000:.1f} ms, "
+        f"LLM calls {llm_calls}/{len(labels)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", type=Path, help="JSONL file of labeled questions")
+    parser.add_argument("--exemplars", default=settings.route_exemplars_path)
+    parser.add_argument("--min-margin", type=float, default=settings.route_min_margin)
+    parser.add_argument("--top-k", type=int, default=settings.route_top_k)
+    parser.add_argument("--skip-llm", action="store_true", help="Do not call the LLM router")
+    args = parser.parse_args()
+
+    samples = [
+        json.loads(line)
+        for line in args.path.read_text(encoding="utf-8").splitlines()
+        if line.strip()
+    ]
+    questions = [sample["question"] for sample in samples]
+    labels = [sample["route"] for sample in samples]
+
+    start = time.perf_counter()
+    router = EmbeddingRouter(load_route_exemplars(args.exemplars), top_k=args.top_k)
+    logger.info(f"Embedded exemplars in {time.perf_counter() - start:.2f}s")
+
+    # warm the embedding cache so the timings below measure a repeated query,
+    # which is what the router sees for popular questions in production
+    for question in questions:
+        get_cached_embedding(question)
+
+    embedding_predictions, margins, embedding_latencies = [], [], []
+    for question in questions:
+        start = time.perf_counter()
+        route, margin, _ = router.classify(get_cached_embedding(question))
+        embedding_latencies.append(time.perf_counter() - start)
+        embedding_predictions.append(route)
+        margins.append(margin)
+    report("embedding", embedding_predictions, labels, embedding_latencies, 0)
+
+    if args.skip_llm:
+        return
+
+    llm_predictions, llm_latencies = [], []
+    for question in questions:
+        start = time.perf_counter()
+        llm_predictions.append(detect_route([], question))
+        llm_latencies.append(time.perf_counter() - start)
+    report("llm", llm_predictions, labels, llm_latencies, len(questions))
+
+    # the fallback path reuses the LLM answers measured above
+    fallback = [margin < args.min_margin for margin in margins]
+    hybrid_predictions = [
+        llm if use_llm else embedding
+        for embedding, llm, use_llm in zip(embedding_predictions, llm_predictions, fallback)
+    ]
+    hybrid_latencies = [
+        embedding + (llm if use_llm else 0.0)
+        for embedding, llm, use_llm in zip(embedding_latencies, llm_latencies, fallback)
+    ]
+    report(
+        "embedding+fallback",
+        hybrid_predictions,
+        labels,
+        hybrid_latencies,
+        sum(fallback),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import time
+from pathlib import Path
+
+import requests
+from loguru import logger
+
+DEFAULT_API_URL = "http://localhost:8000"
+# (connect, read) seconds; the read timeout covers the server holding the
+# upload back while the indexing queue drains
+DEFAULT_TIMEOUT = (10, 600)
+
+
+def read_file_chunks(path, chunk_size=1024 * 1024):
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def submit_documents(path, api_url=DEFAULT_API_URL, timeout=DEFAULT_TIMEOUT):
+    # requests sends a generator body with chunked transfer encoding, so the
+    # file is streamed to the API instead of being loaded into memory
+    response = requests.post(
+        f"{api_url}/documents/bulk",
+        data=read_file_chunks(path),
+        headers={"Content-Type": "application/x-ndjson"},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def wait_for_job(job_id, api_url=DEFAULT_API_URL, interval=2.0):
+    while True:
+        response = requests.get(f"{api_url}/documents/bulk/{job_id}", timeout=30)
+        response.raise_for_status()
+        job = response.json()
+        logger.info(
+            f"[{job['status']}] inserted={job['inserted']} enqueued={job['enqueued']} "
+            f"indexed={job['indexed']} failed={job['failed']} "
+            f"({job['throughput']['indexed_per_second']} docs/s indexed)"
+        )
+        if job["status"] == "completed":
+            return job
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk ingest an NDJSON/JSONL file of {title, content} documents."
+    )
+    parser.add_argument("path", type=Path, help="Path to the .ndjson/.jsonl file")
+    parser.add_argument("--api-url", default=DEFAULT_API_URL)
+    parser.add_argument(
+        "--no-wait", action="store_true", help="Return once the upload is accepted"
+    )
+    args = parser.parse_args()
+
+    start = time.time()
+    job = submit_documents(args.path, api_url=args.api_url)
+    logger.info(
+        f"Job {job['job_id']}: uploaded {job['received']} documents "
+        f"({job['invalid']} invalid lines) in {time.time() - start:.1f}s"
+    )
+    if not args.no_wait:
+        job = wait_for_job(job["job_id"], api_url=args.api_url)
+        logger.info(f"Job {job['job_id']} finished in {job['elapsed_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
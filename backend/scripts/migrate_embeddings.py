@@ -0,0 +1,134 @@
+"""Re-embed a collection at a different embedding dimension and measure recall.
+
+Run from the backend/ directory:
+
+    # copy every chunk of `documents` into `documents_512` with 512-d vectors
+    python -m scripts.migrate_embeddings migrate --target documents_512 --dimension 512
+
+    # compare top-k results of the new collection against the old one
+    python -m scripts.migrate_embeddings evaluate --candidate documents_512 --queries q.txt
+
+Point ids and payloads are kept, so once the candidate looks good switch
+DEFAULT_COLLECTION_NAME and VECTOR_DIMENSION to the new collection.
+"""
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from loguru import logger
+from src.config import get_backend_settings
+from src.embedding_cache import get_cached_embedding, get_cached_embeddings
+from src.vectorize import (create_collection, get_qdrant_client, scroll_points,
+                           search_vectors, upsert_points)
+
+settings = get_backend_settings()
+
+
+def get_vector_size(collection_name):
+    collection = get_qdrant_client().get_collection(collection_name)
+    return collection.config.params.vectors.size
+
+
+def migrate(args):
+    create_collection(
+        args.target, args.dimension, quantization=args.quantization, on_disk=args.on_disk
+    )
+
+    start, total = time.time(), 0
+    for records in scroll_points(args.source, batch_size=args.batch_size):
+        embeddings = get_cached_embeddings(
+            [record.payload["content"] for record in records],
+            dimensions=args.dimension,
+        )
+        points = (
+            {"id": record.id, "embedding": embedding, "metadata": record.payload}
+            for record, embedding in zip(records, embeddings)
+        )
+        total += upsert_points(points, collection_name=args.target)
+        logger.info(f"Migrated {total} points ({total / (time.time() - start):.1f}/s)")
+
+    source_size = get_vector_size(args.source)
+    logger.info(
+        f"Migrated {total} points from {args.source} ({source_size}d) to "
+        f"{args.target} ({args.dimension}d) in {time.time() - start:.1f}s; raw vector "
+        f"storage {total * source_size * 4 / 2**20:.1f} MiB -> "
+        f"{total * args.dimension * 4 / 2**20:.1f} MiB"
+    )
+
+
+def timed_search(query_vector, collection_name, top_k):
+    start = time.perf_counter()
+    results = search_vectors(query_vector, top_k=top_k, collection_name=collection_name)
+    return [result["id"] for result in results], time.perf_counter() - start
+
+
+def evaluate(args):
+    queries = [
+        line.strip()
+        for line in args.queries.read_text(encoding="utf-8").splitlines()
+        if line.strip()
+    ]
+    baseline_dimension = get_vector_size(args.baseline)
+    candidate_dimension = get_vector_size(args.candidate)
+
+    recalls, baseline_latencies, candidate_latencies = [], [], []
+    for query in queries:
+        baseline_ids, baseline_latency = timed_search(
+            get_cached_embedding(query, dimensions=baseline_dimension),
+            args.baseline,
+            args.top_k,
+        )
+        candidate_ids, candidate_latency = timed_search(
+            get_cached_embedding(query, dimensions=candidate_dimension),
+            args.candidate,
+            args.top_k,
+        )
+        if baseline_ids:
+            recalls.append(len(set(baseline_ids) & set(candidate_ids)) / len(baseline_ids))
+        baseline_latencies.append(baseline_latency)
+        candidate_latencies.append(candidate_latency)
+
+    logger.info(
+        f"{len(queries)} queries, recall@{args.top_k} of {args.candidate} "
+        f"({candidate_dimension}d) vs {args.baseline} ({baseline_dimension}d): "
+        f"{statistics.mean(recalls):.3f}"
+    )
+    logger.info(
+        f"median search latency {statistics.median(baseline_latencies) * 1000:.1f} ms -> "
+        f"{statistics.median(candidate_latencies) * 1000:.1f} ms, vector size "
+        f"{baseline_dimension * 4} B -> {candidate_dimension * 4} B per point"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Re-embed into a new collection")
+    migrate_parser.add_argument("--source", default=settings.default_collection_name)
+    migrate_parser.add_argument("--target", required=True)
+    migrate_parser.add_argument("--dimension", type=int, required=True)
+    migrate_parser.add_argument(
+        "--quantization", default="", choices=["", "scalar", "product", "binary"]
+    )
+    migrate_parser.add_argument("--on-disk", action="store_true")
+    migrate_parser.add_argument("--batch-size", type=int, default=256)
+    migrate_parser.set_defaults(func=migrate)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="Measure recall and latency")
+    evaluate_parser.add_argument("--baseline", default=settings.default_collection_name)
+    evaluate_parser.add_argument("--candidate", required=True)
+    evaluate_parser.add_argument(
+        "--queries", type=Path, required=True, help="Text file, one query per line"
+    )
+    evaluate_parser.add_argument("--top-k", type=int, default=settings.top_k)
+    evaluate_parser.set_defaults(func=evaluate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
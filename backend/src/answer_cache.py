@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+from loguru import logger
+from qdrant_client.models import (Direction, FieldCondition, Filter,
+                                  FilterSelector, MatchAny, MatchValue,
+                                  OrderBy, PayloadSchemaType, PointIdsList,
+                                  PointStruct, Range)
+
+from .config import get_backend_settings
+from .vectorize import (create_collection, get_async_qdrant_client,
+                        get_qdrant_client)
+
+settings = get_backend_settings()
+
+ANSWER_CACHE_INDEX_FIELDS = {
+    "scope": PayloadSchemaType.KEYWORD,
+    "doc_ids": PayloadSchemaType.KEYWORD,
+    # range index, also required for ordering by age on eviction
+    "created_at": PayloadSchemaType.FLOAT,
+}
+
+_collection_ready = False
+
+
+def ensure_answer_cache_collection(
+    collection_name=settings.answer_cache_collection,
+    vector_dimension=settings.vector_dimension,
+):
+    global _collection_ready
+    if _collection_ready:
+        return
+    create_collection(collection_name, vector_dimension)
+    client = get_qdrant_client()
+    existing = client.get_collection(collection_name).payload_schema
+    for field_name, field_schema in ANSWER_CACHE_INDEX_FIELDS.items():
+        if field_name not in existing:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+    _collection_ready = True
+
+
+def get_answer_cache_scope(search_filter=None):
+    # answers retrieved under one tenant filter must not be served to another
+    serialized = json.dumps(search_filter or {}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16]
+
+
+def build_answer_cache_filter(scope, ttl=settings.answer_cache_ttl):
+    return Filter(
+        must=[
+            FieldCondition(key="scope", match=MatchValue(value=scope)),
+            FieldCondition(key="created_at", range=Range(gte=time.time() - ttl)),
+        ]
+    )
+
+
+def get_cached_answer(hits):
+    if not hits:
+        return None
+    logger.info(
+        f"Answer cache hit (score {hits[0].score:.3f}) for cached question: "
+        f"{hits[0].payload.get('question')}"
+    )
+    return hits[0].payload["answer"]
+
+
+def lookup_cached_answer(
+    question_embedding,
+    search_filter=None,
+    threshold=settings.answer_cache_threshold,
+    ttl=settings.answer_cache_ttl,
+    collection_name=settings.answer_cache_collection,
+):
+    if not settings.answer_cache_enabled:
+        return None
+    try:
+        ensure_answer_cache_collection(collection_name)
+        hits = get_qdrant_client().search(
+            collection_name=collection_name,
+            query_vector=question_embedding,
+            query_filter=build_answer_cache_filter(
+                get_answer_cache_scope(search_filter), ttl=ttl
+            ),
+            score_threshold=threshold,
+            limit=1,
+        )
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed, treating as miss: {e}")
+        return None
+    return get_cached_answer(hits)
+
+
+async def async_lookup_cached_answer(
+    question_embedding,
+    search_filter=None,
+    threshold=settings.answer_cache_threshold,
+    ttl=settings.answer_cache_ttl,
+    collection_name=settings.answer_cache_collection,
+):
+    if not settings.answer_cache_enabled:
+        return None
+    try:
+        if not _collection_ready:
+            await asyncio.to_thread(ensure_answer_cache_collection, collection_name)
+        hits = await get_async_qdrant_client().search(
+            collection_name=collection_name,
+            query_vector=question_embedding,
+            query_filter=build_answer_cache_filter(
+                get_answer_cache_scope(search_filter), ttl=ttl
+            ),
+            score_threshold=threshold,
+            limit=1,
+        )
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed, treating as miss: {e}")
+        return None
+    return get_cached_answer(hits)
+
+
+def store_cached_answer(
+    question,
+    question_embedding,
+    answer,
+    doc_ids,
+    search_filter=None,
+    collection_name=settings.answer_cache_collection,
+):
+    if not settings.answer_cache_enabled:
+        return
+    try:
+        ensure_answer_cache_collection(collection_name)
+        get_qdrant_client().upsert(
+            collection_name=collection_name,
+            points=[
+                PointStruct(
+                    id=str(uuid.uuid4()),
+                    vector=question_embedding,
+                    payload={
+                        "question": question,
+                        "answer": answer,
+                        "doc_ids": sorted({str(doc_id) for doc_id in doc_ids}),
+                        "scope": get_answer_cache_scope(search_filter),
+                        "created_at": time.time(),
+                    },
+                )
+            ],
+            wait=False,
+        )
+        evict_cached_answers(collection_name=collection_name)
+    except Exception as e:
+        logger.warning(f"Could not store answer in cache: {e}")
+
+
+def evict_cached_answers(
+    max_size=settings.answer_cache_max_size,
+    ttl=settings.answer_cache_ttl,
+    collection_name=settings.answer_cache_collection,
+):
+    client = get_qdrant_client()
+    client.delete(
+        collection_name=collection_name,
+        points_selector=FilterSelector(
+            filter=Filter(
+                must=[
+                    FieldCondition(
+                        key="created_at", range=Range(lt=time.time() - ttl)
+                    )
+                ]
+            )
+        ),
+    )
+
+    # approximate count is enough to keep the cache around max_size
+    overflow = client.count(collection_name=collection_name, exact=False).count - max_size
+    if overflow <= 0:
+        return 0
+    oldest, _ = client.scroll(
+        collection_name=collection_name,
+        limit=overflow,
+        order_by=OrderBy(key="created_at", direction=Direction.ASC),
+        with_payload=False,
+    )
+    client.delete(
+        collection_name=collection_name,
+        points_selector=PointIdsList(points=[point.id for point in oldest]),
+    )
+    logger.info(f"Evicted {len(oldest)} oldest answers from {collection_name}")
+    return len(oldest)
+
+
+def invalidate_cached_answers(
+    doc_ids, collection_name=settings.answer_cache_collection
+):
+    # called whenever one of the documents behind a cached answer changes
+    if not settings.answer_cache_enabled or not doc_ids:
+        return
+    try:
+        ensure_answer_cache_collection(collection_name)
+        get_qdrant_client().delete(
+            collection_name=collection_name,
+            points_selector=FilterSelector(
+                filter=Filter(
+                    must=[
+                        FieldCondition(
+                            key="doc_ids",
+                            match=MatchAny(any=[str(doc_id) for doc_id in doc_ids]),
+                        )
+                    ]
+                )
+            ),
+        )
+        logger.info(f"Invalidated cached answers for documents {list(doc_ids)}")
+    except Exception as e:
+        logger.error(f"Error invalidating cached answers for {list(doc_ids)}: {e}")
+        raise
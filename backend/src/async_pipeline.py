@@ -0,0 +1,140 @@
+"""asyncio-native version of the chat pipeline used by the API's sync mode.
+
+Every network call is awaited on the event loop, so a request waiting on the
+LLM does not hold up other requests served by the same worker. Stages that
+only have blocking clients (the llama-index agent, Tavily, the embedding
+router, psycopg2) run in the default thread pool.
+"""
+
+import asyncio
+
+from loguru import logger
+
+from .agent import ai_agent_handle
+from .answer_cache import async_lookup_cached_answer, store_cached_answer
+from .brain import (async_detect_route, async_detect_route_and_rewrite,
+                    async_enhance_query_quality, async_get_tavily_agent_answer,
+                    async_openai_chat_complete)
+from .config import get_backend_settings
+from .embedding_cache import async_get_cached_embedding
+from .intent_router import embedding_detect_route
+from .models import async_update_conversation
+from .rerank import async_rerank_documents
+from .tasks import (build_rag_messages, load_conversation_history,
+                    persist_assistant_answer)
+from .vectorize import async_search_vectors
+
+settings = get_backend_settings()
+
+
+async def async_resolve_route(history, question):
+    """Return the route and an awaitable holding the rewritten question."""
+    if settings.route_strategy == "combined":
+        try:
+            result = await async_detect_route_and_rewrite(history, question)
+            rewrite_future = asyncio.get_running_loop().create_future()
+            rewrite_future.set_result(result.rewritten_question)
+            return result.route, rewrite_future
+        except ValueError as e:
+            logger.warning(f"Invalid route/rewrite output, using separate calls: {e}")
+
+    rewrite_task = asyncio.create_task(async_enhance_query_quality(history, question))
+    if settings.route_strategy == "embedding":
+        route = await asyncio.to_thread(embedding_detect_route, history, question)
+    else:
+        route = await async_detect_route(history, question)
+    return route, rewrite_task
+
+
+async def async_rag_answer(history, question, search_filter=None, rewritten_question=None):
+    new_question = rewritten_question or await async_enhance_query_quality(
+        history, question
+    )
+    question_embedding = await async_get_cached_embedding(
+        new_question, model=settings.openai_embedding_model
+    )
+    cached_answer = await async_lookup_cached_answer(
+        question_embedding, search_filter=search_filter
+    )
+    if cached_answer is not None:
+        return cached_answer
+
+    relevant_docs = await async_search_vectors(
+        query_vector=question_embedding,
+        top_k=settings.top_k,
+        collection_name=settings.default_collection_name,
+        query_filter=search_filter,
+    )
+    logger.info(f"Retrieved {len(relevant_docs)} documents from vector DB")
+
+    reranked_docs, rerank_context = await async_rerank_documents(
+        new_question, relevant_docs
+    )
+    messages, use_web_search = build_rag_messages(
+        history, new_question, reranked_docs, rerank_context
+    )
+
+    if use_web_search:
+        response = await async_get_tavily_agent_answer(messages)
+        logger.info("Response generated with web search fallback")
+        return response
+
+    response = await async_openai_chat_complete(
+        messages=messages, temperature=0.7, max_tokens=2048, stage="answer"
+    )
+    logger.info("RAG response generated successfully")
+    await asyncio.to_thread(
+        store_cached_answer,
+        new_question,
+        question_embedding,
+        response,
+        doc_ids=[relevant_docs[doc.index]["doc_id"] for doc in reranked_docs],
+        search_filter=search_filter,
+    )
+    return response
+
+
+async def async_route_answer_message(history, question, search_filter=None):
+    route, rewrite = await async_resolve_route(history, question)
+
+    logger.info(f"Bot route: {route}")
+    if route == "medical":
+        return await async_rag_answer(
+            history,
+            question,
+            search_filter=search_filter,
+            rewritten_question=await rewrite,
+        )
+
+    rewrite.cancel()
+    if route == "general":
+        return await asyncio.to_thread(ai_agent_handle, question)
+
+
+async def async_message_handler(bot_id, user_id, query, search_filter=None):
+    logger.info(f"▶ Async message handler started: {bot_id}/{user_id}")
+
+    try:
+        conversation_id = await async_update_conversation(
+            bot_id, user_id, query, is_request=True
+        )
+        messages = await asyncio.to_thread(load_conversation_history, conversation_id)
+        logger.info(
+            f"Conversation {conversation_id}: {len(messages)} messages in history"
+        )
+
+        answer = await async_route_answer_message(
+            messages[:-1], query, search_filter=search_filter
+        )
+        logger.info(f"Generated response for conversation {conversation_id}:\n{answer}")
+
+        await asyncio.to_thread(persist_assistant_answer, bot_id, user_id, answer)
+
+        logger.info(f"Async message handler completed: {bot_id}/{user_id}")
+        return {"role": "assistant", "content": answer}
+    except Exception as e:
+        logger.error(f"Error in async message handler: {e}")
+        return {
+            "role": "assistant",
+            "content": "Xin lỗi, đã có lỗi xảy ra trong quá trình xử lý câu hỏi.",
+        }
@@ -1,33 +1,90 @@
+import asyncio
 import json
 import os
+import time
 
+import httpx
 from loguru import logger
-from openai import OpenAI
+from openai import (AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient,
+                    OpenAI)
 
+from .clients import get_client
 from .config import get_backend_settings
+from .memoize import memoize, prompt_version
+from .prompts import (assemble_templated_messages, async_record_usage,
+                      record_usage)
+from .schema import RouteRewriteResult
+from .utils import count_tokens
 
 settings = get_backend_settings()
 
 
+def get_openai_http_limits():
+    return httpx.Limits(
+        max_connections=settings.openai_max_connections,
+        max_keepalive_connections=settings.openai_max_keepalive_connections,
+    )
+
+
+def create_openai_client():
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable not set.")
+    return OpenAI(
+        api_key=api_key,
+        timeout=settings.openai_timeout,
+        max_retries=settings.openai_max_retries,
+        http_client=DefaultHttpxClient(limits=get_openai_http_limits()),
+    )
+
+
+def create_async_openai_client():
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable not set.")
+    return AsyncOpenAI(
+        api_key=api_key,
+        timeout=settings.openai_timeout,
+        max_retries=settings.openai_max_retries,
+        http_client=DefaultAsyncHttpxClient(limits=get_openai_http_limits()),
+    )
+
+
 def get_openai_client():
     try:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set.")
-        client = OpenAI(api_key=api_key)
-        return client
+        return get_client("openai", create_openai_client)
     except Exception as e:
         logger.error(f"Error initializing OpenAI client: {e}")
         raise
 
 
-def openai_generate_embedding(text, model=settings.openai_embedding_model):
+def get_async_openai_client():
+    try:
+        return get_client("async_openai", create_async_openai_client)
+    except Exception as e:
+        logger.error(f"Error initializing async OpenAI client: {e}")
+        raise
+
+
+def get_dimensions_kwargs(model, dimensions):
+    # only the text-embedding-3 family can shorten its output natively
+    if dimensions and model.startswith("text-embedding-3"):
+        return {"dimensions": dimensions}
+    return {}
+
+
+def openai_generate_embedding(
+    text,
+    model=settings.openai_embedding_model,
+    dimensions=settings.vector_dimension,
+):
     try:
         text = text.replace("\n", " ")
         client = get_openai_client()
         response = client.embeddings.create(
             input=text,
             model=model,
+            **get_dimensions_kwargs(model, dimensions),
         )
         return response.data[0].embedding
     except Exception as e:
@@ -35,87 +92,331 @@ def openai_generate_embedding(text, model=settings.openai_embedding_model):
         raise
 
 
+async def async_openai_generate_embedding(
+    text,
+    model=settings.openai_embedding_model,
+    dimensions=settings.vector_dimension,
+):
+    try:
+        text = text.replace("\n", " ")
+        client = get_async_openai_client()
+        response = await client.embeddings.create(
+            input=text,
+            model=model,
+            **get_dimensions_kwargs(model, dimensions),
+        )
+        return response.data[0].embedding
+    except Exception as e:
+        logger.error(f"Error generating embedding for {text}: {e}")
+        raise
+
+
+def batch_texts_for_embedding(
+    texts,
+    model=settings.openai_embedding_model,
+    batch_size=settings.embedding_batch_size,
+    max_batch_tokens=settings.embedding_batch_max_tokens,
+):
+    # yield lists of (index, text) so callers can put results back in input order
+    batch, batch_tokens = [], 0
+    for index, text in enumerate(texts):
+        num_tokens = count_tokens(text, model=model)
+        if batch and (
+            len(batch) >= batch_size or batch_tokens + num_tokens > max_batch_tokens
+        ):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((index, text))
+        batch_tokens += num_tokens
+    if batch:
+        yield batch
+
+
+def openai_generate_embeddings(
+    texts,
+    model=settings.openai_embedding_model,
+    batch_size=settings.embedding_batch_size,
+    max_batch_tokens=settings.embedding_batch_max_tokens,
+    max_retries=settings.embedding_max_retries,
+    dimensions=settings.vector_dimension,
+):
+    try:
+        texts = [text.replace("\n", " ") for text in texts]
+        embeddings = [None] * len(texts)
+        client = get_openai_client()
+
+        for batch in batch_texts_for_embedding(
+            texts, model=model, batch_size=batch_size, max_batch_tokens=max_batch_tokens
+        ):
+            for attempt in range(1, max_retries + 1):
+                try:
+                    response = client.embeddings.create(
+                        input=[text for _, text in batch],
+                        model=model,
+                        **get_dimensions_kwargs(model, dimensions),
+                    )
+                    break
+                except Exception as e:
+                    if attempt == max_retries:
+                        raise
+                    delay = 2 ** (attempt - 1)
+                    logger.warning(
+                        f"Embedding batch of {len(batch)} texts failed (attempt {attempt}/{max_retries}), retrying in {delay}s: {e}"
+                    )
+                    time.sleep(delay)
+
+            # the API returns one item per input, tagged with the input position
+            for item in response.data:
+                embeddings[batch[item.index][0]] = item.embedding
+
+        logger.info(
+            f"Generated {len(embeddings)} embeddings in batches of up to {batch_size}"
+        )
+        return embeddings
+    except Exception as e:
+        logger.error(f"Error generating embeddings for {len(texts)} texts: {e}")
+        raise
+
+
+def get_completion_kwargs(stage, response_format=None):
+    kwargs = {"response_format": response_format} if response_format else {}
+    if settings.openai_prompt_cache_key:
+        # requests of a stage share their static prefix; a common key routes
+        # them to the same prompt cache
+        kwargs["prompt_cache_key"] = f"{settings.openai_prompt_cache_key}:{stage}"
+    return kwargs
+
+
 def openai_chat_complete(
     messages,
     model=settings.openai_model,
     temperature=settings.temperature,
     max_tokens=settings.max_tokens,
+    response_format=None,
+    stage="chat",
 ):
     try:
         client = get_openai_client()
+        start = time.perf_counter()
         response = client.chat.completions.create(
             model=model,
             messages=messages,
             max_tokens=max_tokens,
             temperature=temperature,
+            **get_completion_kwargs(stage, response_format),
         )
+        record_usage(stage, response.usage, time.perf_counter() - start)
         return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Error generating response: {e}")
         raise
 
 
-def generate_conversation_text(conversations):
+async def async_openai_chat_complete(
+    messages,
+    model=settings.openai_model,
+    temperature=settings.temperature,
+    max_tokens=settings.max_tokens,
+    response_format=None,
+    stage="chat",
+):
     try:
-        conversation_text = ""
-        for conversation in conversations:
-            if conversation.get("role") in ["user", "assistant"]:
-                role = conversation.get("role")
-                content = conversation.get("content", "")
-                conversation_text += f"{role}: {content}\n"
-        return conversation_text
+        client = get_async_openai_client()
+        start = time.perf_counter()
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **get_completion_kwargs(stage, response_format),
+        )
+        await async_record_usage(stage, response.usage, time.perf_counter() - start)
+        return response.choices[0].message.content
     except Exception as e:
-        logger.error(f"Error generating conversation text: {e}")
+        logger.error(f"Error generating response: {e}")
         raise
 
 
+def openai_chat_complete_stream(
+    messages,
+    model=settings.openai_model,
+    temperature=settings.temperature,
+    max_tokens=settings.max_tokens,
+    stage="chat",
+):
+    # yields content deltas as the model produces them
+    try:
+        client = get_openai_client()
+        start = time.perf_counter()
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            # the last chunk then carries the usage, with no choices
+            stream_options={"include_usage": True},
+            **get_completion_kwargs(stage),
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                record_usage(stage, chunk.usage, time.perf_counter() - start)
+    except Exception as e:
+        logger.error(f"Error streaming response: {e}")
+        raise
+
+
+def build_rewrite_messages(history, message):
+    openai_messages = assemble_templated_messages(
+        "rewrite",
+        "You are an expert in rephrasing user questions.",
+        settings.rewrite_prompt,
+        history=history,
+        budget=settings.history_query_token_budget,
+        message=message,
+    )
+    logger.info(f"Rephrase input messages: {openai_messages}")
+    return openai_messages
+
+
+def build_route_messages(history, message):
+    openai_messages = assemble_templated_messages(
+        "route",
+        "You are an expert in classifying user intents.",
+        settings.intent_detection_prompt,
+        history=history,
+        budget=settings.history_query_token_budget,
+        message=message,
+    )
+    logger.info(f"Route input messages: {openai_messages}")
+    return openai_messages
+
+
+def build_route_rewrite_messages(history, message):
+    return assemble_templated_messages(
+        "route_rewrite",
+        "You are an expert in classifying user intents and rephrasing user questions.",
+        settings.route_rewrite_prompt,
+        history=history,
+        budget=settings.history_query_token_budget,
+        message=message,
+    )
+
+
+# the sync and async variants share stage names, and therefore memo entries
+memoize_rewrite = memoize(
+    "rewrite",
+    ttl=settings.memo_ttl_rewrite,
+    version=prompt_version(settings.openai_model, settings.rewrite_prompt),
+)
+memoize_route = memoize(
+    "route",
+    ttl=settings.memo_ttl_route,
+    version=prompt_version(settings.openai_model, settings.intent_detection_prompt),
+)
+memoize_route_rewrite = memoize(
+    "route_rewrite",
+    ttl=settings.memo_ttl_route,
+    version=prompt_version(settings.openai_model, settings.route_rewrite_prompt),
+    encode=lambda result: result.model_dump(),
+    decode=RouteRewriteResult.model_validate,
+)
+ROUTE_REWRITE_COMPLETION_KWARGS = {
+    "stage": "route_rewrite",
+    "temperature": 0,
+    "max_tokens": 512,
+    "response_format": {"type": "json_object"},
+}
+
+
 # rewrite user question based on history and user msg
+@memoize_rewrite
 def enhance_query_quality(history, message):
     try:
-        history_messages = generate_conversation_text(history)
-        enhanced_prompt = settings.rewrite_prompt.format(
-            history_messages=history_messages, message=message
+        return openai_chat_complete(
+            build_rewrite_messages(history, message), stage="rewrite"
         )
-        logger.info(f"Rewrote user's prompt: {enhanced_prompt}")
+    except Exception as e:
+        logger.error(f"Error rewriting user question: {e}")
+        raise
 
-        openai_messages = [
-            {
-                "role": "system",
-                "content": "You are an expert in rephrasing user questions.",
-            },
-            {"role": "user", "content": enhanced_prompt},
-        ]
-        logger.info(f"Rephrase input messages: {openai_messages}")
 
-        return openai_chat_complete(openai_messages)
+@memoize_rewrite
+async def async_enhance_query_quality(history, message):
+    try:
+        return await async_openai_chat_complete(
+            build_rewrite_messages(history, message), stage="rewrite"
+        )
     except Exception as e:
         logger.error(f"Error rewriting user question: {e}")
         raise
 
 
+@memoize_route
 def detect_route(history, message):
     try:
-        logger.info(f"Detect route on history messages: {history}")
-
-        user_prompt = settings.intent_detection_prompt.format(
-            history=history,
-            message=message,
+        return openai_chat_complete(
+            build_route_messages(history, message), stage="route"
         )
+    except Exception as e:
+        logger.error(f"Error detecting route: {e}")
+        raise
 
-        openai_messages = [
-            {
-                "role": "system",
-                "content": "You are an expert in classifying user intents.",
-            },
-            {"role": "user", "content": user_prompt},
-        ]
-        logger.info(f"Route output: {openai_messages}")
-        return openai_chat_complete(openai_messages)
+
+@memoize_route
+async def async_detect_route(history, message):
+    try:
+        return await async_openai_chat_complete(
+            build_route_messages(history, message), stage="route"
+        )
     except Exception as e:
         logger.error(f"Error detecting route: {e}")
         raise
 
 
+@memoize_route_rewrite
+def detect_route_and_rewrite(history, message):
+    try:
+        response = openai_chat_complete(
+            build_route_rewrite_messages(history, message),
+            **ROUTE_REWRITE_COMPLETION_KWARGS,
+        )
+        logger.info(f"Route and rewrite output: {response}")
+        # raises pydantic.ValidationError (a ValueError) on malformed output
+        return RouteRewriteResult.model_validate_json(response)
+    except Exception as e:
+        logger.error(f"Error detecting route and rewriting question: {e}")
+        raise
+
+
+@memoize_route_rewrite
+async def async_detect_route_and_rewrite(history, message):
+    try:
+        response = await async_openai_chat_complete(
+            build_route_rewrite_messages(history, message),
+            **ROUTE_REWRITE_COMPLETION_KWARGS,
+        )
+        logger.info(f"Route and rewrite output: {response}")
+        return RouteRewriteResult.model_validate_json(response)
+    except Exception as e:
+        logger.error(f"Error detecting route and rewriting question: {e}")
+        raise
+
+
+def build_web_search_answer_messages(messages, observation):
+    # Add search results to conversation context
+    return [
+        *messages,
+        {"role": "function", "name": "tavily_search", "content": observation},
+        {
+            "role": "user",
+            "content": "Based on the search results above, please provide a comprehensive answer in Vietnamese. Remember to cite all sources with their URLs in the format 'Theo [Source Title]([URL]), ...' and include a 'Nguồn tham khảo:' section at the end.\n\n",
+        },
+    ]
+
+
 def get_tavily_agent_answer(messages):
     try:
         from .functions.web_search import functions_info, tavily_search
@@ -124,12 +425,15 @@ def get_tavily_agent_answer(messages):
         client = get_openai_client()
 
         # First, call the function to determine search query
+        start = time.perf_counter()
         response = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=messages,
             functions=functions_info,
             function_call={"name": "tavily_search"},
+            **get_completion_kwargs("web_search_query"),
         )
+        record_usage("web_search_query", response.usage, time.perf_counter() - start)
 
         # Extract search arguments
         args = json.loads(response.choices[0].message.function_call.arguments)
@@ -139,18 +443,46 @@ def get_tavily_agent_answer(messages):
         observation = tavily_search(**args)
         logger.info(f"Web search results obtained with {len(observation)} characters")
 
-        # Add search results to conversation context
-        enhanced_messages = [
-            *messages,
-            {"role": "function", "name": "tavily_search", "content": observation},
-            {
-                "role": "user",
-                "content": "Based on the search results above, please provide a comprehensive answer in Vietnamese. Remember to cite all sources with their URLs in the format 'Theo [Source Title]([URL]), ...' and include a 'Nguồn tham khảo:' section at the end.\n\n",
-            },
-        ]
-
         # Generate final response with citations
-        final_response = openai_chat_complete(enhanced_messages)
+        final_response = openai_chat_complete(
+            build_web_search_answer_messages(messages, observation), stage="web_search"
+        )
+        logger.info("Generated response with web search citations")
+
+        return final_response
+    except Exception as e:
+        logger.error(f"Error in tavily agent answer: {e}")
+        raise
+
+
+async def async_get_tavily_agent_answer(messages):
+    try:
+        from .functions.web_search import functions_info, tavily_search
+
+        logger.info("Calling tavily tool search for additional information...")
+        client = get_async_openai_client()
+
+        start = time.perf_counter()
+        response = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            functions=functions_info,
+            function_call={"name": "tavily_search"},
+            **get_completion_kwargs("web_search_query"),
+        )
+        await async_record_usage(
+            "web_search_query", response.usage, time.perf_counter() - start
+        )
+        args = json.loads(response.choices[0].message.function_call.arguments)
+        logger.info(f"Search query args: {args}")
+
+        # the Tavily client is synchronous
+        observation = await asyncio.to_thread(tavily_search, **args)
+        logger.info(f"Web search results obtained with {len(observation)} characters")
+
+        final_response = await async_openai_chat_complete(
+            build_web_search_answer_messages(messages, observation), stage="web_search"
+        )
         logger.info("Generated response with web search citations")
 
         return final_response
@@ -1,26 +1,137 @@
+import json
 import os
+import threading
+import time
+from collections import OrderedDict
 
 import redis
+import redis.asyncio as aioredis
 from loguru import logger
 
+from .clients import get_client
+from .config import get_backend_settings
 from .utils import generate_request_id
 
 REDIS_HOST = os.getenv("REDIS_HOST", "valkey_db")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
 
+INGEST_JOB_PREFIX = "ingest_job"
+PENDING_SUMMARIES_KEY = "summaries:pending"
+HISTORY_SUMMARY_LOCK_PREFIX = "summaries:history"
+# hot history of active conversations, expiring with their conversation id
+CONVERSATION_TTL = 360
+CONVERSATION_PREFIX = "conversation"
+CONVERSATION_WRITES_KEY = "conversation:writes"
+CONVERSATION_FLUSH_LOCK_KEY = "conversation:writes:lock"
+# operations that failed on their own, kept for inspection instead of blocking
+# the queue
+CONVERSATION_DEAD_WRITES_KEY = "conversation:writes:dead"
+
+# appends only while the history is cached, so a message is never pushed onto
+# a partial list; returns the position (seq) of the message, or -1
+APPEND_HISTORY_SCRIPT = """
+if redis.call("EXISTS", KEYS[2]) == 0 then
+    return -1
+end
+local length = redis.call("RPUSH", KEYS[1], ARGV[1])
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+redis.call("EXPIRE", KEYS[2], ARGV[2])
+return length - 1
+"""
+# updates the summary fields only while the history is cached
+SET_HISTORY_SUMMARY_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return 0
+end
+redis.call("HSET", KEYS[1], "summary", ARGV[1], "summary_seq", ARGV[2], "summary_tokens", ARGV[3])
+return 1
+"""
+# deletes a lock only while it still holds the owner's token; a lock that
+# expired and was taken by another process is left alone
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+settings = get_backend_settings()
+
+
+def get_redis_pool_kwargs():
+    return {
+        "max_connections": settings.redis_max_connections,
+        "socket_timeout": settings.redis_socket_timeout,
+        "socket_connect_timeout": settings.redis_socket_connect_timeout,
+        # replaces the PING that used to precede every command
+        "health_check_interval": settings.redis_health_check_interval,
+    }
+
+
+def create_redis_client(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB):
+    return redis.Redis(
+        connection_pool=redis.ConnectionPool(
+            host=host, port=port, db=db, **get_redis_pool_kwargs()
+        )
+    )
+
 
 def get_redis_client(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB):
     try:
-        client = redis.Redis(host=host, port=port, db=db)
-        client.ping()
-        return client
+        return get_client(
+            f"redis:{host}:{port}/{db}", lambda: create_redis_client(host, port, db)
+        )
     except Exception as e:
         logger.error(f"Error connecting to Redis: {e}")
         raise
 
 
-def get_conversation_id(bot_id, user_id, ttl_seconds=360):
+def get_async_redis_client(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB):
+    # connections are opened lazily, on the loop that first uses them
+    return get_client(
+        f"async_redis:{host}:{port}/{db}",
+        lambda: aioredis.Redis(
+            connection_pool=aioredis.ConnectionPool(
+                host=host, port=port, db=db, **get_redis_pool_kwargs()
+            )
+        ),
+    )
+
+
+class LocalLRUCache:
+    """Thread-safe in-process LRU used as a first tier in front of Redis."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def get_conversation_id(bot_id, user_id, ttl_seconds=CONVERSATION_TTL):
     key = f"{bot_id}.{user_id}"
     try:
         client = get_redis_client()
@@ -30,7 +141,10 @@ def get_conversation_id(bot_id, user_id, ttl_seconds=360):
             return client.get(key).decode("utf-8")
         else:
             conversation_id = generate_request_id()
-            client.set(key, conversation_id, ex=ttl_seconds)
+            pipe = client.pipeline(transaction=False)
+            pipe.set(key, conversation_id, ex=ttl_seconds)
+            init_history_meta(pipe, conversation_id, ttl_seconds)
+            pipe.execute()
             logger.info(f"New conversation started: {key} → {conversation_id}")
             return conversation_id
     except Exception as e:
@@ -38,6 +152,29 @@ def get_conversation_id(bot_id, user_id, ttl_seconds=360):
         raise
 
 
+async def async_get_conversation_id(bot_id, user_id, ttl_seconds=CONVERSATION_TTL):
+    key = f"{bot_id}.{user_id}"
+    try:
+        client = get_async_redis_client()
+        # refreshes the TTL of an existing conversation in the same round trip
+        conversation_id = await client.getex(key, ex=ttl_seconds)
+        if conversation_id is not None:
+            return conversation_id.decode("utf-8")
+
+        conversation_id = generate_request_id()
+        # nx: a concurrent request of the same user may have started one already
+        if not await client.set(key, conversation_id, ex=ttl_seconds, nx=True):
+            return (await client.get(key)).decode("utf-8")
+        pipe = client.pipeline(transaction=False)
+        init_history_meta(pipe, conversation_id, ttl_seconds)
+        await pipe.execute()
+        logger.info(f"New conversation started: {key} → {conversation_id}")
+        return conversation_id
+    except Exception as e:
+        logger.error(f"Error managing conversation ID in Redis: {e}")
+        raise
+
+
 def delete_conversation_id(bot_id, user_id):
     key = f"{bot_id}.{user_id}"
     try:
@@ -52,3 +189,285 @@ def delete_conversation_id(bot_id, user_id):
     except Exception as e:
         logger.error(f"Error deleting conversation ID in Redis: {e}")
         raise
+
+
+# Hot conversation history: a list of message entries, whose position is the
+# message's seq, and a meta hash holding the rolling summary. The meta hash
+# exists for as long as the history is cached.
+def get_history_keys(conversation_id):
+    prefix = f"{CONVERSATION_PREFIX}:{conversation_id}"
+    return f"{prefix}:messages", f"{prefix}:meta"
+
+
+def init_history_meta(pipe, conversation_id, ttl_seconds=CONVERSATION_TTL):
+    # a new conversation has nothing in Postgres, so its history starts cached
+    _, meta_key = get_history_keys(conversation_id)
+    pipe.hset(meta_key, "summary_seq", -1)
+    pipe.expire(meta_key, ttl_seconds)
+
+
+def append_history_entry(conversation_id, entry, ttl_seconds=CONVERSATION_TTL):
+    seq = get_redis_client().eval(
+        APPEND_HISTORY_SCRIPT,
+        2,
+        *get_history_keys(conversation_id),
+        json.dumps(entry, ensure_ascii=False),
+        ttl_seconds,
+    )
+    return None if seq < 0 else seq
+
+
+async def async_append_history_entry(
+    conversation_id, entry, ttl_seconds=CONVERSATION_TTL
+):
+    seq = await get_async_redis_client().eval(
+        APPEND_HISTORY_SCRIPT,
+        2,
+        *get_history_keys(conversation_id),
+        json.dumps(entry, ensure_ascii=False),
+        ttl_seconds,
+    )
+    return None if seq < 0 else seq
+
+
+def decode_history_meta(meta):
+    meta = {field.decode(): value.decode() for field, value in meta.items()}
+    return {
+        "summary": meta.get("summary"),
+        "summary_seq": int(meta["summary_seq"]),
+        "summary_tokens": int(meta.get("summary_tokens", 0)),
+    }
+
+
+def get_history_entries(conversation_id):
+    """Return (meta, entries not folded into the summary), or None on a miss."""
+    messages_key, meta_key = get_history_keys(conversation_id)
+    client = get_redis_client()
+    meta = client.hgetall(meta_key)
+    if not meta:
+        return None
+    meta = decode_history_meta(meta)
+    start = meta["summary_seq"] + 1
+    entries = [
+        {**json.loads(entry), "seq": seq}
+        for seq, entry in enumerate(client.lrange(messages_key, start, -1), start)
+    ]
+    return meta, entries
+
+
+def get_history_entry(conversation_id, seq):
+    messages_key, _ = get_history_keys(conversation_id)
+    entry = get_redis_client().lindex(messages_key, seq)
+    return None if entry is None else {**json.loads(entry), "seq": seq}
+
+
+def set_history_entry(conversation_id, seq, entry):
+    messages_key, _ = get_history_keys(conversation_id)
+    entry = {key: value for key, value in entry.items() if key != "seq"}
+    try:
+        get_redis_client().lset(
+            messages_key, seq, json.dumps(entry, ensure_ascii=False)
+        )
+    except redis.ResponseError:
+        # the history has expired; Postgres gets the change through the queue
+        logger.info(f"History of {conversation_id} is not cached, skipped update")
+
+
+def set_history_summary(conversation_id, summary, summary_seq, summary_tokens):
+    _, meta_key = get_history_keys(conversation_id)
+    get_redis_client().eval(
+        SET_HISTORY_SUMMARY_SCRIPT, 1, meta_key, summary, summary_seq, summary_tokens
+    )
+
+
+def rebuild_history(conversation_id, entries, meta, ttl_seconds=CONVERSATION_TTL):
+    """Cache a history loaded from Postgres, unless another process already did."""
+    messages_key, meta_key = get_history_keys(conversation_id)
+    with get_redis_client().pipeline() as pipe:
+        try:
+            pipe.watch(meta_key)
+            if pipe.exists(meta_key):
+                return False
+            pipe.multi()
+            pipe.delete(messages_key)
+            if entries:
+                pipe.rpush(
+                    messages_key,
+                    *(json.dumps(entry, ensure_ascii=False) for entry in entries),
+                )
+                pipe.expire(messages_key, ttl_seconds)
+            pipe.hset(
+                meta_key,
+                mapping={key: value for key, value in meta.items() if value is not None},
+            )
+            pipe.expire(meta_key, ttl_seconds)
+            pipe.execute()
+            return True
+        except redis.WatchError:
+            return False
+
+
+# Write-behind queue of conversation inserts and updates, applied to Postgres
+# in order and in batches
+def enqueue_conversation_write(operation):
+    # returns the queue length so the caller knows when a batch is full
+    return get_redis_client().rpush(
+        CONVERSATION_WRITES_KEY, json.dumps(operation, ensure_ascii=False)
+    )
+
+
+async def async_enqueue_conversation_write(operation):
+    return await get_async_redis_client().rpush(
+        CONVERSATION_WRITES_KEY, json.dumps(operation, ensure_ascii=False)
+    )
+
+
+def peek_conversation_writes(count=None):
+    # the whole queue when count is None
+    stop = -1 if count is None else count - 1
+    operations = get_redis_client().lrange(CONVERSATION_WRITES_KEY, 0, stop)
+    return [json.loads(operation) for operation in operations]
+
+
+def trim_conversation_writes(count):
+    # only called once the operations are committed to Postgres
+    get_redis_client().ltrim(CONVERSATION_WRITES_KEY, count, -1)
+
+
+def dead_letter_conversation_write():
+    # moves the head of the queue, the operation the flusher failed to apply
+    get_redis_client().lmove(
+        CONVERSATION_WRITES_KEY, CONVERSATION_DEAD_WRITES_KEY, "LEFT", "RIGHT"
+    )
+
+
+def get_conversation_write_count():
+    return get_redis_client().llen(CONVERSATION_WRITES_KEY)
+
+
+def acquire_conversation_flush_lock(ttl_seconds=60):
+    # a single flusher keeps the operations in queue order; returns the token
+    # that releases the lock, or None when another flusher holds it
+    token = generate_request_id()
+    acquired = get_redis_client().set(
+        CONVERSATION_FLUSH_LOCK_KEY, token, nx=True, ex=ttl_seconds
+    )
+    return token if acquired else None
+
+
+def release_conversation_flush_lock(token):
+    get_redis_client().eval(RELEASE_LOCK_SCRIPT, 1, CONVERSATION_FLUSH_LOCK_KEY, token)
+
+
+def enqueue_pending_summary(message_key):
+    # returns the queue length so the caller knows when a batch is full
+    return get_redis_client().rpush(PENDING_SUMMARIES_KEY, message_key)
+
+
+def pop_pending_summaries(count):
+    message_keys = get_redis_client().lpop(PENDING_SUMMARIES_KEY, count) or []
+    return [message_key.decode() for message_key in message_keys]
+
+
+def requeue_pending_summaries(message_keys):
+    # back at the head of the queue, in their original order, for the next batch
+    if message_keys:
+        get_redis_client().lpush(PENDING_SUMMARIES_KEY, *reversed(message_keys))
+
+
+def get_pending_summary_count():
+    return get_redis_client().llen(PENDING_SUMMARIES_KEY)
+
+
+def acquire_history_summary_lock(conversation_id, ttl_seconds=120):
+    # one rolling summary update per conversation at a time
+    key = f"{HISTORY_SUMMARY_LOCK_PREFIX}:{conversation_id}"
+    return bool(get_redis_client().set(key, 1, nx=True, ex=ttl_seconds))
+
+
+def release_history_summary_lock(conversation_id):
+    get_redis_client().delete(f"{HISTORY_SUMMARY_LOCK_PREFIX}:{conversation_id}")
+
+
+def get_queue_depth(queue_name):
+    try:
+        client = get_redis_client()
+        return client.llen(queue_name)
+    except Exception as e:
+        logger.error(f"Error reading queue depth for {queue_name}: {e}")
+        raise
+
+
+# Bulk ingestion job tracking
+def create_ingest_job(ttl_seconds=60 * 60 * 24 * 7):
+    job_id = generate_request_id()
+    key = f"{INGEST_JOB_PREFIX}:{job_id}"
+    try:
+        client = get_redis_client()
+        client.hset(
+            key,
+            mapping={
+                "status": "receiving",
+                "started_at": time.time(),
+                "received": 0,
+                "inserted": 0,
+                "enqueued": 0,
+                "indexed": 0,
+                "failed": 0,
+                "invalid": 0,
+            },
+        )
+        client.expire(key, ttl_seconds)
+        logger.info(f"Created ingest job {job_id}")
+        return job_id
+    except Exception as e:
+        logger.error(f"Error creating ingest job: {e}")
+        raise
+
+
+def update_ingest_job(job_id, status=None, **increments):
+    key = f"{INGEST_JOB_PREFIX}:{job_id}"
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        for field, amount in increments.items():
+            if amount:
+                pipe.hincrby(key, field, amount)
+        if status is not None:
+            pipe.hset(key, "status", status)
+        pipe.hset(key, "updated_at", time.time())
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error updating ingest job {job_id}: {e}")
+        raise
+
+
+def get_ingest_job(job_id):
+    key = f"{INGEST_JOB_PREFIX}:{job_id}"
+    try:
+        raw_job = get_redis_client().hgetall(key)
+        if not raw_job:
+            return None
+
+        job = {k.decode("utf-8"): v.decode("utf-8") for k, v in raw_job.items()}
+        counters = ["received", "invalid", "inserted", "enqueued", "indexed", "failed"]
+        for field in counters:
+            job[field] = int(job.get(field, 0))
+        started_at = float(job.pop("started_at"))
+        updated_at = float(job.pop("updated_at", started_at))
+
+        processed = job["indexed"] + job["failed"]
+        if job["status"] == "indexing" and processed >= job["inserted"]:
+            job["status"] = "completed"
+        finished_at = updated_at if job["status"] == "completed" else time.time()
+        elapsed = max(finished_at - started_at, 1e-6)
+
+        job["job_id"] = job_id
+        job["elapsed_seconds"] = round(elapsed, 3)
+        job["throughput"] = {
+            "inserted_per_second": round(job["inserted"] / elapsed, 2),
+            "indexed_per_second": round(job["indexed"] / elapsed, 2),
+        }
+        return job
+    except Exception as e:
+        logger.error(f"Error reading ingest job {job_id}: {e}")
+        raise
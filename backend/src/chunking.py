@@ -1,4 +1,6 @@
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 from llama_index.core.node_parser import (SentenceSplitter,
                                           SentenceWindowNodeParser)
@@ -10,6 +12,21 @@ from .config import get_backend_settings
 
 settings = get_backend_settings()
 
+# Lower-cased tokens that end with a period without ending the sentence
+VIETNAMESE_ABBREVIATIONS = {
+    "bs", "bsck", "bscki", "bsckii", "bv", "ck", "cn", "dr", "gs", "ks", "mr",
+    "mrs", "ms", "nxb", "pgs", "q", "p", "st", "th", "ths", "tp", "tphcm", "ts",
+    "tt", "ttg", "ttnd", "ttut", "v.v", "vd", "vs", "etc",
+}  # fmt: skip
+
+SENTENCE_END_PATTERN = re.compile(r"[.!?…]+[\"'”’)\]]*(?=\s+)")
+NEXT_CHAR_PATTERN = re.compile(r"\s*(\S)")
+LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[-*•+–]|\d{1,3}[.)]|[a-zđ][.)])\s+")
+HEADING_PATTERN = re.compile(
+    r"^\s*(?:#{1,6}\s+|(?:chương|phần|mục|bài)\s+[\divxlc]+\b|[IVXLC]+\.\s+)",
+    re.IGNORECASE,
+)
+
 
 def chunk_by_window_sentences(
     text,
@@ -47,54 +64,335 @@ def chunk_by_window_sentences(
         raise
 
 
+def llm_split_text(text):
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are a text segmentation assistant. "
+                "Your task is to split the provided text into overlapping chunks. "
+                "Each chunk must be no longer than 512 characters, and adjacent chunks must overlap by 50 characters. "
+                "Preserve sentence boundaries when possible, but prioritize respecting the length and overlap rules. "
+                "Return only a valid JSON array of strings — no explanations, no markdown, no code fences. "
+                "Each array element should be a single chunk of text."
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                "Input text:\n"
+                f"{text}\n\n"
+                "Expected output format:\n"
+                '["chunk1", "chunk2", "chunk3", ...]'
+            ),
+        },
+    ]
+
+    llm_response = openai_chat_complete(
+        messages, temperature=0.1, max_tokens=2048, stage="chunking"
+    )
+    logger.info(f"LLM response for chunking: {llm_response}")
+
+    try:
+        chunks = json.loads(llm_response)
+        if not isinstance(chunks, list):
+            raise ValueError("LLM response is not a valid JSON list.")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Failed to decode LLM response as JSON: {e}")
+    return chunks
+
+
 def chunk_by_llm(text, metadata=None):
     logger.info("Chunking document using LLM...")
     try:
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a text segmentation assistant. "
-                    "Your task is to split the provided text into overlapping chunks. "
-                    "Each chunk must be no longer than 512 characters, and adjacent chunks must overlap by 50 characters. "
-                    "Preserve sentence boundaries when possible, but prioritize respecting the length and overlap rules. "
-                    "Return only a valid JSON array of strings — no explanations, no markdown, no code fences. "
-                    "Each array element should be a single chunk of text."
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Input text:\n"
-                    f"{text}\n\n"
-                    "Expected output format:\n"
-                    '["chunk1", "chunk2", "chunk3", ...]'
-                ),
-            },
+        chunks = llm_split_text(text)
+        nodes = [
+            TextNode(text=node, metadata=metadata) if metadata else TextNode(text=node)
+            for node in chunks
         ]
+        logger.info(f"Document chunked into {len(nodes)} chunks by LLM.")
+        return nodes
+    except Exception as e:
+        logger.error(f"Error chunking document with LLM: {e}")
+        raise
+
+
+def get_last_word(text, start, stop):
+    # scan back from stop instead of splitting text[start:stop], which would
+    # copy the whole pending sentence at every punctuation mark
+    end = stop
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    begin = end
+    while begin > start and not text[begin - 1].isspace():
+        begin -= 1
+    return text[begin:end]
+
+
+def split_vietnamese_sentences(text):
+    sentences, start = [], 0
+    for match in SENTENCE_END_PATTERN.finditer(text):
+        end = match.end()
+        last_word = get_last_word(text, start, match.start()).lower()
+        next_char = NEXT_CHAR_PATTERN.match(text, end)
+
+        # "TS. Nguyễn", "v.v. và", "A. Fleming" and lowercase continuations are
+        # not sentence boundaries
+        if match.group().startswith("."):
+            if last_word.strip("(\"'") in VIETNAMESE_ABBREVIATIONS:
+                continue
+            if len(last_word) == 1 and last_word.isalpha():
+                continue
+        if next_char and next_char.group(1).islower():
+            continue
+
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = end
+
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+def is_heading_line(line):
+    stripped = line.strip()
+    if HEADING_PATTERN.match(stripped):
+        return True
+    letters = [c for c in stripped if c.isalpha()]
+    # short all-caps lines such as "TRIỆU CHỨNG" or "NGUYÊN NHÂN GÂY BỆNH"
+    return bool(letters) and len(stripped) <= 100 and stripped.isupper()
+
+
+def split_structural_units(text):
+    # yield (separator, unit_text, is_heading); separator is how the unit joins
+    # the previous one inside a chunk
+    for block in re.split(r"\n\s*\n", text):
+        block_separator = "\n\n"
+        for line in block.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if is_heading_line(line):
+                yield block_separator, line, True
+            elif LIST_ITEM_PATTERN.match(line):
+                yield "\n", line, False
+            else:
+                for i, sentence in enumerate(split_vietnamese_sentences(line)):
+                    yield (" " if i else "\n"), sentence, False
+            block_separator = "\n"
+
+
+def split_long_unit(unit, chunk_size):
+    pieces, current = [], ""
+    for word in unit.split():
+        while len(word) > chunk_size:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:chunk_size])
+            word = word[chunk_size:]
+        candidate = f"{current} {word}" if current else word
+        if len(candidate) > chunk_size:
+            pieces.append(current)
+            candidate = word
+        current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def iter_sentence_pieces(text, chunk_size):
+    # (separator, piece, is_heading) of every unit, long units split to fit
+    for separator, unit, is_heading in split_structural_units(text):
+        if len(unit) <= chunk_size:
+            yield separator, unit, is_heading
+        else:
+            for piece in split_long_unit(unit, chunk_size):
+                yield separator, piece, is_heading
+
+
+class SentenceChunkBuilder:
+    """Packs pieces into chunks of at most chunk_size characters.
+
+    Consecutive chunks share up to chunk_overlap characters of trailing
+    pieces, except across section headings.
+    """
+
+    def __init__(self, chunk_size, chunk_overlap):
+        self.chunk_size, self.chunk_overlap = chunk_size, chunk_overlap
+        self.chunks = []
+        self.current, self.current_len = [], 0  # (separator, piece) pairs of the open chunk
+        self.has_new = False  # open chunk holds pieces beyond the carried overlap
+        self.has_body = False  # ... and at least one of them is not a heading
+
+    def get_overlap(self):
+        # trailing pieces up to chunk_overlap characters
+        carried, carried_len = [], 0
+        for sep, piece in reversed(self.current):
+            if carried_len + len(sep) + len(piece) > self.chunk_overlap:
+                break
+            carried.insert(0, (sep, piece))
+            carried_len += len(sep) + len(piece)
+        return carried
+
+    def flush(self, keep_overlap):
+        if self.has_new:
+            self.chunks.append("".join(sep + piece for sep, piece in self.current).strip())
+        self.current = self.get_overlap() if keep_overlap else []
+        self.current_len = sum(len(sep) + len(piece) for sep, piece in self.current)
+        self.has_new = self.has_body = False
 
-        llm_response = openai_chat_complete(messages, temperature=0.1, max_tokens=2048)
-        logger.info(f"LLM response for chunking: {llm_response}")
+    def add(self, separator, piece, is_heading):
+        # a new section starts a new chunk, without overlap from the last one
+        if is_heading and self.has_body:
+            self.flush(keep_overlap=False)
+        elif is_heading and not self.has_new:
+            self.current, self.current_len = [], 0
 
-        try:
-            chunks = json.loads(llm_response)
-            if not isinstance(chunks, list):
-                raise ValueError("LLM response is not a valid JSON list.")
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Failed to decode LLM response as JSON: {e}")
+        if self.current_len + len(separator) + len(piece) > self.chunk_size:
+            self.flush(keep_overlap=True)
+            # drop the carried overlap if it cannot fit next to this piece
+            if self.current_len + len(separator) + len(piece) > self.chunk_size:
+                self.current, self.current_len = [], 0
+        self.current.append((separator, piece))
+        self.current_len += len(separator) + len(piece)
+        self.has_new = True
+        self.has_body = self.has_body or not is_heading
+
+
+def chunk_by_vietnamese_sentences(
+    text,
+    metadata=None,
+    chunk_size=settings.chunk_size,
+    chunk_overlap=settings.chunk_overlap,
+):
+    logger.info("Chunking document by Vietnamese sentences...")
+    try:
+        builder = SentenceChunkBuilder(chunk_size, chunk_overlap)
+        for separator, piece, is_heading in iter_sentence_pieces(text, chunk_size):
+            builder.add(separator, piece, is_heading)
+        builder.flush(keep_overlap=False)
+
+        nodes = [
+            TextNode(text=chunk, metadata=metadata) if metadata else TextNode(text=chunk)
+            for chunk in builder.chunks
+        ]
+        logger.info(f"Document chunked into {len(nodes)} chunks.")
+        return nodes
+    except Exception as e:
+        logger.error(f"Error chunking document by Vietnamese sentences: {e}")
+        raise
+
+
+def split_into_windows(
+    text,
+    window_size=settings.llm_chunking_window_size,
+    window_overlap=settings.llm_chunking_window_overlap,
+):
+    # returns (window_text, overlap_length) pairs; each window after the first
+    # starts with the trailing paragraphs of the previous one
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= window_size:
+            paragraphs.append(paragraph)
+        else:
+            # oversized paragraphs fall back to sentence boundaries
+            paragraphs.extend(split_vietnamese_sentences(paragraph))
+    paragraphs = [paragraph for paragraph in paragraphs if paragraph]
+
+    windows, current, current_len, overlap_len = [], [], 0, 0
+    for paragraph in paragraphs:
+        if current and current_len + len(paragraph) > window_size:
+            windows.append(("\n\n".join(current), overlap_len))
+            carried = []
+            for previous in reversed(current):
+                carried_len = sum(len(p) + 2 for p in carried)
+                if carried_len + len(previous) > window_overlap:
+                    break
+                carried.insert(0, previous)
+            current = carried
+            current_len = sum(len(p) + 2 for p in carried)
+            # the carried overlap plus the next paragraph must still fit
+            while current and current_len + len(paragraph) > window_size:
+                current_len -= len(current.pop(0)) + 2
+            overlap_len = len("\n\n".join(current))
+        current.append(paragraph)
+        current_len += len(paragraph) + 2
+    if current:
+        windows.append(("\n\n".join(current), overlap_len))
+    return windows
+
+
+def drop_chunk_prefix(chunk, length):
+    # drop the first `length` characters of the whitespace-collapsed chunk,
+    # keeping the original whitespace of the rest
+    consumed = 0
+    for match in re.finditer(r"\S+", chunk):
+        word_len = len(match.group())
+        if consumed + word_len >= length:
+            return chunk[match.start() + length - consumed :].strip()
+        consumed += word_len + 1
+    return ""
+
+
+def stitch_window_chunks(windows, window_chunks):
+    stitched, seen = [], set()
+    for (window_text, overlap_len), chunks in zip(windows, window_chunks):
+        window_key = " ".join(window_text.split())
+        overlap_key = " ".join(window_text[:overlap_len].split())
+        for chunk in chunks:
+            key = " ".join(chunk.split())
+            if overlap_key:
+                # the previous window already produced the overlap, so chunks
+                # starting inside it lose that part, including the ones
+                # straddling the seam
+                start = window_key.find(key)
+                if 0 <= start < len(overlap_key):
+                    chunk = drop_chunk_prefix(chunk, len(overlap_key) - start)
+                    key = " ".join(chunk.split())
+                elif start == -1 and key in overlap_key:
+                    continue
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            stitched.append(chunk)
+    return stitched
+
+
+def chunk_by_llm_windowed(
+    text,
+    metadata=None,
+    window_size=settings.llm_chunking_window_size,
+    window_overlap=settings.llm_chunking_window_overlap,
+    max_concurrency=settings.llm_chunking_max_concurrency,
+):
+    logger.info("Chunking document using LLM over parallel windows...")
+    try:
+        windows = split_into_windows(text, window_size, window_overlap)
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            window_chunks = list(
+                executor.map(llm_split_text, [window for window, _ in windows])
+            )
+        chunks = stitch_window_chunks(windows, window_chunks)
 
         nodes = [
             TextNode(text=node, metadata=metadata) if metadata else TextNode(text=node)
             for node in chunks
         ]
-        logger.info(f"Document chunked into {len(nodes)} chunks by LLM.")
+        logger.info(
+            f"Document chunked into {len(nodes)} chunks by LLM over {len(windows)} windows."
+        )
         return nodes
     except Exception as e:
-        logger.error(f"Error chunking document with LLM: {e}")
+        logger.error(f"Error chunking document with windowed LLM: {e}")
         raise
 
 
-def dynamic_chunking(text, metadata=None):
+def dynamic_chunking(text, metadata=None, strategy=settings.chunking_strategy):
     if len(text) < settings.chunk_size:
         logger.info("Document is smaller than chunk size, creating single chunk.")
         return (
@@ -104,5 +402,11 @@ def dynamic_chunking(text, metadata=None):
         )
     elif len(text) < settings.chunk_size * 3:
         return chunk_by_window_sentences(text, metadata)
-    else:
+    elif strategy == "vietnamese":
+        return chunk_by_vietnamese_sentences(text, metadata)
+    elif strategy == "llm":
         return chunk_by_llm(text, metadata)
+    elif strategy == "llm_windowed":
+        return chunk_by_llm_windowed(text, metadata)
+    else:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
@@ -0,0 +1,50 @@
+import os
+import threading
+
+from loguru import logger
+
+
+class ClientRegistry:
+    """Process-wide cache of long-lived, pooled service clients.
+
+    Clients are created on first use and reused afterwards. Sockets must not be
+    shared between processes, so a forked child (Celery prefork, uvicorn
+    workers) drops the parent's clients and builds its own.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get(self, name, factory):
+        if self._pid != os.getpid():
+            self.reset()
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = factory()
+                    self._clients[name] = client
+                    logger.info(f"Created shared {name} client (pid {self._pid})")
+        return client
+
+    def reset(self):
+        # the parent's lock may have been held at fork time, so replace it too
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+    def __contains__(self, name):
+        return name in self._clients
+
+
+registry = ClientRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry.reset)
+
+
+def get_client(name, factory):
+    return registry.get(name, factory)
@@ -1,12 +1,15 @@
 import os
 from functools import lru_cache
+from pathlib import Path
+from typing import Literal, Optional
 
 from dotenv import load_dotenv
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
 from .template import (INTENT_DETECTION_PROMPT, RAG_PROMPT,
-                       REWRITE_USER_PROMPT, SYSTEM_PROMPT)
+                       REWRITE_USER_PROMPT, ROLLING_SUMMARY_PROMPT,
+                       ROUTE_AND_REWRITE_PROMPT, SYSTEM_PROMPT)
 
 load_dotenv()
 
@@ -46,18 +49,134 @@ class BackendSettings(BaseSettings):
     rag_prompt: str = Field(default=RAG_PROMPT)
     rewrite_prompt: str = Field(default=REWRITE_USER_PROMPT)
     intent_detection_prompt: str = Field(default=INTENT_DETECTION_PROMPT)
+    route_rewrite_prompt: str = Field(default=ROUTE_AND_REWRITE_PROMPT)
+    rolling_summary_prompt: str = Field(default=ROLLING_SUMMARY_PROMPT)
+
+    # "combined": one structured call returns route + rewritten question, with
+    # fallback to "llm": separate route and rewrite calls run concurrently;
+    # "embedding": local exemplar router, LLM only when the margin is low
+    route_strategy: str = Field(default="combined")
+    route_exemplars_path: str = Field(
+        default=str(Path(__file__).parent / "route_exemplars.json")
+    )
+    route_top_k: int = Field(default=3)
+    route_min_margin: float = Field(default=0.05)
+
+    # threads per worker process for chat pipeline stages that run concurrently
+    stage_max_workers: int = Field(default=8)
+
+    # Provider-side prompt caching: prefixes of at least prompt_cache_min_tokens
+    # tokens are cached; requests sharing the key (per stage) hit the same cache
+    openai_prompt_cache_key: str = Field(default="meddy")
+    prompt_cache_min_tokens: int = Field(default=1024)
 
     temperature: float = Field(default=0.7)
     max_tokens: int = Field(default=2048)
 
+    # Shared client pools and timeouts (seconds), one pool per process
+    openai_timeout: float = Field(default=60.0)
+    openai_max_retries: int = Field(default=2)
+    openai_max_connections: int = Field(default=100)
+    openai_max_keepalive_connections: int = Field(default=20)
+    qdrant_timeout: int = Field(default=10)
+    qdrant_max_connections: int = Field(default=100)
+    qdrant_max_keepalive_connections: int = Field(default=20)
+    redis_max_connections: int = Field(default=50)
+    redis_socket_timeout: float = Field(default=5.0)
+    redis_socket_connect_timeout: float = Field(default=2.0)
+    redis_health_check_interval: int = Field(default=30)
+    cohere_timeout: float = Field(default=30.0)
+
     # Qdrant vector database configuration
     default_collection_name: str = Field(default="documents")
+    # text-embedding-3 models return shortened vectors natively (e.g. 512 or 768);
+    # changing it requires re-embedding into a new collection, see
+    # scripts/migrate_embeddings.py
     vector_dimension: int = Field(default=1536)
     top_k: int = Field(default=5)
+    # payload field holding the tenant/bot a document belongs to
+    qdrant_tenant_field: str = Field(default="bot_id")
+    # quantization: "" (none), "scalar", "product" or "binary"
+    qdrant_quantization: Literal["", "scalar", "product", "binary"] = Field(default="")
+    qdrant_quantization_always_ram: bool = Field(default=True)
+    qdrant_product_compression: str = Field(default="x16")
+    qdrant_on_disk_vectors: bool = Field(default=False)
+    qdrant_hnsw_m: int = Field(default=16)
+    qdrant_hnsw_ef_construct: int = Field(default=100)
+    qdrant_search_hnsw_ef: Optional[int] = Field(default=None)
+    qdrant_search_rescore: bool = Field(default=True)
+    qdrant_search_oversampling: float = Field(default=2.0)
+    qdrant_upsert_batch_size: int = Field(default=64)
+    qdrant_upsert_parallel: int = Field(default=2)
+    qdrant_upsert_wait: bool = Field(default=False)
+    qdrant_upsert_max_retries: int = Field(default=3)
+
+    # Assistant turns are stored right away and replaced by their summary in
+    # the background; batch_size > 1 summarizes several answers per LLM call
+    summary_batch_size: int = Field(default=1)
+    summary_batch_delay: float = Field(default=2.0)
+
+    # Conversation history: token budget of the answer prompt and of the
+    # route/rewrite prompts; turns that no longer fit are folded into a rolling
+    # summary once at least summary_min_tokens of them are waiting
+    history_token_budget: int = Field(default=2000)
+    history_query_token_budget: int = Field(default=600)
+    history_summary_min_tokens: int = Field(default=500)
+    history_summary_max_tokens: int = Field(default=400)
+    history_summary_lock_ttl: int = Field(default=120)
+
+    # Write-behind of conversation messages from the Redis hot history to
+    # Postgres: flushed once batch_size operations are queued, or after delay
+    conversation_flush_batch_size: int = Field(default=100)
+    conversation_flush_delay: float = Field(default=1.0)
+    conversation_flush_lock_ttl: int = Field(default=60)
+    # Rows read per keyset page when a history is rebuilt from Postgres
+    history_page_size: int = Field(default=500)
+
+    # Semantic answer cache: answers are reused for rewritten questions whose
+    # embedding similarity to a cached one is at least the threshold
+    answer_cache_enabled: bool = Field(default=True)
+    answer_cache_collection: str = Field(default="answer_cache")
+    answer_cache_threshold: float = Field(default=0.95)
+    answer_cache_ttl: int = Field(default=60 * 60 * 24)
+    answer_cache_max_size: int = Field(default=10000)
+
+    # Stage memoization (rewrite, routing, web search), TTLs in seconds
+    memo_enabled: bool = Field(default=True)
+    memo_local_size: int = Field(default=2048)
+    memo_ttl_rewrite: int = Field(default=60 * 60)
+    memo_ttl_route: int = Field(default=60 * 60)
+    memo_ttl_web_search: int = Field(default=15 * 60)
+
+    # Embedding batching settings
+    embedding_batch_size: int = Field(default=128)
+    embedding_batch_max_tokens: int = Field(default=100000)
+    embedding_max_retries: int = Field(default=3)
+
+    # Embedding cache settings
+    embedding_cache_enabled: bool = Field(default=True)
+    embedding_cache_ttl: int = Field(default=60 * 60 * 24 * 30)
+    embedding_cache_local_size: int = Field(default=10000)
+    embedding_cache_dtype: str = Field(default="float32")
+
+    # Bulk ingestion settings
+    celery_queue_name: str = Field(default="celery")
+    bulk_ingest_db_batch_size: int = Field(default=500)
+    bulk_ingest_index_batch_size: int = Field(default=16)
+    bulk_ingest_max_queue_depth: int = Field(default=200)
+    bulk_ingest_backpressure_interval: float = Field(default=1.0)
+    bulk_ingest_backpressure_timeout: float = Field(default=300.0)
+    bulk_ingest_job_ttl: int = Field(default=60 * 60 * 24 * 7)
 
     # CHUNKING settings
     chunk_size: int = Field(default=512)
     chunk_overlap: int = Field(default=50)
+    # strategy for documents longer than 3x chunk_size:
+    # "vietnamese", "llm" or "llm_windowed"
+    chunking_strategy: str = Field(default="vietnamese")
+    llm_chunking_window_size: int = Field(default=3000)
+    llm_chunking_window_overlap: int = Field(default=300)
+    llm_chunking_max_concurrency: int = Field(default=4)
 
 
 class DatabaseSettings(BaseSettings):
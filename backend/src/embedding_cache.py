@@ -0,0 +1,205 @@
+import hashlib
+import struct
+import threading
+
+from loguru import logger
+
+from .brain import async_openai_generate_embedding, openai_generate_embeddings
+from .cache import LocalLRUCache, get_async_redis_client, get_redis_client
+from .config import get_backend_settings
+from .utils import normalize_text
+
+settings = get_backend_settings()
+
+EMBEDDING_CACHE_PREFIX = "emb"
+EMBEDDING_CACHE_STATS_KEY = "emb:stats"
+EMBEDDING_DTYPE_FORMATS = {"float32": "f", "float16": "e"}
+
+_local_cache = LocalLRUCache(settings.embedding_cache_local_size)
+_stats_lock = threading.Lock()
+_local_stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+
+def get_embedding_cache_key(
+    text,
+    model=settings.openai_embedding_model,
+    dtype=settings.embedding_cache_dtype,
+    dimensions=settings.vector_dimension,
+):
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{EMBEDDING_CACHE_PREFIX}:{model}:{dimensions}:{dtype}:{digest}"
+
+
+def encode_embedding(embedding, dtype=settings.embedding_cache_dtype):
+    fmt = EMBEDDING_DTYPE_FORMATS[dtype]
+    return struct.pack(f"<{len(embedding)}{fmt}", *embedding)
+
+
+def decode_embedding(data, dtype=settings.embedding_cache_dtype):
+    fmt = EMBEDDING_DTYPE_FORMATS[dtype]
+    size = struct.calcsize(fmt)
+    return list(struct.unpack(f"<{len(data) // size}{fmt}", data))
+
+
+def _count_stats(local_hits=0, redis_hits=0, misses=0):
+    with _stats_lock:
+        _local_stats["local_hits"] += local_hits
+        _local_stats["redis_hits"] += redis_hits
+        _local_stats["misses"] += misses
+
+
+def _record_stats(local_hits=0, redis_hits=0, misses=0):
+    _count_stats(local_hits=local_hits, redis_hits=redis_hits, misses=misses)
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.hincrby(EMBEDDING_CACHE_STATS_KEY, "hits", local_hits + redis_hits)
+        pipe.hincrby(EMBEDDING_CACHE_STATS_KEY, "misses", misses)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not record embedding cache stats: {e}")
+
+
+def _redis_get_many(keys):
+    try:
+        return get_redis_client().mget(keys)
+    except Exception as e:
+        logger.warning(f"Embedding cache lookup failed, treating as miss: {e}")
+        return [None] * len(keys)
+
+
+def _redis_set_many(items, ttl=settings.embedding_cache_ttl):
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        for key, value in items:
+            pipe.set(key, value, ex=ttl)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not store embeddings in cache: {e}")
+
+
+def get_cached_embeddings(
+    texts,
+    model=settings.openai_embedding_model,
+    dimensions=settings.vector_dimension,
+):
+    if not settings.embedding_cache_enabled:
+        return openai_generate_embeddings(texts, model=model, dimensions=dimensions)
+
+    dtype = settings.embedding_cache_dtype
+    texts = [normalize_text(text) for text in texts]
+    keys = [
+        get_embedding_cache_key(text, model=model, dtype=dtype, dimensions=dimensions)
+        for text in texts
+    ]
+    embeddings = [_local_cache.get(key) for key in keys]
+    local_hits = sum(embedding is not None for embedding in embeddings)
+
+    # second tier: one MGET for everything the local LRU did not have
+    pending = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    redis_hits = 0
+    if pending:
+        for i, data in zip(pending, _redis_get_many([keys[i] for i in pending])):
+            if data is not None:
+                embeddings[i] = decode_embedding(data, dtype=dtype)
+                _local_cache.set(keys[i], embeddings[i])
+                redis_hits += 1
+
+    # embed each distinct missing text once, even if it repeats in the input
+    missing = {}
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            missing.setdefault(keys[i], []).append(i)
+    if missing:
+        missing_keys = list(missing)
+        new_embeddings = openai_generate_embeddings(
+            [texts[missing[key][0]] for key in missing_keys],
+            model=model,
+            dimensions=dimensions,
+        )
+        for key, embedding in zip(missing_keys, new_embeddings):
+            _local_cache.set(key, embedding)
+            for i in missing[key]:
+                embeddings[i] = embedding
+        _redis_set_many(
+            [
+                (key, encode_embedding(embedding, dtype=dtype))
+                for key, embedding in zip(missing_keys, new_embeddings)
+            ]
+        )
+
+    _record_stats(local_hits=local_hits, redis_hits=redis_hits, misses=len(missing))
+    logger.debug(
+        f"Embedding cache: {local_hits} local hits, {redis_hits} redis hits, {len(missing)} misses"
+    )
+    return embeddings
+
+
+def get_cached_embedding(
+    text,
+    model=settings.openai_embedding_model,
+    dimensions=settings.vector_dimension,
+):
+    return get_cached_embeddings([text], model=model, dimensions=dimensions)[0]
+
+
+async def async_get_cached_embedding(
+    text,
+    model=settings.openai_embedding_model,
+    dimensions=settings.vector_dimension,
+):
+    dtype = settings.embedding_cache_dtype
+    text = normalize_text(text)
+    if not settings.embedding_cache_enabled:
+        return await async_openai_generate_embedding(
+            text, model=model, dimensions=dimensions
+        )
+
+    key = get_embedding_cache_key(text, model=model, dtype=dtype, dimensions=dimensions)
+    redis_client = get_async_redis_client()
+    embedding, data, stats = _local_cache.get(key), None, {"local_hits": 1}
+    if embedding is None:
+        try:
+            data = await redis_client.get(key)
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed, treating as miss: {e}")
+        if data is not None:
+            embedding, stats = decode_embedding(data, dtype=dtype), {"redis_hits": 1}
+        else:
+            embedding = await async_openai_generate_embedding(
+                text, model=model, dimensions=dimensions
+            )
+            stats = {"misses": 1}
+        _local_cache.set(key, embedding)
+
+    _count_stats(**stats)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        if "misses" in stats:
+            pipe.set(
+                key,
+                encode_embedding(embedding, dtype=dtype),
+                ex=settings.embedding_cache_ttl,
+            )
+        pipe.hincrby(EMBEDDING_CACHE_STATS_KEY, "hits", 1 - stats.get("misses", 0))
+        pipe.hincrby(EMBEDDING_CACHE_STATS_KEY, "misses", stats.get("misses", 0))
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not update embedding cache: {e}")
+    return embedding
+
+
+def get_embedding_cache_stats():
+    with _stats_lock:
+        stats = {"process": dict(_local_stats), "local_size": len(_local_cache)}
+    try:
+        totals = get_redis_client().hgetall(EMBEDDING_CACHE_STATS_KEY)
+        hits = int(totals.get(b"hits", 0))
+        misses = int(totals.get(b"misses", 0))
+        stats["total"] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+    except Exception as e:
+        logger.warning(f"Could not read embedding cache stats: {e}")
+    return stats
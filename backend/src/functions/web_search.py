@@ -4,12 +4,17 @@ import openai
 from dotenv import load_dotenv
 from tavily import TavilyClient
 
+from ..config import get_backend_settings
+from ..memoize import memoize
+
 load_dotenv()
+settings = get_backend_settings()
 openai.api_key = os.environ["OPENAI_API_KEY"]
 
 tavily_client = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
 
 
+@memoize("web_search", ttl=settings.memo_ttl_web_search)
 def tavily_search(query):
     output_search = tavily_client.search(query).get("results")[:3]
     search_document = "Here are the retrieved documents from the internet:\n\n"
@@ -0,0 +1,71 @@
+"""Token budgets for the conversation history sent to the LLM.
+
+Every stored message carries its token count, computed once when it is
+written. A prompt gets the newest turns that fit the budget of its stage; the
+older turns are folded into a rolling summary in the background.
+"""
+
+from loguru import logger
+
+from .config import get_backend_settings
+from .utils import count_tokens
+
+settings = get_backend_settings()
+
+_tokenizer_warned = False
+
+
+def count_message_tokens(text, model=settings.openai_model):
+    global _tokenizer_warned
+    try:
+        return count_tokens(text, model=model)
+    except Exception as e:
+        # the tokenizer is downloaded on first use; estimate when it is missing
+        if not _tokenizer_warned:
+            _tokenizer_warned = True
+            logger.warning(f"Tokenizer unavailable, estimating token counts: {e}")
+        return len(text) // 3 + 1
+
+
+def get_recent_start(token_counts, budget):
+    """Return the index where the newest run of messages fitting `budget` starts.
+
+    The last message is always kept, even when it alone exceeds the budget.
+    """
+    start = len(token_counts)
+    total = 0
+    for index in range(len(token_counts) - 1, -1, -1):
+        total += token_counts[index]
+        if total > budget and start < len(token_counts):
+            break
+        start = index
+    return start
+
+
+def get_token_count(msg):
+    # loaded history messages carry the count stored with them
+    token_count = msg.get("token_count")
+    if token_count is None:
+        token_count = count_message_tokens(msg.get("content", ""))
+    return token_count
+
+
+def trim_history(history, budget):
+    # history is a list of chat messages, oldest first; system messages
+    # (system prompt, rolling summary) are not part of a stage's budget
+    turns = [msg for msg in history if msg.get("role") in ("user", "assistant")]
+    if not turns:
+        return turns
+    start = get_recent_start([get_token_count(msg) for msg in turns], budget)
+    if start:
+        logger.info(
+            f"Trimmed {start} of {len(turns)} history messages to fit {budget} tokens"
+        )
+    return turns[start:]
+
+
+def build_summary_message(summary):
+    return {
+        "role": "system",
+        "content": f"Summary of the earlier conversation:\n{summary}",
+    }
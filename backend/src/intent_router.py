@@ -0,0 +1,88 @@
+import json
+import threading
+
+import numpy as np
+from loguru import logger
+
+from .brain import detect_route
+from .config import get_backend_settings
+from .embedding_cache import get_cached_embedding, get_cached_embeddings
+
+settings = get_backend_settings()
+
+
+def load_route_exemplars(path=settings.route_exemplars_path):
+    with open(path, encoding="utf-8") as f:
+        exemplars = json.load(f)
+    if not isinstance(exemplars, dict) or not all(
+        isinstance(texts, list) and texts for texts in exemplars.values()
+    ):
+        raise ValueError(f"Expected {{route: [exemplar, ...]}} in {path}")
+    return exemplars
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class EmbeddingRouter:
+    """Routes a query to the label whose exemplars it is most similar to."""
+
+    def __init__(self, exemplars, embed_fn=get_cached_embeddings, top_k=settings.route_top_k):
+        texts = [text for route_texts in exemplars.values() for text in route_texts]
+        self.routes = list(exemplars)
+        self.labels = np.array(
+            [i for i, route in enumerate(self.routes) for _ in exemplars[route]]
+        )
+        self.embeddings = normalize_rows(np.asarray(embed_fn(texts), dtype=np.float32))
+        self.top_k = top_k
+
+    def scores(self, query_embedding):
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+        similarities = self.embeddings @ query
+
+        # mean of the k nearest exemplars per route: less noisy than the single
+        # nearest one, and unlike a centroid it handles multi-topic routes
+        scores = {}
+        for i, route in enumerate(self.routes):
+            route_similarities = similarities[self.labels == i]
+            k = min(self.top_k, len(route_similarities))
+            top = np.partition(route_similarities, -k)[-k:]
+            scores[route] = float(top.mean())
+        return scores
+
+    def classify(self, query_embedding):
+        scores = self.scores(query_embedding)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        margin = scores[ranked[0]] - scores[ranked[1]] if len(ranked) > 1 else 1.0
+        return ranked[0], margin, scores
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_embedding_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = EmbeddingRouter(load_route_exemplars())
+    return _router
+
+
+def embedding_detect_route(history, message, min_margin=settings.route_min_margin):
+    try:
+        route, margin, scores = get_embedding_router().classify(
+            get_cached_embedding(message)
+        )
+    except Exception as e:
+        logger.warning(f"Embedding router failed, falling back to LLM: {e}")
+        return detect_route(history, message)
+
+    logger.info(f"Embedding route: {route} (margin {margin:.3f}, scores {scores})")
+    if margin < min_margin:
+        # ambiguous, often a follow-up that needs the history to make sense
+        return detect_route(history, message)
+    return route
@@ -1,15 +1,32 @@
 import asyncio
+import json
 import time
+from typing import Literal, Optional
 
 from celery.result import AsyncResult
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from loguru import logger
+from pydantic import ValidationError
 
+from .answer_cache import invalidate_cached_answers
+from .async_pipeline import async_message_handler
+from .cache import (create_ingest_job, get_ingest_job, get_queue_depth,
+                    update_ingest_job)
 from .config import get_backend_settings
-from .models import init_db, insert_document
-from .schema import CompleteRequest
-from .tasks import chunk_and_index_document, message_handler_task
-from .vectorize import create_collection
+from .embedding_cache import get_embedding_cache_stats
+from .memoize import get_memo_stats
+from .models import (delete_document, init_db, insert_document,
+                     insert_documents, update_document)
+from .prompts import get_prompt_stats, get_usage_stats
+from .schema import CompleteRequest, DocumentCreate
+from .task_events import get_task_notifier
+from .tasks import (chunk_and_index_document, index_documents_batch,
+                    message_handler_task, reindex_document,
+                    stream_message_handler)
+from .vectorize import (create_collection, delete_document_points,
+                        scope_search_filter)
 
 settings = get_backend_settings()
 
@@ -41,6 +58,30 @@ async def readiness_check():
         raise HTTPException(status_code=503, detail="Service not ready")
 
 
+@app.get("/cache/stats")
+def cache_stats():
+    try:
+        return {
+            "embeddings": get_embedding_cache_stats(),
+            "stages": get_memo_stats(),
+        }
+    except Exception as e:
+        logger.error(f"Error reading cache stats: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error.")
+
+
+@app.get("/prompts/stats")
+def prompt_stats():
+    # assembly: prompt tokens built in this process and duplicated system
+    # content dropped; usage: provider-reported tokens of all processes,
+    # including the prompt-cache hit ratio, per stage
+    try:
+        return {"assembly": get_prompt_stats(), "usage": get_usage_stats()}
+    except Exception as e:
+        logger.error(f"Error reading prompt stats: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error.")
+
+
 # Task endpoints
 @app.post("/chat/complete")
 async def chat_complete(request: CompleteRequest):
@@ -51,58 +92,168 @@ async def chat_complete(request: CompleteRequest):
 
     if not bot_id or not user_id or not user_message:
         raise HTTPException(status_code=400, detail="Missing required fields")
+    search_filter = scope_search_filter(request.search_filter, bot_id)
 
     logger.info(f"Chat request from user {user_id} to bot {bot_id}: {user_message}")
 
     try:
         if is_sync_request:
-            response = message_handler_task(bot_id, user_id, user_message)
+            # awaited on the event loop; other requests keep being served
+            response = await async_message_handler(
+                bot_id, user_id, user_message, search_filter=search_filter
+            )
             return {"status": "completed", "response": response}
         else:
-            response = message_handler_task.delay(bot_id, user_id, user_message)
+            response = message_handler_task.delay(
+                bot_id, user_id, user_message, search_filter=search_filter
+            )
             return {"status": "processing", "task_id": response.id}
     except Exception as e:
         logger.error(f"Error processing chat request: {e}")
         raise HTTPException(status_code=500, detail="Internal server error.")
 
 
+def format_sse(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def iter_chat_stream_events(bot_id, user_id, user_message, search_filter=None):
+    try:
+        for token in stream_message_handler(
+            bot_id, user_id, user_message, search_filter=search_filter
+        ):
+            yield format_sse({"type": "token", "content": token})
+        yield format_sse({"type": "done"})
+    except Exception as e:
+        logger.error(f"Error streaming chat response: {e}")
+        yield format_sse(
+            {
+                "type": "error",
+                "content": "Xin lỗi, đã có lỗi xảy ra trong quá trình xử lý câu hỏi.",
+            }
+        )
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: CompleteRequest):
+    if not request.bot_id or not request.user_id or not request.user_message:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+
+    logger.info(
+        f"Streaming chat request from user {request.user_id} to bot "
+        f"{request.bot_id}: {request.user_message}"
+    )
+    # the sync generator is iterated in the threadpool, one token per event
+    return StreamingResponse(
+        iter_chat_stream_events(
+            request.bot_id,
+            request.user_id,
+            request.user_message,
+            search_filter=scope_search_filter(request.search_filter, request.bot_id),
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def get_task_snapshot(task_id):
+    # every AsyncResult attribute is a blocking read of the result backend
+    task_result = AsyncResult(task_id)
+    ready = task_result.ready()
+    return {
+        "ready": ready,
+        "status": task_result.status,
+        "result": task_result.result,
+        "successful": ready and task_result.successful(),
+    }
+
+
+async def wait_for_task_result(task_id, timeout):
+    notifier = get_task_notifier()
+    waiter = notifier.register(task_id)
+    try:
+        # the first check must come after the subscription is active, or a
+        # completion published in between is missed
+        deadline = time.monotonic() + timeout
+        await notifier.wait_subscribed(timeout)
+        task = await run_in_threadpool(get_task_snapshot, task_id)
+        if not task["ready"]:
+            await notifier.wait(waiter, max(deadline - time.monotonic(), 0))
+            task = await run_in_threadpool(get_task_snapshot, task_id)
+        return task
+    finally:
+        notifier.unregister(task_id, waiter)
+
+
 @app.get("/chat/complete/{task_id}")
-async def get_chat_response(task_id: str):
-    start = time.time()
-    try:
-        while True:
-            task_result = AsyncResult(task_id)
-            task_status = task_result.status
-            if task_status == "PENDING" or task_status == "STARTED":
-                if time.time() - start > 60:
-                    return {
-                        "task_id": task_id,
-                        "status": task_result.status,
-                        "task_result": task_result.result,
-                        "error_message": "408 Request Timeout: The task is still pending after 60 seconds.",
-                    }
-                else:
-                    # Wait 0.5s before checking again
-                    await asyncio.sleep(0.5)
-            else:
-                return {
-                    "task_id": task_id,
-                    "status": task_result.status,
-                    "task_result": task_result.result,
-                }
+async def get_chat_response(task_id: str, timeout: float = 60):
+    try:
+        task = await wait_for_task_result(task_id, timeout)
+        if not task["ready"]:
+            return {
+                "task_id": task_id,
+                "status": task["status"],
+                "task_result": task["result"],
+                "error_message": f"408 Request Timeout: The task is still pending after {timeout:g} seconds.",
+            }
+        return {
+            "task_id": task_id,
+            "status": task["status"],
+            "task_result": task["result"],
+        }
     except Exception as e:
         logger.error(f"Error retrieving task {task_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error.")
 
 
+@app.get("/chat/complete/{task_id}/events")
+async def get_chat_response_events(task_id: str, timeout: float = 60):
+    async def event_stream():
+        try:
+            task = await wait_for_task_result(task_id, timeout)
+            yield format_sse(
+                {
+                    "task_id": task_id,
+                    "status": task["status"],
+                    "task_result": (
+                        task["result"]
+                        if task["successful"]
+                        else str(task["result"] or "")
+                    ),
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error streaming status of task {task_id}: {e}")
+            yield format_sse({"task_id": task_id, "status": "ERROR"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Qdrant endpoints
 @app.post("/collections/create")
 def create_collection_endpoint(
     collection_name: str = settings.default_collection_name,
     vector_size: int = settings.vector_dimension,
+    quantization: Literal["", "scalar", "product", "binary"] = settings.qdrant_quantization,
+    on_disk: bool = settings.qdrant_on_disk_vectors,
+    hnsw_m: int = settings.qdrant_hnsw_m,
+    hnsw_ef_construct: int = settings.qdrant_hnsw_ef_construct,
+    quantization_always_ram: bool = settings.qdrant_quantization_always_ram,
 ):
     try:
-        status = create_collection(collection_name, vector_size)
+        status = create_collection(
+            collection_name,
+            vector_size,
+            quantization=quantization,
+            on_disk=on_disk,
+            hnsw_m=hnsw_m,
+            hnsw_ef_construct=hnsw_ef_construct,
+            quantization_always_ram=quantization_always_ram,
+        )
         return {"status": status}
     except Exception as e:
         logger.error(f"Error creating collection via endpoint: {e}")
@@ -110,11 +261,11 @@ def create_collection_endpoint(
 
 
 @app.post("/documents/create")
-def insert_document_endpoint(title: str, content: str):
+def insert_document_endpoint(title: str, content: str, bot_id: str = "Meddy"):
     try:
-        new_docs = insert_document(title, content)
+        new_docs = insert_document(title, content, bot_id)
         doc_id = str(new_docs.id)
-        chunk_and_index_document.delay(doc_id, title, content)
+        chunk_and_index_document.delay(doc_id, title, content, bot_id)
         return {
             "status": "Document received and indexing started.",
             "document_id": doc_id,
@@ -122,3 +273,151 @@ def insert_document_endpoint(title: str, content: str):
     except Exception as e:
         logger.error(f"Error inserting document via endpoint: {e}")
         raise HTTPException(status_code=500, detail="Internal server error.")
+
+
+@app.put("/documents/{doc_id}")
+def update_document_endpoint(
+    doc_id: int, title: str, content: str, bot_id: Optional[str] = None
+):
+    try:
+        doc = update_document(doc_id, title, content, bot_id)
+    except Exception as e:
+        logger.error(f"Error updating document {doc_id} via endpoint: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error.")
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+
+    # the stored tenant is kept unless a new one is given
+    reindex_document.delay(str(doc_id), title, content, doc.bot_id)
+    return {
+        "status": "Document updated and re-indexing started.",
+        "document_id": str(doc_id),
+    }
+
+
+@app.delete("/documents/{doc_id}")
+def delete_document_endpoint(doc_id: int):
+    try:
+        deleted = delete_document(doc_id)
+        if deleted:
+            delete_document_points(str(doc_id))
+            invalidate_cached_answers([str(doc_id)])
+    except Exception as e:
+        logger.error(f"Error deleting document {doc_id} via endpoint: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error.")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return {"status": "Document deleted.", "document_id": str(doc_id)}
+
+
+async def iter_ndjson_lines(byte_stream):
+    buffer = b""
+    async for chunk in byte_stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def wait_for_queue_capacity():
+    # backpressure: hold the upload until the indexing workers catch up, but
+    # give up when the queue does not drain, e.g. with no worker running
+    timeout = settings.bulk_ingest_backpressure_timeout
+    deadline = time.monotonic() + timeout
+    while True:
+        depth = await run_in_threadpool(get_queue_depth, settings.celery_queue_name)
+        if depth < settings.bulk_ingest_max_queue_depth:
+            return
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Indexing queue depth still {depth} after {timeout}s")
+        logger.debug(f"Indexing queue depth {depth}, waiting before enqueuing more")
+        await asyncio.sleep(settings.bulk_ingest_backpressure_interval)
+
+
+async def flush_document_batch(job_id, batch):
+    # capacity is checked before the insert: stored documents must also be
+    # enqueued, nothing else would ever index them
+    await wait_for_queue_capacity()
+    inserted = await run_in_threadpool(insert_documents, batch)
+    await run_in_threadpool(update_ingest_job, job_id, inserted=len(inserted))
+
+    step = settings.bulk_ingest_index_batch_size
+    enqueued = 0
+    try:
+        for start in range(0, len(inserted), step):
+            index_batch = inserted[start : start + step]
+            await run_in_threadpool(index_documents_batch.delay, index_batch, job_id)
+            enqueued += len(index_batch)
+            await run_in_threadpool(update_ingest_job, job_id, enqueued=len(index_batch))
+    except Exception:
+        # counted as failed so the job still reaches a final state
+        not_enqueued = [doc["doc_id"] for doc in inserted[enqueued:]]
+        logger.error(f"Documents {not_enqueued} of job {job_id} were stored but not enqueued")
+        await run_in_threadpool(update_ingest_job, job_id, failed=len(not_enqueued))
+        raise
+
+
+async def fail_ingest_job(job_id):
+    if job_id is None:
+        return
+    try:
+        await run_in_threadpool(update_ingest_job, job_id, status="failed")
+    except Exception as e:
+        logger.error(f"Could not mark ingest job {job_id} as failed: {e}")
+
+
+@app.post("/documents/bulk")
+async def bulk_insert_documents_endpoint(request: Request):
+    # body is an NDJSON/JSONL stream of {"title": ..., "content": ...} objects
+    job_id = None
+    try:
+        job_id = await run_in_threadpool(
+            create_ingest_job, ttl_seconds=settings.bulk_ingest_job_ttl
+        )
+        batch, received, invalid = [], 0, 0
+
+        async for line in iter_ndjson_lines(request.stream()):
+            received += 1
+            try:
+                document = DocumentCreate.model_validate(json.loads(line))
+                batch.append(document.model_dump())
+            except (json.JSONDecodeError, ValidationError) as e:
+                invalid += 1
+                logger.warning(f"Skipping invalid line {received} in job {job_id}: {e}")
+
+            if len(batch) >= settings.bulk_ingest_db_batch_size:
+                await run_in_threadpool(update_ingest_job, job_id, received=len(batch))
+                await flush_document_batch(job_id, batch)
+                batch = []
+
+        if batch:
+            await run_in_threadpool(update_ingest_job, job_id, received=len(batch))
+            await flush_document_batch(job_id, batch)
+        await run_in_threadpool(
+            update_ingest_job, job_id, status="indexing", invalid=invalid
+        )
+
+        return await run_in_threadpool(get_ingest_job, job_id)
+    except TimeoutError as e:
+        logger.error(f"Bulk ingestion job {job_id} failed: {e}")
+        await fail_ingest_job(job_id)
+        raise HTTPException(status_code=503, detail="Indexing workers are unavailable.")
+    except Exception as e:
+        logger.error(f"Error in bulk document ingestion: {e}")
+        await fail_ingest_job(job_id)
+        raise HTTPException(status_code=500, detail="Internal server error.")
+
+
+@app.get("/documents/bulk/{job_id}")
+def get_bulk_job_endpoint(job_id: str):
+    try:
+        job = get_ingest_job(job_id)
+    except Exception as e:
+        logger.error(f"Error retrieving ingest job {job_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error.")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
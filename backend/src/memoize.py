@@ -0,0 +1,219 @@
+import inspect
+import json
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from loguru import logger
+
+from .cache import LocalLRUCache, get_async_redis_client, get_redis_client
+from .config import get_backend_settings
+from .prompts import PROMPT_ASSEMBLY_VERSION
+from .utils import hash_text, normalize_text
+
+settings = get_backend_settings()
+
+MEMO_PREFIX = "memo"
+MEMO_STATS_KEY = "memo:stats"
+
+_local_cache = LocalLRUCache(settings.memo_local_size)
+_stats_lock = threading.Lock()
+_local_stats: defaultdict[str, dict[str, int]] = defaultdict(
+    lambda: {"hits": 0, "misses": 0}
+)
+
+
+def prompt_version(*parts):
+    # changing the model, editing a prompt template or changing how the
+    # messages are assembled starts a fresh key space
+    return hash_text("\n".join([PROMPT_ASSEMBLY_VERSION, *parts]))[:12]
+
+
+def normalize_value(value):
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, (list, tuple)):
+        return [normalize_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): normalize_value(item) for key, item in value.items()}
+    return value
+
+
+def get_memo_key(stage, version, args, kwargs):
+    serialized = json.dumps(
+        [version, normalize_value(args), normalize_value(kwargs)],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return f"{MEMO_PREFIX}:{stage}:{hash_text(serialized)}"
+
+
+def _count(stage, hit):
+    field = "hits" if hit else "misses"
+    with _stats_lock:
+        _local_stats[stage][field] += 1
+    return f"{stage}:{field}"
+
+
+def _record_stats(stage, hit):
+    field = _count(stage, hit)
+    try:
+        get_redis_client().hincrby(MEMO_STATS_KEY, field, 1)
+    except Exception as e:
+        logger.warning(f"Could not record memo stats for {stage}: {e}")
+
+
+async def _async_record_stats(stage, hit):
+    field = _count(stage, hit)
+    try:
+        await get_async_redis_client().hincrby(MEMO_STATS_KEY, field, 1)
+    except Exception as e:
+        logger.warning(f"Could not record memo stats for {stage}: {e}")
+
+
+def _local_get(key):
+    entry = _local_cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+    return None
+
+
+def _local_expiry(pttl, ttl):
+    # a result read from Redis expires locally when its Redis key does; keys
+    # without an expiry fall back to the stage TTL
+    return time.time() + (pttl / 1000 if pttl >= 0 else ttl)
+
+
+def _redis_get(key, ttl):
+    # returns (data, local expiry) or (None, None) on a miss
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        data, pttl = pipe.get(key).pttl(key).execute()
+    except Exception as e:
+        logger.warning(f"Memo lookup failed, treating as miss: {e}")
+        return None, None
+    return (data, _local_expiry(pttl, ttl)) if data is not None else (None, None)
+
+
+async def _async_redis_get(key, ttl):
+    try:
+        pipe = get_async_redis_client().pipeline(transaction=False)
+        data, pttl = await pipe.get(key).pttl(key).execute()
+    except Exception as e:
+        logger.warning(f"Memo lookup failed, treating as miss: {e}")
+        return None, None
+    return (data, _local_expiry(pttl, ttl)) if data is not None else (None, None)
+
+
+def _redis_set(key, value, ttl):
+    try:
+        get_redis_client().set(key, value, ex=ttl)
+    except Exception as e:
+        logger.warning(f"Could not store memoized result: {e}")
+
+
+async def _async_redis_set(key, value, ttl):
+    try:
+        await get_async_redis_client().set(key, value, ex=ttl)
+    except Exception as e:
+        logger.warning(f"Could not store memoized result: {e}")
+
+
+def _load(data, decode):
+    result = json.loads(data)
+    return decode(result) if decode else result
+
+
+def _dump(key, result, ttl, encode):
+    data = json.dumps(encode(result) if encode else result, ensure_ascii=False)
+    _local_cache.set(key, (time.time() + ttl, data))
+    return data
+
+
+def _sync_memoized(func, stage, ttl, version, encode, decode):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not settings.memo_enabled:
+            return func(*args, **kwargs)
+
+        key = get_memo_key(stage, version, args, kwargs)
+        data = _local_get(key)
+        if data is None:
+            data, expires_at = _redis_get(key, ttl)
+            if data is not None:
+                _local_cache.set(key, (expires_at, data))
+        _record_stats(stage, hit=data is not None)
+        if data is not None:
+            return _load(data, decode)
+
+        result = func(*args, **kwargs)
+        _redis_set(key, _dump(key, result, ttl, encode), ttl)
+        return result
+
+    return wrapper
+
+
+def _async_memoized(func, stage, ttl, version, encode, decode):
+    @wraps(func)
+    async def async_wrapper(*args, **kwargs):
+        if not settings.memo_enabled:
+            return await func(*args, **kwargs)
+
+        key = get_memo_key(stage, version, args, kwargs)
+        data = _local_get(key)
+        if data is None:
+            data, expires_at = await _async_redis_get(key, ttl)
+            if data is not None:
+                _local_cache.set(key, (expires_at, data))
+        await _async_record_stats(stage, hit=data is not None)
+        if data is not None:
+            return _load(data, decode)
+
+        result = await func(*args, **kwargs)
+        await _async_redis_set(key, _dump(key, result, ttl, encode), ttl)
+        return result
+
+    return async_wrapper
+
+
+def memoize(stage, ttl, version="", encode=None, decode=None):
+    """Cache a stage's JSON-serializable result in a local LRU and in Redis.
+
+    Works for both plain and ``async`` functions. Exceptions are never cached.
+    ``encode``/``decode`` convert results that are not plain JSON, e.g.
+    pydantic models.
+    """
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            return _async_memoized(func, stage, ttl, version, encode, decode)
+        return _sync_memoized(func, stage, ttl, version, encode, decode)
+
+    return decorator
+
+
+def get_memo_stats():
+    with _stats_lock:
+        process = {stage: dict(counts) for stage, counts in _local_stats.items()}
+    stats = {"process": process, "local_size": len(_local_cache)}
+    try:
+        totals = defaultdict(lambda: {"hits": 0, "misses": 0})
+        for field, count in get_redis_client().hgetall(MEMO_STATS_KEY).items():
+            stage, kind = field.decode().rsplit(":", 1)
+            totals[stage][kind] = int(count)
+        stats["total"] = {
+            stage: {
+                **counts,
+                "hit_rate": (
+                    counts["hits"] / (counts["hits"] + counts["misses"])
+                    if counts["hits"] + counts["misses"]
+                    else 0.0
+                ),
+            }
+            for stage, counts in totals.items()
+        }
+    except Exception as e:
+        logger.warning(f"Could not read memo stats: {e}")
+    return stats
@@ -1,15 +1,39 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
 from loguru import logger
-from sqlalchemy import Boolean, DateTime, Integer, String, Text
+from sqlalchemy import (Boolean, DateTime, Index, Integer, String, Text,
+                        bindparam, insert, tuple_, update)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import InterfaceError, OperationalError
 from sqlalchemy.future import select
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.sql import func
 
-from .cache import get_conversation_id
+from .cache import (acquire_conversation_flush_lock, append_history_entry,
+                    async_append_history_entry,
+                    async_enqueue_conversation_write,
+                    async_get_conversation_id, dead_letter_conversation_write,
+                    enqueue_conversation_write, get_conversation_id,
+                    get_history_entries, get_history_entry,
+                    peek_conversation_writes, rebuild_history,
+                    release_conversation_flush_lock, set_history_entry,
+                    set_history_summary, trim_conversation_writes)
 from .config import get_backend_settings
 from .database import engine, get_db
+from .history import (build_summary_message, count_message_tokens,
+                      get_recent_start)
 
 settings = get_backend_settings()
 
+# dialects whose insert supports ON CONFLICT DO NOTHING; sqlite runs the tests
+DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+# errors that fail any operation, e.g. the database being down: the queue is
+# kept as is and retried instead of dead-lettering every operation
+TRANSIENT_DB_ERRORS = (OperationalError, InterfaceError)
+
 
 class Base(DeclarativeBase):
     pass
@@ -26,6 +50,24 @@ def init_db():
 
 class ChatConversation(Base):
     __tablename__ = "chat_conversations"
+    __table_args__ = (
+        # history reads filter on the conversation and walk it in keyset
+        # (created_at, id) order, which the index covers entirely
+        Index(
+            "ix_chat_conversations_conversation_id_created_at_id",
+            "conversation_id",
+            "created_at",
+            "id",
+        ),
+        Index("ix_chat_conversations_bot_id_user_id", "bot_id", "user_id"),
+        # a message is written once, however often its queued insert is applied
+        Index(
+            "ix_chat_conversations_conversation_id_seq",
+            "conversation_id",
+            "seq",
+            unique=True,
+        ),
+    )
 
     id: Mapped[int] = mapped_column(
         Integer, primary_key=True, index=True, autoincrement=True
@@ -38,6 +80,10 @@ class ChatConversation(Base):
     message: Mapped[str] = mapped_column(Text, nullable=False)
     is_request: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
     is_completed: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    # counted when the message is written, NULL for rows stored before
+    token_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # position in the conversation, assigned by the Redis hot history
+    seq: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     created_at: Mapped[DateTime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -46,12 +92,27 @@ class ChatConversation(Base):
     )
 
 
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    # rolling summary of the messages up to and including seq last_seq
+    conversation_id: Mapped[str] = mapped_column(String(100), primary_key=True)
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+    last_seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    token_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
 class Document(Base):
     __tablename__ = "documents"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
     content: Mapped[str] = mapped_column(Text, nullable=False)
+    # tenant of the document, copied to the payload of its points
+    bot_id: Mapped[str] = mapped_column(String(100), nullable=False, default="Meddy")
     created_at: Mapped[DateTime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -60,63 +121,480 @@ class Document(Base):
     )
 
 
-# Chat conversation's messages
-def get_conversation_by_id(conversation_id):
-    with get_db() as db:
-        stmt = (
-            select(ChatConversation)
-            .where(ChatConversation.conversation_id == conversation_id)
-            .order_by(ChatConversation.created_at.asc())
+# Chat conversation's messages. Active conversations are read from and
+# appended to the Redis hot history; Postgres gets every change through the
+# write-behind queue and is only read to rebuild a history missing from Redis.
+def get_conversation_page(conversation_id, after=None, limit=None):
+    """Return up to `limit` messages of a conversation after a keyset cursor.
+
+    Only the columns the history needs are selected. `after` is the
+    (created_at, id) of the last message of the previous page, so every page
+    is an index range scan instead of an OFFSET that rereads the skipped rows.
+    """
+    limit = limit or settings.history_page_size
+    stmt = (
+        select(
+            ChatConversation.id,
+            ChatConversation.seq,
+            ChatConversation.message,
+            ChatConversation.is_request,
+            ChatConversation.token_count,
+            ChatConversation.created_at,
+        )
+        .where(ChatConversation.conversation_id == conversation_id)
+        .order_by(ChatConversation.created_at.asc(), ChatConversation.id.asc())
+        .limit(limit)
+    )
+    if after is not None:
+        stmt = stmt.where(
+            tuple_(ChatConversation.created_at, ChatConversation.id) > tuple_(*after)
         )
-        conversations = db.execute(stmt).scalars().all()
-        # return rows with the same conversation's id. Each contains a message in the conversation
-        if conversations:
-            return conversations
+    with get_db() as db:
+        return db.execute(stmt).all()
+
+
+def iter_conversation_messages(conversation_id, page_size=None):
+    page_size = page_size or settings.history_page_size
+    after = None
+    while True:
+        page = get_conversation_page(conversation_id, after, page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        after = (page[-1].created_at, page[-1].id)
+
+
+def get_conversation_by_id(conversation_id, page_size=None):
+    conversations = list(iter_conversation_messages(conversation_id, page_size))
+    # return rows with the same conversation's id. Each contains a message in the conversation
+    if conversations:
+        return conversations
+    else:
+        logger.warning(f"No conversation found with ID: {conversation_id}")
+        return None
+
+
+def get_message_key(conversation_id, seq):
+    # a message is identified by its position in the conversation, which is
+    # known before its row is written
+    return f"{conversation_id}:{seq}"
+
+
+def parse_message_key(message_key):
+    conversation_id, seq = message_key.rsplit(":", 1)
+    return conversation_id, int(seq)
+
+
+def get_message_token_count(msg):
+    if msg.token_count is None:
+        return count_message_tokens(msg.message)
+    return msg.token_count
+
+
+def build_history_entry(message, is_request):
+    return {
+        "message": message,
+        "is_request": is_request,
+        "token_count": count_message_tokens(message),
+        "created_at": time.time(),
+    }
+
+
+def build_insert_operation(conversation_id, seq, bot_id, user_id, entry):
+    return {
+        "op": "insert",
+        "conversation_id": conversation_id,
+        "seq": seq,
+        "bot_id": bot_id,
+        "user_id": user_id,
+        **entry,
+    }
+
+
+def queue_conversation_write(operation):
+    # imported here: tasks imports this module
+    from .tasks import schedule_conversation_flush
+
+    schedule_conversation_flush(enqueue_conversation_write(operation))
+
+
+def build_stored_entry(msg):
+    return {
+        "message": msg.message,
+        "is_request": msg.is_request,
+        "token_count": get_message_token_count(msg),
+        "created_at": msg.created_at.timestamp(),
+    }
+
+
+def merge_conversation_entries(conversation_id, rows, operations):
+    """Return the history entries of stored rows and queued operations.
+
+    An entry's list position is its seq. Rows stored before seqs existed come
+    first, in created_at order, and the others sit at their seq. Queued
+    operations fill in what has not been flushed yet.
+    """
+    legacy, entries = [], {}
+    for msg in rows:
+        if msg.seq is None:
+            legacy.append(build_stored_entry(msg))
         else:
-            logger.warning(f"No conversation found with ID: {conversation_id}")
-            return None
+            entries[msg.seq] = build_stored_entry(msg)
+    for op in operations:
+        if op["conversation_id"] != conversation_id:
+            continue
+        if op["op"] == "insert":
+            entries.setdefault(
+                op["seq"],
+                {
+                    "message": op["message"],
+                    "is_request": op["is_request"],
+                    "token_count": op["token_count"],
+                    "created_at": op["created_at"],
+                },
+            )
+        elif op["seq"] in entries:
+            entries[op["seq"]].update(
+                message=op["message"], token_count=op["token_count"]
+            )
+
+    seqs = sorted(entries)
+    if seqs != list(range(len(legacy), len(legacy) + len(seqs))):
+        logger.warning(f"History of conversation {conversation_id} has gaps in its seqs")
+    return legacy + [entries[seq] for seq in seqs]
+
+
+def load_conversation_into_cache(conversation_id):
+    """Rebuild the hot history of a conversation from Postgres."""
+    # the queue is read before Postgres: an operation flushed in between is
+    # then found in Postgres, one still queued in the snapshot. Flushing
+    # instead is not enough, another process may hold the flush lock
+    operations = peek_conversation_writes()
+    rows = get_conversation_by_id(conversation_id) or []
+    summary = get_conversation_summary(conversation_id)
+    entries = merge_conversation_entries(conversation_id, rows, operations)
+    meta = {
+        "summary": summary.summary if summary else None,
+        "summary_seq": summary.last_seq if summary else -1,
+        "summary_tokens": summary.token_count if summary else 0,
+    }
+    if rebuild_history(conversation_id, entries, meta):
+        logger.info(
+            f"Rebuilt history of conversation {conversation_id} from {len(rows)} stored "
+            f"messages and {len(entries) - len(rows)} queued ones"
+        )
+
+
+def add_conversation_message(conversation_id, bot_id, user_id, message, is_request=True):
+    entry = build_history_entry(message, is_request)
+    seq = append_history_entry(conversation_id, entry)
+    if seq is None:
+        load_conversation_into_cache(conversation_id)
+        seq = append_history_entry(conversation_id, entry)
+        if seq is None:
+            raise RuntimeError(f"Could not cache history of conversation {conversation_id}")
+    queue_conversation_write(
+        build_insert_operation(conversation_id, seq, bot_id, user_id, entry)
+    )
+    return seq
 
 
 def update_conversation(bot_id, user_id, message, is_request=True):
+    conversation_id = get_conversation_id(bot_id, user_id)
+    if conversation_id:
+        add_conversation_message(
+            conversation_id, bot_id, user_id, message, is_request=is_request
+        )
+        return conversation_id
+
+
+def add_assistant_message(bot_id, user_id, message):
+    # returns the message key so the message can be replaced by its summary later
+    conversation_id = get_conversation_id(bot_id, user_id)
+    if conversation_id:
+        seq = add_conversation_message(
+            conversation_id, bot_id, user_id, message, is_request=False
+        )
+        return get_message_key(conversation_id, seq)
+
+
+def get_conversation_messages(message_keys):
+    messages = {}
+    for message_key in message_keys:
+        conversation_id, seq = parse_message_key(message_key)
+        entry = get_history_entry(conversation_id, seq)
+        if entry is None:
+            with get_db() as db:
+                message = db.scalar(
+                    select(ChatConversation.message).where(
+                        ChatConversation.conversation_id == conversation_id,
+                        ChatConversation.seq == seq,
+                    )
+                )
+        else:
+            message = entry["message"]
+        if message is None:
+            logger.warning(f"No message found for {message_key}")
+            continue
+        messages[message_key] = message
+    return messages
+
+
+def update_conversation_message(message_key, message):
+    conversation_id, seq = parse_message_key(message_key)
+    token_count = count_message_tokens(message)
+    entry = get_history_entry(conversation_id, seq)
+    if entry is not None:
+        set_history_entry(
+            conversation_id, seq, {**entry, "message": message, "token_count": token_count}
+        )
+    queue_conversation_write(
+        {
+            "op": "update",
+            "conversation_id": conversation_id,
+            "seq": seq,
+            "message": message,
+            "token_count": token_count,
+        }
+    )
+
+
+def apply_conversation_writes(operations):
+    """Apply queued operations in one transaction, inserts first.
+
+    An update is always queued after the insert of its row, so it is either in
+    an earlier batch or in the same one.
+    """
+    rows = [
+        {
+            "conversation_id": op["conversation_id"],
+            "seq": op["seq"],
+            "bot_id": op["bot_id"],
+            "user_id": op["user_id"],
+            "message": op["message"],
+            "is_request": op["is_request"],
+            "is_completed": not op["is_request"],
+            "token_count": op["token_count"],
+            "created_at": datetime.fromtimestamp(op["created_at"], tz=timezone.utc),
+        }
+        for op in operations
+        if op["op"] == "insert"
+    ]
+    updates = [
+        {
+            "b_conversation_id": op["conversation_id"],
+            "b_seq": op["seq"],
+            "message": op["message"],
+            "token_count": op["token_count"],
+        }
+        for op in operations
+        if op["op"] == "update"
+    ]
+    table = ChatConversation.__table__
+    with get_db() as db:
+        if rows:
+            # a batch committed but not yet trimmed is applied again by the
+            # next flush; rows already written are skipped
+            dialect_insert = DIALECT_INSERTS[db.get_bind().dialect.name]
+            db.execute(
+                dialect_insert(table).on_conflict_do_nothing(
+                    index_elements=["conversation_id", "seq"]
+                ),
+                rows,
+            )
+        if updates:
+            db.execute(
+                update(table).where(
+                    table.c.conversation_id == bindparam("b_conversation_id"),
+                    table.c.seq == bindparam("b_seq"),
+                ),
+                updates,
+            )
+        db.commit()
+
+
+def apply_conversation_writes_singly(operations):
+    """Apply the operations of a failed batch one at a time, in queue order.
+
+    Each operation leaves the queue once it is committed. One that fails on its
+    own is moved to the dead-letter list, so it cannot hold back the others.
+    """
+    for operation in operations:
+        try:
+            apply_conversation_writes([operation])
+        except TRANSIENT_DB_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Dead-lettering conversation write {operation}: {e}")
+            dead_letter_conversation_write()
+            continue
+        trim_conversation_writes(1)
+
+
+def flush_conversation_writes(batch_size=settings.conversation_flush_batch_size):
+    # operations are removed from the queue only after they are committed
+    token = acquire_conversation_flush_lock(settings.conversation_flush_lock_ttl)
+    if token is None:
+        return 0
+    try:
+        operations = peek_conversation_writes(batch_size)
+        if not operations:
+            return 0
+        try:
+            apply_conversation_writes(operations)
+        except TRANSIENT_DB_ERRORS:
+            raise
+        except Exception as e:
+            logger.warning(f"Batch of conversation writes failed, applying singly: {e}")
+            apply_conversation_writes_singly(operations)
+        else:
+            trim_conversation_writes(len(operations))
+        logger.info(f"Flushed {len(operations)} conversation writes to Postgres")
+        return len(operations)
+    finally:
+        release_conversation_flush_lock(token)
+
+
+# only the Redis calls are awaited; rebuilding from psycopg2 and scheduling
+# the flush run in a worker thread
+async def async_update_conversation(bot_id, user_id, message, is_request=True):
+    conversation_id = await async_get_conversation_id(bot_id, user_id)
+    if conversation_id:
+        entry = build_history_entry(message, is_request)
+        seq = await async_append_history_entry(conversation_id, entry)
+        if seq is None:
+            await asyncio.to_thread(load_conversation_into_cache, conversation_id)
+            seq = await async_append_history_entry(conversation_id, entry)
+            if seq is None:
+                raise RuntimeError(
+                    f"Could not cache history of conversation {conversation_id}"
+                )
+        queued = await async_enqueue_conversation_write(
+            build_insert_operation(conversation_id, seq, bot_id, user_id, entry)
+        )
+        from .tasks import schedule_conversation_flush
+
+        await asyncio.to_thread(schedule_conversation_flush, queued)
+        return conversation_id
+
+
+def get_conversation_summary(conversation_id):
     with get_db() as db:
-        conversation_id = get_conversation_id(bot_id, user_id)
-        if conversation_id:
-            new_conversation = ChatConversation(
+        return db.get(ConversationSummary, conversation_id)
+
+
+def save_conversation_summary(conversation_id, summary, last_seq):
+    token_count = count_message_tokens(summary)
+    with get_db() as db:
+        db.merge(
+            ConversationSummary(
                 conversation_id=conversation_id,
-                bot_id=bot_id,
-                user_id=user_id,
-                message=message,
-                is_request=is_request,
-                is_completed=not is_request,
+                summary=summary,
+                last_seq=last_seq,
+                token_count=token_count,
             )
-            db.add(new_conversation)
-            db.commit()
-            db.refresh(new_conversation)
-            return conversation_id
+        )
+        db.commit()
+    set_history_summary(conversation_id, summary, last_seq, token_count)
+    logger.info(f"Saved summary of conversation {conversation_id} up to message {last_seq}")
 
 
-def convert_conversation_to_messages(conversation):
-    messages = [{"role": "system", "content": settings.system_prompt}]
+def convert_conversation_to_messages(conversation, summary=None):
+    # history only: each stage adds its own system prompt, see prompts.py
+    messages = []
+    if summary is not None:
+        messages.append(build_summary_message(summary))
 
     for msg in conversation:
-        role = "user" if msg.is_request else "assistant"
-        messages.append({"role": role, "content": msg.message})
+        role = "user" if msg["is_request"] else "assistant"
+        # the stored count lets stages budget the history without re-counting;
+        # prompts.py drops it before the messages are sent
+        messages.append(
+            {"role": role, "content": msg["message"], "token_count": msg["token_count"]}
+        )
 
     return messages
 
 
+def get_conversation_history(conversation_id, token_budget=settings.history_token_budget):
+    """Return the prompt messages and the older messages left out of them.
+
+    The prompt holds the rolling summary plus the newest messages that fit in
+    `token_budget` together with it. The left-out messages are the ones the
+    summary still has to absorb.
+    """
+    cached = get_history_entries(conversation_id)
+    if cached is None:
+        load_conversation_into_cache(conversation_id)
+        cached = get_history_entries(conversation_id)
+    if cached is None or not cached[1]:
+        return None, []
+
+    meta, conversation = cached
+    start = get_recent_start(
+        [msg["token_count"] for msg in conversation],
+        token_budget - meta["summary_tokens"],
+    )
+    return (
+        convert_conversation_to_messages(conversation[start:], summary=meta["summary"]),
+        conversation[:start],
+    )
+
+
 def get_messages_from_conversation(conversation_id):
-    conversation = get_conversation_by_id(conversation_id)
-    if conversation:
-        return convert_conversation_to_messages(conversation)
+    messages, _ = get_conversation_history(conversation_id)
+    return messages
 
 
 # document's CRUD operations
-def insert_document(title, content):
+def insert_document(title, content, bot_id="Meddy"):
     with get_db() as db:
-        new_doc = Document(title=title, content=content)
+        new_doc = Document(title=title, content=content, bot_id=bot_id)
         db.add(new_doc)
         db.commit()
         db.refresh(new_doc)
         logger.info(f"Inserted document {new_doc.title} with ID: {new_doc.id}")
         return new_doc
+
+
+def insert_documents(documents):
+    # one transaction and one multi-row INSERT ... RETURNING for the whole batch
+    with get_db() as db:
+        doc_ids = db.scalars(
+            insert(Document).returning(Document.id, sort_by_parameter_order=True),
+            [
+                {"title": doc["title"], "content": doc["content"], "bot_id": doc["bot_id"]}
+                for doc in documents
+            ],
+        ).all()
+        db.commit()
+        logger.info(f"Inserted batch of {len(doc_ids)} documents")
+        return [{**doc, "doc_id": str(doc_id)} for doc_id, doc in zip(doc_ids, documents)]
+
+
+def update_document(doc_id, title, content, bot_id=None):
+    with get_db() as db:
+        doc = db.get(Document, int(doc_id))
+        if doc is None:
+            logger.warning(f"No document found with ID: {doc_id}")
+            return None
+        doc.title = title
+        doc.content = content
+        if bot_id is not None:
+            doc.bot_id = bot_id
+        db.commit()
+        db.refresh(doc)
+        logger.info(f"Updated document {doc.title} with ID: {doc.id}")
+        return doc
+
+
+def delete_document(doc_id):
+    with get_db() as db:
+        doc = db.get(Document, int(doc_id))
+        if doc is None:
+            logger.warning(f"No document found with ID: {doc_id}")
+            return False
+        db.delete(doc)
+        db.commit()
+        logger.info(f"Deleted document with ID: {doc_id}")
+        return True
@@ -0,0 +1,233 @@
+"""Assembly of the chat messages every pipeline stage sends to the LLM.
+
+Stages pass their own system prompt, their user content and the conversation
+history as loaded from the store. The history is split into system notes (the
+rolling summary) and user/assistant turns; copies of a system prompt that
+ended up in the history are dropped, so no prompt is sent twice. Tokens
+assembled and saved are counted per stage.
+
+Messages are laid out for provider-side prefix caching: the static system
+prompt comes first and is byte-identical across requests, then the notes and
+turns, and the per-request content last. The cached tokens reported for each
+call are recorded in Redis, per stage.
+"""
+
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from loguru import logger
+
+from .cache import get_async_redis_client, get_redis_client
+from .config import get_backend_settings
+from .history import count_message_tokens, trim_history
+
+settings = get_backend_settings()
+
+PROMPT_USAGE_KEY = "prompts:usage"
+# part of every memoized stage's version: bump it whenever a change here
+# alters the messages sent for the same inputs, so no stale result is served
+PROMPT_ASSEMBLY_VERSION = "1"
+
+_stats_lock = threading.Lock()
+_prompt_stats: defaultdict[str, dict[str, int]] = defaultdict(
+    lambda: {"calls": 0, "prompt_tokens": 0, "saved_tokens": 0}
+)
+
+
+@lru_cache(maxsize=256)
+def count_text_tokens(text):
+    # system prompts and templates are identical on every call
+    return count_message_tokens(text)
+
+
+def count_prompt_tokens(messages):
+    return sum(count_text_tokens(msg.get("content") or "") for msg in messages)
+
+
+def get_history_context(history, system_prompt=None, budget=None):
+    """Split history into (system notes, turns, tokens of dropped system content).
+
+    System messages repeating the stage's or the answer system prompt are
+    dropped, as are repeated notes. With a budget, only the newest turns that
+    fit are kept.
+    """
+    duplicates = {settings.system_prompt, system_prompt}
+    notes, turns, saved_tokens = [], [], 0
+    for msg in history or []:
+        role, content = msg.get("role"), msg.get("content") or ""
+        if role == "system":
+            if content in duplicates or content in notes:
+                saved_tokens += count_text_tokens(content)
+            else:
+                notes.append(content)
+        elif role in ("user", "assistant"):
+            turns.append(msg)
+    if budget is not None:
+        turns = trim_history(turns, budget)
+    turns = [{"role": msg["role"], "content": msg.get("content") or ""} for msg in turns]
+    return notes, turns, saved_tokens
+
+
+def format_history_text(notes, turns):
+    # same "role: content" lines as the prompts used before, summary first
+    lines = [f"summary: {note}" for note in notes]
+    lines += [f"{msg['role']}: {msg['content']}" for msg in turns]
+    return "".join(f"{line}\n" for line in lines)
+
+
+@lru_cache(maxsize=64)
+def check_static_prefix(stage, system_prompt):
+    # runs once per stage and prompt; shorter prefixes are never cached
+    tokens = count_text_tokens(system_prompt)
+    if tokens < settings.prompt_cache_min_tokens:
+        logger.info(
+            f"{stage} static prefix is {tokens} tokens, below the "
+            f"{settings.prompt_cache_min_tokens} token prompt caching threshold"
+        )
+    return tokens
+
+
+def assemble_messages(stage, system_prompt, user_content, notes=(), turns=(), saved_tokens=0):
+    check_static_prefix(stage, system_prompt)
+    messages = [{"role": "system", "content": system_prompt}]
+    messages += [{"role": "system", "content": note} for note in notes]
+    messages += turns
+    messages.append({"role": "user", "content": user_content})
+    record_prompt_stats(stage, count_prompt_tokens(messages), saved_tokens)
+    return messages
+
+
+def assemble_chat_messages(stage, system_prompt, user_content, history=None):
+    """Messages for a stage that sends the history as chat turns."""
+    notes, turns, saved_tokens = get_history_context(history, system_prompt)
+    return assemble_messages(
+        stage, system_prompt, user_content, notes, turns, saved_tokens
+    )
+
+
+def assemble_templated_messages(
+    stage, system_prompt, template, history=None, budget=None, **fields
+):
+    """Messages for a stage that formats the history into its user prompt.
+
+    The template receives the history as `history_messages`.
+    """
+    notes, turns, saved_tokens = get_history_context(history, system_prompt, budget)
+    user_content = template.format(
+        history_messages=format_history_text(notes, turns), **fields
+    )
+    return assemble_messages(stage, system_prompt, user_content, saved_tokens=saved_tokens)
+
+
+def record_prompt_stats(stage, prompt_tokens, saved_tokens):
+    with _stats_lock:
+        stats = _prompt_stats[stage]
+        stats["calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["saved_tokens"] += saved_tokens
+    if saved_tokens:
+        logger.info(
+            f"{stage} prompt: {prompt_tokens} tokens, {saved_tokens} tokens of "
+            f"duplicated system content dropped"
+        )
+
+
+def get_prompt_stats():
+    with _stats_lock:
+        return {stage: dict(stats) for stage, stats in _prompt_stats.items()}
+
+
+def _queue_usage(pipe, stage, usage, latency):
+    # queues the counters on a sync or asyncio pipeline
+    details = usage.prompt_tokens_details
+    cached_tokens = (details.cached_tokens or 0) if details else 0
+    # latency is split by whether the prompt cache was hit, to measure the gain
+    bucket = "cached" if cached_tokens else "uncached"
+    logger.info(
+        f"{stage} call: {cached_tokens}/{usage.prompt_tokens} prompt tokens cached, "
+        f"{latency:.2f}s"
+    )
+    pipe.hincrby(PROMPT_USAGE_KEY, f"{stage}:calls", 1)
+    pipe.hincrby(PROMPT_USAGE_KEY, f"{stage}:prompt_tokens", usage.prompt_tokens)
+    pipe.hincrby(PROMPT_USAGE_KEY, f"{stage}:cached_tokens", cached_tokens)
+    pipe.hincrby(
+        PROMPT_USAGE_KEY, f"{stage}:completion_tokens", usage.completion_tokens
+    )
+    pipe.hincrby(PROMPT_USAGE_KEY, f"{stage}:{bucket}_calls", 1)
+    pipe.hincrbyfloat(PROMPT_USAGE_KEY, f"{stage}:{bucket}_latency", latency)
+
+
+def record_usage(stage, usage, latency):
+    """Record the token usage and latency of one completion call."""
+    if usage is None:
+        return
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        _queue_usage(pipe, stage, usage, latency)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not record prompt usage: {e}")
+
+
+async def async_record_usage(stage, usage, latency):
+    """Async variant of record_usage, for calls made on the event loop."""
+    if usage is None:
+        return
+    try:
+        pipe = get_async_redis_client().pipeline(transaction=False)
+        _queue_usage(pipe, stage, usage, latency)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not record prompt usage: {e}")
+
+
+def get_usage_stats():
+    totals = defaultdict(
+        lambda: {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+            "cached_calls": 0,
+            "uncached_calls": 0,
+            "cached_latency": 0.0,
+            "uncached_latency": 0.0,
+        }
+    )
+    for field, value in get_redis_client().hgetall(PROMPT_USAGE_KEY).items():
+        stage, kind = field.decode().rsplit(":", 1)
+        totals[stage][kind] = float(value) if kind.endswith("latency") else int(value)
+
+    stats = {}
+    for stage, counts in totals.items():
+        cached_latency = (
+            counts["cached_latency"] / counts["cached_calls"]
+            if counts["cached_calls"]
+            else None
+        )
+        uncached_latency = (
+            counts["uncached_latency"] / counts["uncached_calls"]
+            if counts["uncached_calls"]
+            else None
+        )
+        stats[stage] = {
+            "calls": counts["calls"],
+            "prompt_tokens": counts["prompt_tokens"],
+            "cached_tokens": counts["cached_tokens"],
+            "completion_tokens": counts["completion_tokens"],
+            "cache_hit_ratio": (
+                counts["cached_tokens"] / counts["prompt_tokens"]
+                if counts["prompt_tokens"]
+                else 0.0
+            ),
+            "avg_latency_cached": cached_latency,
+            "avg_latency_uncached": uncached_latency,
+            # estimated from the mean latency difference between the two groups
+            "latency_saved": (
+                (uncached_latency - cached_latency) * counts["cached_calls"]
+                if cached_latency is not None and uncached_latency is not None
+                else None
+            ),
+        }
+    return stats
@@ -2,23 +2,53 @@ import cohere
 import yaml
 from loguru import logger
 
+from .clients import get_client
 from .config import get_backend_settings
 
 settings = get_backend_settings()
 
 
+def create_cohere_client():
+    api_key = settings.cohere_api_key
+    if not api_key:
+        raise ValueError("COHERE_API_KEY environment variable not set.")
+    return cohere.Client(api_key, timeout=settings.cohere_timeout)
+
+
+def create_async_cohere_client():
+    api_key = settings.cohere_api_key
+    if not api_key:
+        raise ValueError("COHERE_API_KEY environment variable not set.")
+    return cohere.AsyncClient(api_key, timeout=settings.cohere_timeout)
+
+
 def get_cohere_client():
     try:
-        api_key = settings.cohere_api_key
-        if not api_key:
-            raise ValueError("COHERE_API_KEY environment variable not set.")
-        client = cohere.Client(api_key)
-        return client
+        return get_client("cohere", create_cohere_client)
     except Exception as e:
         logger.error(f"Error initializing Cohere client: {e}")
         raise
 
 
+def get_async_cohere_client():
+    try:
+        return get_client("async_cohere", create_async_cohere_client)
+    except Exception as e:
+        logger.error(f"Error initializing async Cohere client: {e}")
+        raise
+
+
+def build_rerank_context(documents, reranked_documents):
+    rerank_context = "\n\n".join(
+        [
+            f"#Rank {rank} (Relevance Score = {doc.relevance_score:.3f}):\nTitle: {documents[doc.index]['title']}\nContent: {documents[doc.index]['content']}"
+            for rank, doc in enumerate(reranked_documents, start=1)
+        ]
+    )
+    logger.info(f"Reranked {len(reranked_documents)} docs: {rerank_context}")
+    return rerank_context
+
+
 def rerank_documents(query, documents, model=settings.cohere_rerank_model, top_n=3):
     try:
         client = get_cohere_client()
@@ -29,15 +59,26 @@ def rerank_documents(query, documents, model=settings.cohere_rerank_model, top_n
         ).results
         logger.debug(f"Reranked documents: {reranked_documents}")
 
-        rerank_context = "\n\n".join(
-            [
-                f"#Rank {rank} (Relevance Score = {doc.relevance_score:.3f}):\nTitle: {documents[doc.index]['title']}\nContent: {documents[doc.index]['content']}"
-                for rank, doc in enumerate(reranked_documents, start=1)
-            ]
+        return reranked_documents, build_rerank_context(documents, reranked_documents)
+    except Exception as e:
+        logger.error(f"Error reranking documents: {e}")
+        raise
+
+
+async def async_rerank_documents(
+    query, documents, model=settings.cohere_rerank_model, top_n=3
+):
+    try:
+        client = get_async_cohere_client()
+        yaml_docs = [yaml.dump(doc, sort_keys=False) for doc in documents]
+
+        response = await client.rerank(
+            query=query, documents=yaml_docs, model=model, top_n=top_n
         )
-        logger.info(f"Reranked {len(reranked_documents)} docs: {rerank_context}")
+        reranked_documents = response.results
+        logger.debug(f"Reranked documents: {reranked_documents}")
 
-        return reranked_documents, rerank_context
+        return reranked_documents, build_rerank_context(documents, reranked_documents)
     except Exception as e:
         logger.error(f"Error reranking documents: {e}")
         raise
@@ -1,4 +1,4 @@
-from typing import Dict, Optional
+from typing import Any, Dict, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -18,3 +18,26 @@ class CompleteRequest(BaseModel):
     metadata: Optional[Dict] = Field(
         None, description="Additional metadata for the request."
     )
+    search_filter: Optional[Dict[str, Any]] = Field(
+        None,
+        description="Payload filter for retrieval, e.g. {'doc_id': ['1', '2']}. Always scoped to bot_id.",
+    )
+
+
+class DocumentCreate(BaseModel):
+    title: str = Field(..., max_length=255, description="The title of the document.")
+    content: str = Field(..., min_length=1, description="The document content.")
+    bot_id: str = Field(
+        default="Meddy",
+        max_length=100,
+        description="Bot/tenant the document belongs to, used to filter retrieval.",
+    )
+
+
+class RouteRewriteResult(BaseModel):
+    route: Literal["medical", "general"] = Field(
+        ..., description="The detected intent of the latest user message."
+    )
+    rewritten_question: str = Field(
+        ..., min_length=1, description="The latest message as a standalone question."
+    )
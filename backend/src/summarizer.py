@@ -1,22 +1,84 @@
+import json
+
 from loguru import logger
 
 from .brain import openai_chat_complete
+from .config import get_backend_settings
+from .prompts import assemble_messages, assemble_templated_messages
+
+settings = get_backend_settings()
+
+SUMMARY_SYSTEM_PROMPT = "You are an AI assistant in summarizing conversations. Your task is to provide concise summaries that capture the main points of the conversation while retaining all essential information."
+
+
+def build_summary_messages(text):
+    return assemble_messages(
+        "summary", SUMMARY_SYSTEM_PROMPT, f"Conversation Content:\n:{text}\n\nOutput:\n"
+    )
 
 
 def get_summarized_content(text):
     try:
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an AI assistant in summarizing conversations. Your task is to provide concise summaries that capture the main points of the conversation while retaining all essential information.",
-            },
-            {
-                "role": "user",
-                "content": f"Conversation Content:\n:{text}\n\nOutput:\n",
-            },
-        ]
-
-        return openai_chat_complete(messages, temperature=0.5, max_tokens=512)
+        messages = build_summary_messages(text)
+        return openai_chat_complete(
+            messages, temperature=0.5, max_tokens=512, stage="summary"
+        )
     except Exception as e:
         logger.error(f"Error summarizing text: {e}")
         raise
+
+
+def get_summarized_contents(texts):
+    # one LLM call for a batch of answers; falls back to one call per answer
+    # when the output does not line up with the input
+    if len(texts) <= 1:
+        return [get_summarized_content(text) for text in texts]
+    try:
+        numbered = "\n\n".join(
+            f"[{i}]\n{text}" for i, text in enumerate(texts, start=1)
+        )
+        messages = assemble_messages(
+            "summary_batch",
+            SUMMARY_SYSTEM_PROMPT,
+            f"Summarize each of the {len(texts)} numbered conversation contents below separately. Respond with only a JSON object of the form {{\"summaries\": [\"<summary 1>\", ...]}} with exactly one summary per content, in order.\n\n{numbered}",
+        )
+        response = openai_chat_complete(
+            messages,
+            temperature=0.5,
+            max_tokens=512 * len(texts),
+            response_format={"type": "json_object"},
+            stage="summary_batch",
+        )
+        summaries = json.loads(response)["summaries"]
+        if len(summaries) == len(texts) and all(
+            isinstance(summary, str) and summary for summary in summaries
+        ):
+            return summaries
+        logger.warning(
+            f"Batch summary returned {len(summaries)} items for {len(texts)} texts"
+        )
+    except Exception as e:
+        logger.warning(f"Batch summarization failed, summarizing one by one: {e}")
+    return [get_summarized_content(text) for text in texts]
+
+
+def update_rolling_summary(summary, messages):
+    # folds the new turns into the existing summary instead of re-reading the
+    # whole conversation, so the call stays small however long it runs
+    try:
+        prompt_messages = assemble_templated_messages(
+            "rolling_summary",
+            SUMMARY_SYSTEM_PROMPT,
+            settings.rolling_summary_prompt,
+            history=messages,
+            summary=summary or "(empty)",
+        )
+        return openai_chat_complete(
+            prompt_messages,
+            temperature=0.3,
+            max_tokens=settings.history_summary_max_tokens,
+            stage="rolling_summary",
+        )
+    except Exception as e:
+        logger.error(f"Error updating rolling summary: {e}")
+        raise
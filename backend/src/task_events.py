@@ -0,0 +1,97 @@
+import asyncio
+from collections import defaultdict
+
+import redis.asyncio as aioredis
+from loguru import logger
+
+from .cache import REDIS_DB, REDIS_HOST, REDIS_PORT, get_redis_client
+
+TASK_DONE_CHANNEL = "task_done"
+
+
+def publish_task_done(task_id, state):
+    try:
+        get_redis_client().publish(f"{TASK_DONE_CHANNEL}:{task_id}", state)
+    except Exception as e:
+        # waiting clients still see the result when their wait times out
+        logger.warning(f"Could not publish completion of task {task_id}: {e}")
+
+
+class TaskCompletionNotifier:
+    """Wakes waiters when a task's completion is published.
+
+    One pattern subscription per API process serves every waiting request, so
+    adding clients costs a future each instead of a Redis connection or poll.
+    """
+
+    def __init__(self, host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB):
+        self.host, self.port, self.db = host, port, db
+        self._waiters = defaultdict(set)
+        self._listener = None
+        # set while the pattern subscription is active
+        self._subscribed = asyncio.Event()
+
+    def register(self, task_id):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[task_id].add(future)
+        return future
+
+    def unregister(self, task_id, future):
+        waiters = self._waiters.get(task_id)
+        if waiters is not None:
+            waiters.discard(future)
+            if not waiters:
+                del self._waiters[task_id]
+
+    def dispatch(self, task_id, state):
+        for future in self._waiters.pop(task_id, ()):
+            if not future.done():
+                future.set_result(state)
+
+    async def _listen(self):
+        while True:
+            client = aioredis.Redis(host=self.host, port=self.port, db=self.db)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(f"{TASK_DONE_CHANNEL}:*")
+                    self._subscribed.set()
+                    async for message in pubsub.listen():
+                        if message["type"] != "pmessage":
+                            continue
+                        task_id = message["channel"].decode().split(":", 1)[1]
+                        self.dispatch(task_id, message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Task completion listener failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                # completions published until the next psubscribe are missed
+                self._subscribed.clear()
+                await client.aclose()
+
+    async def wait_subscribed(self, timeout):
+        """Wait until published completions reach the waiters."""
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def wait(self, future, timeout):
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+_notifier = None
+
+
+def get_task_notifier():
+    global _notifier
+    if _notifier is None:
+        _notifier = TaskCompletionNotifier()
+    return _notifier
@@ -1,137 +1,341 @@
-import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from celery import shared_task
+from celery.signals import task_postrun
 from loguru import logger
 
 from .agent import ai_agent_handle
-from .brain import (detect_route, enhance_query_quality,
-                    get_tavily_agent_answer, openai_chat_complete,
-                    openai_generate_embedding)
+from .answer_cache import (invalidate_cached_answers, lookup_cached_answer,
+                           store_cached_answer)
+from .brain import (detect_route, detect_route_and_rewrite,
+                    enhance_query_quality, get_tavily_agent_answer,
+                    openai_chat_complete, openai_chat_complete_stream)
+from .cache import (acquire_history_summary_lock, enqueue_pending_summary,
+                    get_conversation_write_count, get_history_entries,
+                    get_pending_summary_count, pop_pending_summaries,
+                    release_history_summary_lock, requeue_pending_summaries,
+                    update_ingest_job)
 from .chunking import dynamic_chunking
 from .config import get_backend_settings
 from .database import get_celery_app
-from .models import get_messages_from_conversation, update_conversation
+from .embedding_cache import get_cached_embedding, get_cached_embeddings
+from .intent_router import embedding_detect_route
+from .models import (add_assistant_message, convert_conversation_to_messages,
+                     flush_conversation_writes, get_conversation_history,
+                     get_conversation_messages, save_conversation_summary,
+                     update_conversation, update_conversation_message)
+from .prompts import assemble_chat_messages
 from .rerank import rerank_documents
-from .summarizer import get_summarized_content
-from .vectorize import search_vectors, upsert_points
+from .summarizer import get_summarized_contents, update_rolling_summary
+from .task_events import publish_task_done
+from .utils import generate_chunk_id
+from .vectorize import (delete_stale_document_points, get_document_point_ids,
+                        get_document_tenant, search_vectors,
+                        set_document_payload, upsert_points)
 
 settings = get_backend_settings()
 
 celery_app = get_celery_app(__name__)
 celery_app.autodiscover_tasks()
 
+_stage_executor = None
 
-@shared_task
-def chunk_and_index_document(doc_id, title, content):
-    try:
-        # Chunk the document
-        nodes = dynamic_chunking(
-            text=content, metadata={"doc_id": doc_id, "title": title}
+
+@task_postrun.connect
+def notify_task_done(task_id=None, state=None, **kwargs):
+    # postrun fires after the result is stored, so woken waiters can read it
+    publish_task_done(task_id, state)
+
+
+def get_stage_executor():
+    # created lazily so each (forked) worker process gets its own threads
+    global _stage_executor
+    if _stage_executor is None:
+        _stage_executor = ThreadPoolExecutor(
+            max_workers=settings.stage_max_workers, thread_name_prefix="chat-stage"
         )
+    return _stage_executor
+
 
-        # Generate embeddings and prepare points for upsert
-        points = []
+def chunk_documents(documents):
+    # chunk id -> node, keyed on doc_id + chunk content so identical chunks collapse
+    chunks = {}
+    tenant_field = settings.qdrant_tenant_field
+    for document in documents:
+        metadata = {"doc_id": document["doc_id"], "title": document["title"]}
+        if document.get(tenant_field):
+            metadata[tenant_field] = document[tenant_field]
+        nodes = dynamic_chunking(text=document["content"], metadata=metadata)
         for node in nodes:
-            embedding = openai_generate_embedding(
-                node.text, model=settings.openai_embedding_model
-            )
-            point = {
-                "id": str(uuid.uuid4()),
+            chunks[generate_chunk_id(document["doc_id"], node.text)] = node
+    return chunks
+
+
+def iter_chunk_points(chunks, batch_size=settings.embedding_batch_size):
+    # chunks are embedded one batch at a time as the upsert consumes the
+    # points, so only a few batches of vectors are held in memory
+    payload_fields = ["doc_id", "title", settings.qdrant_tenant_field]
+    chunk_ids = list(chunks)
+    for start in range(0, len(chunk_ids), batch_size):
+        batch_ids = chunk_ids[start : start + batch_size]
+        embeddings = get_cached_embeddings(
+            [chunks[chunk_id].text for chunk_id in batch_ids],
+            model=settings.openai_embedding_model,
+        )
+        for chunk_id, embedding in zip(batch_ids, embeddings):
+            yield {
+                "id": chunk_id,
                 "embedding": embedding,
                 "metadata": {
-                    "doc_id": doc_id,
-                    "title": title,
-                    "content": node.text,
+                    **{
+                        field: chunks[chunk_id].metadata[field]
+                        for field in payload_fields
+                        if field in chunks[chunk_id].metadata
+                    },
+                    "content": chunks[chunk_id].text,
                 },
             }
-            points.append(point)
 
-        # Upsert points to Qdrant vector database
-        upsert_points(points, collection_name=settings.default_collection_name)
+
+def embed_and_upsert_chunks(chunks):
+    if not chunks:
+        return 0
+    # Stream points to Qdrant vector database in batches
+    return upsert_points(
+        iter_chunk_points(chunks), collection_name=settings.default_collection_name
+    )
+
+
+def index_documents(documents):
+    return embed_and_upsert_chunks(chunk_documents(documents))
+
+
+@shared_task
+def chunk_and_index_document(doc_id, title, content, bot_id=None):
+    try:
+        index_documents(
+            [
+                {
+                    "doc_id": doc_id,
+                    "title": title,
+                    "content": content,
+                    settings.qdrant_tenant_field: bot_id,
+                }
+            ]
+        )
     except Exception as e:
         logger.error(f"Error in chunking and indexing document: {e}")
         raise
 
 
+@shared_task
+def index_documents_batch(documents, job_id=None):
+    try:
+        num_points = index_documents(documents)
+        logger.info(f"Indexed {len(documents)} documents into {num_points} points")
+        if job_id:
+            update_ingest_job(job_id, indexed=len(documents))
+    except Exception as e:
+        logger.error(f"Error indexing batch of {len(documents)} documents: {e}")
+        if job_id:
+            update_ingest_job(job_id, failed=len(documents))
+        raise
+
+
+@shared_task
+def reindex_document(doc_id, title, content, bot_id=None):
+    try:
+        # new chunks keep the tenant of the indexed document, or bot-filtered
+        # search would stop returning them
+        if bot_id is None:
+            bot_id = get_document_tenant(doc_id)
+        chunks = chunk_documents(
+            [
+                {
+                    "doc_id": doc_id,
+                    "title": title,
+                    "content": content,
+                    settings.qdrant_tenant_field: bot_id,
+                }
+            ]
+        )
+        existing_ids = set(get_document_point_ids(doc_id))
+
+        # only chunks whose content changed get a new id and need embedding
+        new_chunks = {
+            chunk_id: node
+            for chunk_id, node in chunks.items()
+            if chunk_id not in existing_ids
+        }
+        embed_and_upsert_chunks(new_chunks)
+
+        stale_count = len(existing_ids - chunks.keys())
+        if stale_count:
+            delete_stale_document_points(doc_id, keep_ids=list(chunks))
+        payload = {"title": title}
+        if bot_id:
+            payload[settings.qdrant_tenant_field] = bot_id
+        set_document_payload(doc_id, payload)
+        invalidate_cached_answers([doc_id])
+
+        logger.info(
+            f"Re-indexed document {doc_id}: {len(new_chunks)} new chunks, "
+            f"{len(chunks) - len(new_chunks)} unchanged, {stale_count} removed"
+        )
+    except Exception as e:
+        logger.error(f"Error re-indexing document {doc_id}: {e}")
+        raise
+
+
+def resolve_route(history, question):
+    """Return the route and a future holding the rewritten question."""
+    if settings.route_strategy == "combined":
+        try:
+            result = detect_route_and_rewrite(history, question)
+            rewrite_future = Future()
+            rewrite_future.set_result(result.rewritten_question)
+            return result.route, rewrite_future
+        except ValueError as e:
+            logger.warning(f"Invalid route/rewrite output, using separate calls: {e}")
+
+    # routing and rewriting both only depend on (history, question), so the
+    # two calls run concurrently instead of back to back
+    route_fn = (
+        embedding_detect_route
+        if settings.route_strategy == "embedding"
+        else detect_route
+    )
+    executor = get_stage_executor()
+    route_future = executor.submit(route_fn, history, question)
+    rewrite_future = executor.submit(enhance_query_quality, history, question)
+    return route_future.result(), rewrite_future
+
+
 @shared_task()
-def bot_route_answer_message(history, question):
-    # detect the route
-    route = detect_route(history, question)
+def bot_route_answer_message(history, question, search_filter=None):
+    route, rewrite_future = resolve_route(history, question)
+
     logger.info(f"Bot route: {route}")
     if route == "medical":
-        return rag_qa_task(history, question)
-    elif route == "general":
+        return rag_qa_task(
+            history,
+            question,
+            search_filter=search_filter,
+            rewritten_question=rewrite_future.result(),
+        )
+
+    # the rewrite is only used for retrieval
+    rewrite_future.cancel()
+    if route == "general":
         return ai_agent_handle(question)
 
 
-@shared_task
-def rag_qa_task(history, question):
-    try:
-        new_question = enhance_query_quality(history, question)
-        # Generate embedding for question
-        question_embedding = openai_generate_embedding(
-            new_question, model=settings.openai_embedding_model
-        )
+def prepare_rag_answer(history, question, search_filter=None, rewritten_question=None):
+    new_question = rewritten_question or enhance_query_quality(history, question)
+    # Generate embedding for question
+    question_embedding = get_cached_embedding(
+        new_question, model=settings.openai_embedding_model
+    )
+    rag = {
+        "question": new_question,
+        "question_embedding": question_embedding,
+        "cached_answer": lookup_cached_answer(
+            question_embedding, search_filter=search_filter
+        ),
+    }
+    if rag["cached_answer"] is not None:
+        return rag
 
-        # Retrieve top-k most relevant documents
-        relevant_docs = search_vectors(
-            query_vector=question_embedding,
-            top_k=settings.top_k,
-            collection_name=settings.default_collection_name,
+    # Retrieve top-k most relevant documents
+    relevant_docs = search_vectors(
+        query_vector=question_embedding,
+        top_k=settings.top_k,
+        collection_name=settings.default_collection_name,
+        query_filter=search_filter,
+    )
+    logger.info(f"Retrieved {len(relevant_docs)} documents from vector DB")
+
+    # rerank
+    reranked_docs, rerank_context = rerank_documents(new_question, relevant_docs)
+    rag["doc_ids"] = [relevant_docs[doc.index]["doc_id"] for doc in reranked_docs]
+
+    rag["messages"], rag["use_web_search"] = build_rag_messages(
+        history, new_question, reranked_docs, rerank_context
+    )
+    return rag
+
+
+def build_rag_messages(history, new_question, reranked_docs, rerank_context):
+    # Check if RAG results have sufficient confidence. If best score is too low, use web search
+    use_web_search = False
+    if not reranked_docs or (
+        reranked_docs and reranked_docs[0].relevance_score < 0.5
+    ):
+        logger.info(
+            f"RAG confidence low (best score: {reranked_docs[0].relevance_score if reranked_docs else 0}), will use web search as fallback"
         )
-        logger.info(f"Retrieved {len(relevant_docs)} documents from vector DB")
+        use_web_search = True
 
-        # rerank
-        reranked_docs, rerank_context = rerank_documents(new_question, relevant_docs)
+    formatted_context = (
+        rerank_context
+        if reranked_docs
+        else "Can't find relevant documents from knowledge base."
+    )
 
-        # Check if RAG results have sufficient confidence. If best score is too low, use web search
-        use_web_search = False
-        if not reranked_docs or (
-            reranked_docs and reranked_docs[0].relevance_score < 0.5
-        ):
-            logger.info(
-                f"RAG confidence low (best score: {reranked_docs[0].relevance_score if reranked_docs else 0}), will use web search as fallback"
-            )
-            use_web_search = True
+    if use_web_search:
+        user_content = f"RAG Context (can be insufficient):\n{formatted_context}\n\nQuestion: {new_question}\n\nNote: Information in RAG context may be insufficient. Please search for additional information from the internet and ALWAYS provide the source with the full URL."
+    else:
+        user_content = settings.rag_prompt.format(
+            context=formatted_context, question=new_question
+        )
+    messages = assemble_chat_messages(
+        "web_search" if use_web_search else "answer",
+        settings.system_prompt,
+        user_content,
+        history=history,
+    )
+    return messages, use_web_search
 
-        formatted_context = (
-            rerank_context
-            if reranked_docs
-            else "Can't find relevant documents from knowledge base."
+
+def cache_rag_answer(rag, answer, search_filter=None):
+    # web search answers are not cached: their sources are not documents that
+    # a re-index could invalidate
+    if not rag["use_web_search"]:
+        store_cached_answer(
+            rag["question"],
+            rag["question_embedding"],
+            answer,
+            doc_ids=rag["doc_ids"],
+            search_filter=search_filter,
         )
 
-        # Build the message chain
-        messages = [{"role": "system", "content": settings.system_prompt}]
 
-        # Add history to the message chain
-        for msg in history:
-            messages.append({"role": msg["role"], "content": msg["content"]})
+@shared_task
+def rag_qa_task(history, question, search_filter=None, rewritten_question=None):
+    try:
+        rag = prepare_rag_answer(
+            history,
+            question,
+            search_filter=search_filter,
+            rewritten_question=rewritten_question,
+        )
+        if rag["cached_answer"] is not None:
+            return rag["cached_answer"]
 
-        if use_web_search:
+        if rag["use_web_search"]:
             # Use web search with Tavily agent
-            messages.append(
-                {
-                    "role": "user",
-                    "content": f"RAG Context (can be insufficient):\n{formatted_context}\n\nQuestion: {new_question}\n\nNote: Information in RAG context may be insufficient. Please search for additional information from the internet and ALWAYS provide the source with the full URL.",
-                }
-            )
-
-            response = get_tavily_agent_answer(messages)
+            response = get_tavily_agent_answer(rag["messages"])
             logger.info("Response generated with web search fallback")
         else:
             # Use standard RAG response
-            messages.append(
-                {
-                    "role": "user",
-                    "content": settings.rag_prompt.format(
-                        context=formatted_context, question=new_question
-                    ),
-                }
-            )
             response = openai_chat_complete(
-                messages=messages, temperature=0.7, max_tokens=2048
+                messages=rag["messages"],
+                temperature=0.7,
+                max_tokens=2048,
+                stage="answer",
             )
             logger.info("RAG response generated successfully")
+            cache_rag_answer(rag, response, search_filter=search_filter)
 
         return response
 
@@ -140,8 +344,205 @@ def rag_qa_task(history, question):
         raise
 
 
+def stream_rag_answer(history, question, search_filter=None, rewritten_question=None):
+    rag = prepare_rag_answer(
+        history,
+        question,
+        search_filter=search_filter,
+        rewritten_question=rewritten_question,
+    )
+    if rag["cached_answer"] is not None:
+        yield rag["cached_answer"]
+    elif rag["use_web_search"]:
+        # the tool-using agent only returns complete answers
+        yield get_tavily_agent_answer(rag["messages"])
+    else:
+        tokens = []
+        for token in openai_chat_complete_stream(
+            rag["messages"], temperature=0.7, max_tokens=2048, stage="answer"
+        ):
+            tokens.append(token)
+            yield token
+        cache_rag_answer(rag, "".join(tokens), search_filter=search_filter)
+
+
+def persist_assistant_answer(bot_id, user_id, answer):
+    """Store the assistant turn now and schedule its summarization.
+
+    The full answer is written before the response is returned, so a follow-up
+    question always sees the previous turn; the summary only shortens it later.
+    """
+    message_key = add_assistant_message(bot_id, user_id, answer)
+    if message_key is None:
+        return None
+    try:
+        schedule_summary(message_key)
+    except Exception as e:
+        # the unsummarized answer is still a valid history entry
+        logger.error(f"Could not schedule summary of message {message_key}: {e}")
+    return message_key
+
+
+def schedule_summary(message_key, batch_size=settings.summary_batch_size):
+    if batch_size <= 1:
+        summarize_assistant_messages.delay([message_key])
+        return
+
+    queued = enqueue_pending_summary(message_key)
+    if queued == 1:
+        # first of a new batch: flush after a short delay to collect more
+        summarize_assistant_messages.apply_async(
+            countdown=settings.summary_batch_delay
+        )
+    elif queued >= batch_size:
+        summarize_assistant_messages.delay()
+
+
+@shared_task
+def summarize_assistant_messages(message_keys=None):
+    batched = message_keys is None
+    if batched:
+        message_keys = pop_pending_summaries(settings.summary_batch_size)
+    try:
+        messages = get_conversation_messages(message_keys)
+        if messages:
+            summaries = get_summarized_contents(list(messages.values()))
+            for message_key, summary in zip(messages, summaries):
+                update_conversation_message(message_key, summary)
+            logger.info(f"Summarized {len(messages)} assistant messages")
+    except Exception as e:
+        logger.error(f"Error summarizing assistant messages {message_keys}: {e}")
+        if batched:
+            # popped before summarizing; without this the keys would be lost
+            requeue_pending_summaries(message_keys)
+        raise
+    finally:
+        if batched and get_pending_summary_count():
+            summarize_assistant_messages.apply_async(
+                countdown=settings.summary_batch_delay
+            )
+
+
+def schedule_conversation_flush(queued, batch_size=settings.conversation_flush_batch_size):
+    if queued == 1:
+        # first write since the last flush: wait a little to batch more
+        persist_conversation_writes.apply_async(
+            countdown=settings.conversation_flush_delay
+        )
+    elif queued % batch_size == 0:
+        persist_conversation_writes.delay()
+
+
+@shared_task
+def persist_conversation_writes():
+    try:
+        while flush_conversation_writes() == settings.conversation_flush_batch_size:
+            pass
+    except Exception as e:
+        # the operations stay queued and are retried by the next flush
+        logger.error(f"Error writing conversations to Postgres: {e}")
+        raise
+    finally:
+        if get_conversation_write_count():
+            persist_conversation_writes.apply_async(
+                countdown=settings.conversation_flush_delay
+            )
+
+
+def load_conversation_history(conversation_id):
+    """Return the budgeted prompt history, scheduling a summary of older turns."""
+    messages, older = get_conversation_history(conversation_id)
+    try:
+        schedule_history_summary(conversation_id, older)
+    except Exception as e:
+        # the prompt stays within budget, only the summary lags behind
+        logger.error(f"Could not schedule summary of conversation {conversation_id}: {e}")
+    return messages
+
+
+def schedule_history_summary(conversation_id, older):
+    pending_tokens = sum(msg["token_count"] for msg in older)
+    if pending_tokens < settings.history_summary_min_tokens:
+        return
+    if acquire_history_summary_lock(
+        conversation_id, ttl_seconds=settings.history_summary_lock_ttl
+    ):
+        update_conversation_summary.delay(conversation_id, older[-1]["seq"])
+
+
+@shared_task
+def update_conversation_summary(conversation_id, until_seq):
+    try:
+        cached = get_history_entries(conversation_id)
+        if cached is None:
+            # the conversation has ended, its history will not be sent again
+            logger.info(f"History of {conversation_id} expired, summary skipped")
+            return
+        meta, conversation = cached
+        conversation = [msg for msg in conversation if msg["seq"] <= until_seq]
+        if conversation:
+            save_conversation_summary(
+                conversation_id,
+                update_rolling_summary(
+                    meta["summary"] or "",
+                    convert_conversation_to_messages(conversation),
+                ),
+                conversation[-1]["seq"],
+            )
+    except Exception as e:
+        logger.error(f"Error updating summary of conversation {conversation_id}: {e}")
+        raise
+    finally:
+        release_history_summary_lock(conversation_id)
+
+
+def persist_streamed_answer(bot_id, user_id, conversation_id, tokens):
+    answer = "".join(tokens)
+    if answer:
+        logger.info(f"Streamed response for conversation {conversation_id}:\n{answer}")
+        persist_assistant_answer(bot_id, user_id, answer)
+
+
+def stream_message_handler(bot_id, user_id, query, search_filter=None):
+    """Yield answer tokens as they are generated and persist the full answer.
+
+    Runs in the API process instead of a Celery worker so that tokens reach the
+    client as soon as the model produces them.
+    """
+    conversation_id = update_conversation(bot_id, user_id, query, is_request=True)
+    history = load_conversation_history(conversation_id)[:-1]
+
+    route, rewrite_future = resolve_route(history, query)
+    logger.info(f"Bot route: {route}")
+
+    tokens = []
+    try:
+        if route == "medical":
+            for token in stream_rag_answer(
+                history,
+                query,
+                search_filter=search_filter,
+                rewritten_question=rewrite_future.result(),
+            ):
+                tokens.append(token)
+                yield token
+        else:
+            rewrite_future.cancel()
+            answer = ai_agent_handle(query)
+            tokens.append(answer)
+            yield answer
+    except GeneratorExit:
+        # a client disconnecting mid-stream closes the generator; the tokens it
+        # already received still become the assistant turn
+        persist_streamed_answer(bot_id, user_id, conversation_id, tokens)
+        raise
+    # on an error the client gets an error event instead and, as with
+    # message_handler_task, no assistant turn is stored
+    persist_streamed_answer(bot_id, user_id, conversation_id, tokens)
+
+
 @shared_task
-def message_handler_task(bot_id, user_id, query):
+def message_handler_task(bot_id, user_id, query, search_filter=None):
     logger.info(f"▶ Message handler started: {bot_id}/{user_id}")
 
     try:
@@ -149,19 +550,18 @@ def message_handler_task(bot_id, user_id, query):
         conversation_id = update_conversation(bot_id, user_id, query, is_request=True)
 
         # Retrieve conversation history
-        messages = get_messages_from_conversation(conversation_id)
+        messages = load_conversation_history(conversation_id)
         logger.info(
             f"Conversation {conversation_id}: {len(messages)} messages in history"
         )
 
         history = messages[:-1]
         # Get answer from RAG
-        answer = bot_route_answer_message(history, query)
+        answer = bot_route_answer_message(history, query, search_filter=search_filter)
         logger.info(f"Generated response for conversation {conversation_id}:\n{answer}")
 
-        # Summarize and save the response
-        summarized_answer = get_summarized_content(answer)
-        update_conversation(bot_id, user_id, summarized_answer, is_request=False)
+        # saved as is; the summary replaces it in the background
+        persist_assistant_answer(bot_id, user_id, answer)
 
         logger.info(f"Message handler completed: {bot_id}/{user_id}")
 
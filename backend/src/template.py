@@ -132,13 +132,14 @@ Based on the **context** and **question**, always answer following the response
 # ================= Task Prompt Templates =========================
 
 # RAG answering prompt template
-RAG_PROMPT = """Context:
+# the instructions come first and the per-request context and question last
+RAG_PROMPT = """Answer the question using the context below, following the response structure defined in the system prompt.
+
+Context:
 {context}
 
 Question:
-{question}
-
-Please provide your answer following the response structure defined in the system prompt."""
+{question}"""
 
 
 # rewrite prompt
@@ -177,10 +178,45 @@ Examples:
 Provide only the classification label as your response.
 
 Chat History:
-{history}
+{history_messages}
 
 Latest User Message:
 {message}
 
 Classification (choose one of the labels: "medical" or "general" that best fits the user's intent):
 """
+
+
+# Route detection and query rewriting in a single structured-output call
+ROUTE_AND_REWRITE_PROMPT = """Given the following chat history and the user's latest message, do two things:
+
+1. Classify the user's intent into one of 2 labels:
+- "medical": questions about diseases, symptoms, treatments, medications, dosages, medical procedures, health conditions, medical advice, or any healthcare-related topics.
+- "general": questions about facts, definitions, or general information not related to personal health.
+
+2. Rewrite the latest message as a standalone question in Vietnamese. The user may switch between different medical and healthcare topics, so identify the intent at the current moment and make the question clear, complete, and understandable without the chat history.
+
+Respond with only a JSON object of the form:
+{{"route": "medical" or "general", "rewritten_question": "<standalone question in Vietnamese>"}}
+
+Chat History:
+{history_messages}
+
+Latest User Message:
+{message}
+"""
+
+
+# Rolling summary of the turns that no longer fit in the history budget
+ROLLING_SUMMARY_PROMPT = """Below are the current summary of a conversation between a user and an AI medical assistant, and the turns of the conversation that came after it. Write an updated summary in Vietnamese that merges the new turns into the current summary.
+
+Keep the facts that later questions may depend on: the user's symptoms, conditions, medications, dosages, ages and the topics discussed. Drop greetings, formatting and repeated information. Respond with only the updated summary.
+
+Current Summary:
+{summary}
+
+New Turns:
+{history_messages}
+
+Updated Summary:
+"""
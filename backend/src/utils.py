@@ -1,8 +1,15 @@
 import hashlib
+import re
 import secrets
+import unicodedata
+import uuid
+from functools import lru_cache
 
+import tiktoken
 from loguru import logger
 
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c9a52-3f0e-4d7b-9a41-2b8e5c7d0e13")
+
 
 def generate_hash(length=16):
     return secrets.token_hex(length // 2)
@@ -13,3 +20,30 @@ def generate_request_id(max_length=32):
     h = hashlib.sha256()
     h.update(hash_string.encode("utf-8"))
     return h.hexdigest()[: max_length + 1]
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def generate_chunk_id(doc_id, text):
+    # same document + same chunk content -> same Qdrant point id
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{doc_id}:{hash_text(text)}"))
+
+
+@lru_cache
+def get_tokenizer(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        logger.warning(f"No tokenizer registered for {model}, using cl100k_base")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    return len(get_tokenizer(model).encode(text))
@@ -1,24 +1,149 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import wait as wait_for_futures
+from itertools import islice
+
+import httpx
 from loguru import logger
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, PointStruct, VectorParams
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import (BinaryQuantization, BinaryQuantizationConfig,
+                                  CompressionRatio, Distance, FieldCondition,
+                                  Filter, FilterSelector, HasIdCondition,
+                                  HnswConfigDiff, MatchAny, MatchValue,
+                                  PayloadSchemaType, PointStruct,
+                                  ProductQuantization,
+                                  ProductQuantizationConfig,
+                                  QuantizationSearchParams, ScalarQuantization,
+                                  ScalarQuantizationConfig, ScalarType,
+                                  SearchParams, VectorParams)
 
+from .clients import get_client
 from .config import get_backend_settings
 
 settings = get_backend_settings()
 
 
+def get_qdrant_client_kwargs(host, port):
+    # qdrant-client disables keep-alive unless limits are passed explicitly
+    return {
+        "host": host,
+        "port": port,
+        "timeout": settings.qdrant_timeout,
+        "limits": httpx.Limits(
+            max_connections=settings.qdrant_max_connections,
+            max_keepalive_connections=settings.qdrant_max_keepalive_connections,
+        ),
+    }
+
+
+def create_qdrant_client(host="qdrant_db", port=6333):
+    return QdrantClient(**get_qdrant_client_kwargs(host, port))
+
+
 def get_qdrant_client(host="qdrant_db", port=6333):
     try:
-        client = QdrantClient(host=host, port=port)
-        return client
+        return get_client(
+            f"qdrant:{host}:{port}", lambda: create_qdrant_client(host, port)
+        )
     except Exception as e:
         logger.error(f"Error initializing Qdrant client: {e}")
         raise
 
 
+def get_async_qdrant_client(host="qdrant_db", port=6333):
+    try:
+        return get_client(
+            f"async_qdrant:{host}:{port}",
+            lambda: AsyncQdrantClient(**get_qdrant_client_kwargs(host, port)),
+        )
+    except Exception as e:
+        logger.error(f"Error initializing async Qdrant client: {e}")
+        raise
+
+
+def build_filter(conditions):
+    # {"doc_id": "1", "bot_id": ["a", "b"]} -> doc_id == "1" AND bot_id in (a, b)
+    if conditions is None or isinstance(conditions, Filter):
+        return conditions
+    must = [
+        FieldCondition(
+            key=key,
+            match=(
+                MatchAny(any=list(value))
+                if isinstance(value, (list, tuple, set))
+                else MatchValue(value=value)
+            ),
+        )
+        for key, value in conditions.items()
+    ]
+    return Filter(must=must) if must else None
+
+
+def scope_search_filter(search_filter, bot_id):
+    # the tenant comes from the bot being asked, never from the client filter,
+    # so a request cannot widen retrieval to another bot's documents
+    return {**(search_filter or {}), settings.qdrant_tenant_field: bot_id}
+
+
+def get_payload_index_fields():
+    return {
+        "doc_id": PayloadSchemaType.KEYWORD,
+        "title": PayloadSchemaType.KEYWORD,
+        settings.qdrant_tenant_field: PayloadSchemaType.KEYWORD,
+    }
+
+
+def ensure_payload_indexes(collection_name=settings.default_collection_name):
+    try:
+        client = get_qdrant_client()
+        existing = client.get_collection(collection_name).payload_schema
+        for field_name, field_schema in get_payload_index_fields().items():
+            if field_name in existing:
+                continue
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+            logger.info(f"Created payload index on {collection_name}.{field_name}")
+    except Exception as e:
+        logger.error(f"Error creating payload indexes: {e}")
+        raise
+
+
+def build_quantization_config(
+    quantization,
+    always_ram=settings.qdrant_quantization_always_ram,
+    product_compression=settings.qdrant_product_compression,
+):
+    if not quantization:
+        return None
+    if quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=0.99, always_ram=always_ram
+            )
+        )
+    if quantization == "product":
+        return ProductQuantization(
+            product=ProductQuantizationConfig(
+                compression=CompressionRatio(product_compression),
+                always_ram=always_ram,
+            )
+        )
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=always_ram))
+    raise ValueError(f"Unknown quantization type: {quantization}")
+
+
 def create_collection(
     collection_name=settings.default_collection_name,
     vector_dimension=settings.vector_dimension,
+    quantization=settings.qdrant_quantization,
+    on_disk=settings.qdrant_on_disk_vectors,
+    hnsw_m=settings.qdrant_hnsw_m,
+    hnsw_ef_construct=settings.qdrant_hnsw_ef_construct,
+    quantization_always_ram=settings.qdrant_quantization_always_ram,
 ):
     try:
         client = get_qdrant_client()
@@ -27,16 +152,28 @@ def create_collection(
         ]
 
         if collection_name not in existing_collections:
-            client.recreate_collection(
+            # with on_disk=True only the (optional) quantized vectors stay in RAM
+            client.create_collection(
                 collection_name=collection_name,
                 vectors_config=VectorParams(
-                    size=vector_dimension, distance=Distance.COSINE
+                    size=vector_dimension, distance=Distance.COSINE, on_disk=on_disk
+                ),
+                hnsw_config=HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct),
+                quantization_config=build_quantization_config(
+                    quantization, always_ram=quantization_always_ram
                 ),
             )
-            status = f"Collection {collection_name} created with vector dimensions {vector_dimension} successfully"
+            status = (
+                f"Collection {collection_name} created with vector dimensions {vector_dimension} "
+                f"(quantization={quantization or 'none'}, on_disk={on_disk}, "
+                f"hnsw_m={hnsw_m}, hnsw_ef_construct={hnsw_ef_construct}) successfully"
+            )
+            ensure_payload_indexes(collection_name)
             logger.info(status)
             return status
         else:
+            # older collections may predate the payload indexes
+            ensure_payload_indexes(collection_name)
             status = f"Collection {collection_name} already exists"
             logger.info(status)
             return status
@@ -45,31 +182,120 @@ def create_collection(
         raise
 
 
-def upsert_points(points, collection_name=settings.default_collection_name):
+def iter_point_batches(points, batch_size):
+    points = iter(points)
+    while batch := list(islice(points, batch_size)):
+        yield batch
+
+
+def upsert_batch(client, collection_name, batch, wait, max_retries):
+    point_structs = [
+        PointStruct(
+            id=point["id"],
+            vector=point["embedding"],
+            payload=point["metadata"],
+        )
+        for point in batch
+    ]
+    for attempt in range(1, max_retries + 1):
+        try:
+            return client.upsert(
+                collection_name=collection_name, points=point_structs, wait=wait
+            )
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = 2 ** (attempt - 1)
+            logger.warning(
+                f"Upsert of {len(batch)} points failed (attempt {attempt}/{max_retries}), retrying in {delay}s: {e}"
+            )
+            time.sleep(delay)
+
+
+def upsert_points(
+    points,
+    collection_name=settings.default_collection_name,
+    batch_size=settings.qdrant_upsert_batch_size,
+    parallel=settings.qdrant_upsert_parallel,
+    wait=settings.qdrant_upsert_wait,
+    max_retries=settings.qdrant_upsert_max_retries,
+):
+    # points may be any iterable (e.g. a generator); at most `parallel` batches
+    # are held in memory at a time
     try:
         client = get_qdrant_client()
-        point_structs = [
-            PointStruct(
-                id=point["id"],
-                vector=point["embedding"],
-                payload=point["metadata"],
-            )
-            for i, point in enumerate(points)
-        ]
-        results = client.upsert(collection_name=collection_name, points=point_structs)
+        total, last_batch = 0, None
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            in_flight = set()
+            for batch in iter_point_batches(points, batch_size):
+                if len(in_flight) >= parallel:
+                    done, in_flight = wait_for_futures(
+                        in_flight, return_when=FIRST_COMPLETED
+                    )
+                    for future in done:
+                        future.result()
+                in_flight.add(
+                    executor.submit(
+                        upsert_batch, client, collection_name, batch, wait, max_retries
+                    )
+                )
+                total += len(batch)
+                last_batch = batch
+            for future in wait_for_futures(in_flight).done:
+                future.result()
+
+        if not wait and last_batch:
+            # Consistency barrier: Qdrant applies a collection's updates in WAL
+            # order, so a waited re-upsert of the last batch returns only once
+            # every batch acknowledged before it has been applied.
+            upsert_batch(client, collection_name, last_batch, True, max_retries)
+
         logger.info(
-            f"Upserted {len(points)} points to collection {collection_name} successfully"
+            f"Upserted {total} points to collection {collection_name} successfully"
         )
-        return results
+        return total
     except Exception as e:
         logger.error(f"Error upserting points: {e}")
         raise
 
 
+def build_search_params(
+    hnsw_ef=settings.qdrant_search_hnsw_ef,
+    rescore=settings.qdrant_search_rescore,
+    oversampling=settings.qdrant_search_oversampling,
+):
+    # quantization params are ignored by collections without quantization;
+    # otherwise fetch top_k * oversampling candidates on the quantized
+    # vectors and rescore them with the original ones
+    return SearchParams(
+        hnsw_ef=hnsw_ef,
+        quantization=QuantizationSearchParams(
+            rescore=rescore, oversampling=oversampling
+        ),
+    )
+
+
+def format_search_results(search_result):
+    return [
+        {
+            "id": point.id,
+            "doc_id": point.payload.get("doc_id", ""),
+            "score": point.score,
+            "title": point.payload.get("title", ""),
+            "content": point.payload.get("content", ""),
+        }
+        for point in search_result
+    ]
+
+
 def search_vectors(
     query_vector,
     top_k=settings.top_k,
     collection_name=settings.default_collection_name,
+    hnsw_ef=settings.qdrant_search_hnsw_ef,
+    rescore=settings.qdrant_search_rescore,
+    oversampling=settings.qdrant_search_oversampling,
+    query_filter=None,
 ):
     try:
         client = get_qdrant_client()
@@ -77,16 +303,10 @@ def search_vectors(
             collection_name=collection_name,
             query_vector=query_vector,
             limit=top_k,
+            search_params=build_search_params(hnsw_ef, rescore, oversampling),
+            query_filter=build_filter(query_filter),
         )
-        results = [
-            {
-                "id": point.id,
-                "score": point.score,
-                "title": point.payload.get("title", ""),
-                "content": point.payload.get("content", ""),
-            }
-            for point in search_result
-        ]
+        results = format_search_results(search_result)
         logger.info(
             f"Search in collection {collection_name} returned {len(results)} results"
         )
@@ -94,3 +314,139 @@ def search_vectors(
     except Exception as e:
         logger.error(f"Error searching vectors: {e}")
         raise
+
+
+async def async_search_vectors(
+    query_vector,
+    top_k=settings.top_k,
+    collection_name=settings.default_collection_name,
+    hnsw_ef=settings.qdrant_search_hnsw_ef,
+    rescore=settings.qdrant_search_rescore,
+    oversampling=settings.qdrant_search_oversampling,
+    query_filter=None,
+):
+    try:
+        client = get_async_qdrant_client()
+        search_result = await client.search(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            limit=top_k,
+            search_params=build_search_params(hnsw_ef, rescore, oversampling),
+            query_filter=build_filter(query_filter),
+        )
+        results = format_search_results(search_result)
+        logger.info(
+            f"Search in collection {collection_name} returned {len(results)} results"
+        )
+        return results
+    except Exception as e:
+        logger.error(f"Error searching vectors: {e}")
+        raise
+
+
+def scroll_points(
+    collection_name=settings.default_collection_name,
+    scroll_filter=None,
+    batch_size=256,
+    with_payload=True,
+    with_vectors=False,
+):
+    # yields pages of records so whole collections can be walked in flat memory
+    try:
+        client = get_qdrant_client()
+        offset = None
+        while True:
+            records, offset = client.scroll(
+                collection_name=collection_name,
+                scroll_filter=scroll_filter,
+                limit=batch_size,
+                offset=offset,
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+            )
+            if records:
+                yield records
+            if offset is None:
+                return
+    except Exception as e:
+        logger.error(f"Error scrolling collection {collection_name}: {e}")
+        raise
+
+
+def get_document_point_ids(doc_id, collection_name=settings.default_collection_name):
+    return [
+        str(record.id)
+        for records in scroll_points(
+            collection_name,
+            scroll_filter=build_filter({"doc_id": doc_id}),
+            with_payload=False,
+        )
+        for record in records
+    ]
+
+
+def get_document_tenant(doc_id, collection_name=settings.default_collection_name):
+    # every point of a document carries the same tenant, so one is enough
+    tenant_field = settings.qdrant_tenant_field
+    try:
+        client = get_qdrant_client()
+        records, _ = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=build_filter({"doc_id": doc_id}),
+            limit=1,
+            with_payload=[tenant_field],
+            with_vectors=False,
+        )
+        return records[0].payload.get(tenant_field) if records else None
+    except Exception as e:
+        logger.error(f"Error reading tenant of document {doc_id}: {e}")
+        raise
+
+
+def delete_document_points(doc_id, collection_name=settings.default_collection_name):
+    # resolved through the doc_id payload index, no collection scan
+    try:
+        client = get_qdrant_client()
+        result = client.delete(
+            collection_name=collection_name,
+            points_selector=FilterSelector(filter=build_filter({"doc_id": doc_id})),
+        )
+        logger.info(f"Deleted points of document {doc_id} from {collection_name}")
+        return result
+    except Exception as e:
+        logger.error(f"Error deleting points of document {doc_id}: {e}")
+        raise
+
+
+def delete_stale_document_points(
+    doc_id, keep_ids, collection_name=settings.default_collection_name
+):
+    try:
+        client = get_qdrant_client()
+        stale_filter = build_filter({"doc_id": doc_id})
+        if keep_ids:
+            stale_filter.must_not = [HasIdCondition(has_id=list(keep_ids))]
+        result = client.delete(
+            collection_name=collection_name,
+            points_selector=FilterSelector(filter=stale_filter),
+        )
+        logger.info(f"Deleted stale points of document {doc_id} from {collection_name}")
+        return result
+    except Exception as e:
+        logger.error(f"Error deleting stale points of document {doc_id}: {e}")
+        raise
+
+
+def set_document_payload(
+    doc_id, payload, collection_name=settings.default_collection_name
+):
+    try:
+        client = get_qdrant_client()
+        return client.set_payload(
+            collection_name=collection_name,
+            payload=payload,
+            points=build_filter({"doc_id": doc_id}),
+        )
+    except Exception as e:
+        logger.error(f"Error updating payload of document {doc_id}: {e}")
+        raise
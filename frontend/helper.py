@@ -1,5 +1,4 @@
 import json
-import time
 
 import requests
 from loguru import logger
@@ -7,6 +6,7 @@ from tenacity import (retry, retry_if_exception_type, stop_after_attempt,
                       wait_exponential)
 
 CHAT_COMPLETE_ENDPOINT = "http://chatbot_api:8000/chat/complete"
+CHAT_STREAM_ENDPOINT = "http://chatbot_api:8000/chat/stream"
 
 
 @retry(
@@ -82,38 +82,35 @@ def get_chat_complete(query):
         raise
 
 
-def simulate_streaming(text, delay=0.05):
-    if not text or not isinstance(text, str):
-        return
-
-    # Split by space only, preserving newlines
-    current_word = ""
-    for char in text:
-        if char == " ":
-            if current_word:
-                yield current_word
-                current_word = ""
-            yield " "
-            time.sleep(delay)
-        elif char == "\n":
-            if current_word:
-                yield current_word
-                current_word = ""
-            yield "\n"
-            time.sleep(delay)
-        else:
-            current_word += char
+def stream_chat_response(query):
+    payload = {
+        "bot_id": "Meddy",
+        "user_id": "user_1",
+        "user_message": query,
+        "metadata": {"source": "web_app"},
+    }
 
-    # Yield the last word if any
-    if current_word:
-        yield current_word
+    # server-sent events: one `data: {...}` line per token
+    with requests.post(
+        CHAT_STREAM_ENDPOINT, json=payload, stream=True, timeout=(5, 120)
+    ) as response:
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: ") :])
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "error":
+                raise ValueError(event["content"])
+            elif event["type"] == "done":
+                return
 
 
 def streaming_response_generator(query):
     try:
-        response_text = get_chat_complete(query)
-
-        yield from simulate_streaming(response_text)
+        yield from stream_chat_response(query)
 
     except Exception as e:
         logger.error(f"Error in streaming response: {e}")
@@ -25,14 +25,11 @@ if prompt := st.chat_input("Tôi có thể giúp gì cho bạn?"):
 
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
+        message_placeholder.markdown("🤔 Đang suy nghĩ...")
         full_response = ""
 
         try:
             for chunk in streaming_response_generator(prompt):
-                if chunk == ".":
-                    message_placeholder.markdown("🤔 Đang suy nghĩ...")
-                    continue
-
                 full_response += chunk
                 # Display with cursor during streaming
                 message_placeholder.markdown(full_response + "▌")
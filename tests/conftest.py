@@ -11,6 +11,8 @@ sys.path.insert(0, project_root)
 # Set environment variables for testing
 os.environ["TESTING"] = "true"
 os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+# stage memoization would leak results between tests
+os.environ["MEMO_ENABLED"] = "false"
 
 # OpenAI & Cohere API keys (mock values for testing)
 os.environ["OPENAI_API_KEY"] = "test-openai-key"
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+
+def test_answer_cache_scope_depends_on_filter_only():
+    from backend.src.answer_cache import get_answer_cache_scope
+
+    assert get_answer_cache_scope(None) == get_answer_cache_scope({})
+    assert get_answer_cache_scope({"bot_id": "a", "doc_id": "1"}) == get_answer_cache_scope(
+        {"doc_id": "1", "bot_id": "a"}
+    )
+    assert get_answer_cache_scope({"bot_id": "a"}) != get_answer_cache_scope({"bot_id": "b"})
+
+
+@patch("backend.src.answer_cache.ensure_answer_cache_collection")
+@patch("backend.src.answer_cache.get_qdrant_client")
+def test_lookup_cached_answer(mock_client, mock_ensure):
+    from backend.src.answer_cache import lookup_cached_answer
+
+    client = MagicMock()
+    mock_client.return_value = client
+    client.search.return_value = [
+        SimpleNamespace(score=0.97, payload={"question": "q", "answer": "cached answer"})
+    ]
+
+    assert lookup_cached_answer([0.1, 0.2], threshold=0.95) == "cached answer"
+    assert client.search.call_args.kwargs["score_threshold"] == 0.95
+    assert client.search.call_args.kwargs["limit"] == 1
+
+    client.search.return_value = []
+    assert lookup_cached_answer([0.1, 0.2]) is None
+
+    # an unavailable cache must never fail the request
+    client.search.side_effect = RuntimeError("qdrant down")
+    assert lookup_cached_answer([0.1, 0.2]) is None
+
+
+@patch("backend.src.answer_cache.evict_cached_answers")
+@patch("backend.src.answer_cache.ensure_answer_cache_collection")
+@patch("backend.src.answer_cache.get_qdrant_client")
+def test_store_and_invalidate_cached_answer(mock_client, mock_ensure, mock_evict):
+    from backend.src.answer_cache import (invalidate_cached_answers,
+                                          store_cached_answer)
+
+    client = MagicMock()
+    mock_client.return_value = client
+
+    store_cached_answer("q", [0.1, 0.2], "answer", doc_ids=[3, "1", 3])
+    payload = client.upsert.call_args.kwargs["points"][0].payload
+    assert payload["answer"] == "answer"
+    assert payload["doc_ids"] == ["1", "3"]
+    mock_evict.assert_called_once()
+
+    invalidate_cached_answers(["3"])
+    condition = client.delete.call_args.kwargs["points_selector"].filter.must[0]
+    assert condition.key == "doc_ids"
+    assert condition.match.any == ["3"]
+
+
+@patch("backend.src.tasks.search_vectors")
+@patch("backend.src.tasks.lookup_cached_answer", return_value="cached answer")
+@patch("backend.src.tasks.get_cached_embedding", return_value=[0.1, 0.2])
+def test_rag_qa_task_returns_cached_answer(mock_embed, mock_lookup, mock_search):
+    from backend.src.tasks import rag_qa_task
+
+    answer = rag_qa_task([], "Triệu chứng tiểu đường?", rewritten_question="Triệu chứng tiểu đường là gì?")
+
+    assert answer == "cached answer"
+    mock_search.assert_not_called()
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+
+async def _slow_llm(messages, **kwargs):
+    await asyncio.sleep(0.2)
+    return "Sốt là triệu chứng thường gặp."
+
+
+@patch("backend.src.async_pipeline.settings.route_strategy", "llm")
+@patch("backend.src.async_pipeline.persist_assistant_answer")
+@patch("backend.src.async_pipeline.store_cached_answer")
+@patch("backend.src.async_pipeline.async_openai_chat_complete", side_effect=_slow_llm)
+@patch("backend.src.async_pipeline.async_rerank_documents", new_callable=AsyncMock)
+@patch("backend.src.async_pipeline.async_search_vectors", new_callable=AsyncMock)
+@patch("backend.src.async_pipeline.async_lookup_cached_answer", new_callable=AsyncMock)
+@patch("backend.src.async_pipeline.async_get_cached_embedding", new_callable=AsyncMock)
+@patch("backend.src.async_pipeline.async_enhance_query_quality", new_callable=AsyncMock)
+@patch("backend.src.async_pipeline.async_detect_route", new_callable=AsyncMock)
+@patch("backend.src.async_pipeline.load_conversation_history")
+@patch("backend.src.async_pipeline.async_update_conversation", new_callable=AsyncMock)
+def test_async_message_handlers_do_not_block_each_other(
+    mock_update,
+    mock_messages,
+    mock_route,
+    mock_rewrite,
+    mock_embed,
+    mock_lookup,
+    mock_search,
+    mock_rerank,
+    mock_chat,
+    mock_store,
+    mock_persist,
+):
+    from types import SimpleNamespace
+
+    from backend.src.async_pipeline import async_message_handler
+
+    mock_update.return_value = "conversation-1"
+    mock_messages.return_value = [{"role": "user", "content": "Sốt là gì?"}]
+    mock_route.return_value = "medical"
+    mock_rewrite.return_value = "Sốt là gì?"
+    mock_embed.return_value = [0.1, 0.2]
+    mock_lookup.return_value = None
+    mock_search.return_value = [{"doc_id": "1", "title": "Sốt", "content": "..."}]
+    mock_rerank.return_value = ([SimpleNamespace(index=0, relevance_score=0.9)], "context")
+
+    async def scenario():
+        return await asyncio.gather(
+            *(async_message_handler("bot", f"user_{i}", "Sốt là gì?") for i in range(5))
+        )
+
+    start = time.perf_counter()
+    answers = asyncio.run(scenario())
+    elapsed = time.perf_counter() - start
+
+    assert [answer["content"] for answer in answers] == ["Sốt là triệu chứng thường gặp."] * 5
+    # five 0.2 s generations overlap instead of running back to back
+    assert elapsed < 0.6
+    assert mock_store.call_args.kwargs["doc_ids"] == ["1"]
+    mock_persist.assert_any_call("bot", "user_0", "Sốt là triệu chứng thường gặp.")
@@ -0,0 +1,66 @@
+from unittest.mock import MagicMock, patch
+
+
+def _embedding_response(inputs):
+    response = MagicMock()
+    # return items out of order to check they are placed by index
+    response.data = [
+        MagicMock(index=i, embedding=[float(len(text))])
+        for i, text in reversed(list(enumerate(inputs)))
+    ]
+    return response
+
+
+@patch("backend.src.brain.count_tokens", side_effect=lambda text, model=None: len(text))
+def test_batch_texts_for_embedding(mock_count):
+    from backend.src.brain import batch_texts_for_embedding
+
+    texts = ["a" * 3, "b" * 3, "c" * 3, "d" * 8, "e"]
+    batches = list(batch_texts_for_embedding(texts, batch_size=2, max_batch_tokens=8))
+
+    assert [[index for index, _ in batch] for batch in batches] == [[0, 1], [2], [3], [4]]
+
+
+@patch("backend.src.brain.count_tokens", side_effect=lambda text, model=None: len(text))
+@patch("backend.src.brain.get_openai_client")
+def test_openai_generate_embeddings_preserves_order(mock_get_client, mock_count):
+    from backend.src.brain import openai_generate_embeddings
+
+    mock_client = MagicMock()
+    mock_client.embeddings.create.side_effect = lambda input, model, **kwargs: _embedding_response(input)
+    mock_get_client.return_value = mock_client
+
+    texts = ["x" * n for n in range(1, 8)]
+    embeddings = openai_generate_embeddings(texts, batch_size=3)
+
+    assert embeddings == [[float(n)] for n in range(1, 8)]
+    assert mock_client.embeddings.create.call_count == 3
+    mock_get_client.assert_called_once()
+
+
+@patch("backend.src.brain.time.sleep")
+@patch("backend.src.brain.count_tokens", side_effect=lambda text, model=None: len(text))
+@patch("backend.src.brain.get_openai_client")
+def test_openai_generate_embeddings_retries_failed_batch(mock_get_client, mock_count, mock_sleep):
+    from backend.src.brain import openai_generate_embeddings
+
+    mock_client = MagicMock()
+    mock_client.embeddings.create.side_effect = [
+        RuntimeError("rate limited"),
+        _embedding_response(["ab", "c"]),
+    ]
+    mock_get_client.return_value = mock_client
+
+    embeddings = openai_generate_embeddings(["ab", "c"], max_retries=2)
+
+    assert embeddings == [[2.0], [1.0]]
+    assert mock_client.embeddings.create.call_count == 2
+    mock_sleep.assert_called_once()
+
+
+def test_get_dimensions_kwargs():
+    from backend.src.brain import get_dimensions_kwargs
+
+    assert get_dimensions_kwargs("text-embedding-3-small", 512) == {"dimensions": 512}
+    assert get_dimensions_kwargs("text-embedding-ada-002", 512) == {}
+    assert get_dimensions_kwargs("text-embedding-3-large", None) == {}
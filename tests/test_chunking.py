@@ -0,0 +1,127 @@
+from unittest.mock import patch
+
+SAMPLE_DOCUMENT = """BỆNH TIỂU ĐƯỜNG
+
+Tiểu đường là bệnh mạn tính. Theo PGS. TS. Trần Văn B, tỷ lệ mắc bệnh đang tăng. Người bệnh cần theo dõi đường huyết 1.5 lần mỗi ngày.
+
+## Triệu chứng
+- Khát nước nhiều
+- Đi tiểu nhiều lần
+- Sụt cân không rõ nguyên nhân
+
+""" + "Người bệnh cần tuân thủ chế độ ăn và tập luyện đều đặn. " * 30
+
+
+def test_split_vietnamese_sentences_handles_abbreviations():
+    from backend.src.chunking import split_vietnamese_sentences
+
+    sentences = split_vietnamese_sentences(
+        "TS. BS. Nguyễn Văn A khám cho bệnh nhân. Liều dùng là 1.5 mg. Sốt, ho v.v. là triệu chứng thường gặp! Bạn bị sốt? có thể do cúm."
+    )
+
+    assert sentences == [
+        "TS. BS. Nguyễn Văn A khám cho bệnh nhân.",
+        "Liều dùng là 1.5 mg.",
+        "Sốt, ho v.v. là triệu chứng thường gặp!",
+        "Bạn bị sốt? có thể do cúm.",
+    ]
+
+
+def test_chunk_by_vietnamese_sentences_respects_chunk_size_and_structure():
+    from backend.src.chunking import chunk_by_vietnamese_sentences
+
+    nodes = chunk_by_vietnamese_sentences(
+        SAMPLE_DOCUMENT, metadata={"doc_id": "1"}, chunk_size=200, chunk_overlap=60
+    )
+    texts = [node.text for node in nodes]
+
+    assert all(len(text) <= 200 for text in texts)
+    assert all(node.metadata == {"doc_id": "1"} for node in nodes)
+    # headings open a new chunk and list items stay on their own lines
+    assert texts[0].startswith("BỆNH TIỂU ĐƯỜNG")
+    assert any(text.startswith("## Triệu chứng\n- Khát nước nhiều\n- Đi tiểu nhiều lần") for text in texts)
+    # consecutive body chunks overlap by whole sentences
+    assert texts[-1].split(". ")[0] in texts[-2]
+
+
+def test_chunk_by_vietnamese_sentences_is_deterministic_and_complete():
+    from backend.src.chunking import (chunk_by_vietnamese_sentences,
+                                      split_vietnamese_sentences)
+
+    first = [node.text for node in chunk_by_vietnamese_sentences(SAMPLE_DOCUMENT, chunk_size=200)]
+    second = [node.text for node in chunk_by_vietnamese_sentences(SAMPLE_DOCUMENT, chunk_size=200)]
+
+    assert first == second
+    for sentence in split_vietnamese_sentences(SAMPLE_DOCUMENT.replace("\n", " ")):
+        if not sentence.startswith(("BỆNH", "##", "-")):
+            assert any(sentence in text for text in first)
+
+
+@patch("backend.src.chunking.chunk_by_llm")
+def test_dynamic_chunking_uses_local_chunker_for_long_documents(mock_llm):
+    from backend.src.chunking import dynamic_chunking
+
+    nodes = dynamic_chunking(SAMPLE_DOCUMENT * 3, strategy="vietnamese")
+
+    assert len(nodes) > 1
+    mock_llm.assert_not_called()
+
+
+def test_split_into_windows_overlaps_at_paragraph_boundaries():
+    from backend.src.chunking import split_into_windows
+
+    paragraphs = [f"Đoạn {i}. " + "x" * 80 for i in range(10)]
+    windows = split_into_windows("\n\n".join(paragraphs), window_size=300, window_overlap=100)
+
+    assert len(windows) > 1
+    assert windows[0][1] == 0
+    for (previous, _), (window, overlap_len) in zip(windows, windows[1:]):
+        assert len(window) <= 300
+        assert overlap_len > 0
+        # the overlap is the last whole paragraph of the previous window
+        assert previous.endswith(window[:overlap_len])
+
+
+@patch("backend.src.chunking.llm_split_text")
+def test_chunk_by_llm_windowed_dedupes_seams(mock_split):
+    from backend.src.chunking import chunk_by_llm_windowed
+
+    text = "\n\n".join(["Đoạn A.", "Đoạn B.", "Đoạn C.", "Đoạn D."])
+    # every window echoes its paragraphs as chunks, including the overlap
+    mock_split.side_effect = lambda window: window.split("\n\n")
+
+    nodes = chunk_by_llm_windowed(
+        text, metadata={"doc_id": "1"}, window_size=20, window_overlap=8, max_concurrency=2
+    )
+
+    assert mock_split.call_count > 1
+    assert [node.text for node in nodes] == ["Đoạn A.", "Đoạn B.", "Đoạn C.", "Đoạn D."]
+
+
+def test_split_into_windows_drops_overlap_that_no_longer_fits():
+    from backend.src.chunking import split_into_windows
+
+    paragraphs = ["a" * 50, "b" * 50, "c" * 290]
+    windows = split_into_windows("\n\n".join(paragraphs), window_size=300, window_overlap=100)
+
+    assert [len(window) for window, _ in windows] == [102, 290]
+    assert windows[1][1] == 0
+
+
+def test_stitch_window_chunks_trims_chunks_straddling_the_seam():
+    from backend.src.chunking import split_into_windows, stitch_window_chunks
+
+    text = "\n\n".join(["Sốt cao kéo dài.", "Cần uống nhiều nước.", "Đi khám nếu co giật."])
+    windows = split_into_windows(text, window_size=45, window_overlap=25)
+    assert [overlap_len for _, overlap_len in windows] == [0, len("Cần uống nhiều nước.")]
+
+    # the second window's first chunk crosses from the overlap into new text
+    chunks = stitch_window_chunks(
+        windows,
+        [
+            ["Sốt cao kéo dài. Cần uống", "Cần uống nhiều nước."],
+            ["nhiều nước.\n\nĐi khám nếu co giật."],
+        ],
+    )
+
+    assert chunks == ["Sốt cao kéo dài. Cần uống", "Cần uống nhiều nước.", "Đi khám nếu co giật."]
@@ -0,0 +1,31 @@
+from unittest.mock import MagicMock, patch
+
+
+def test_registry_reuses_clients_until_fork():
+    from backend.src.clients import ClientRegistry
+
+    registry = ClientRegistry()
+    factory = MagicMock(side_effect=lambda: object())
+
+    first = registry.get("service", factory)
+    assert registry.get("service", factory) is first
+    assert factory.call_count == 1
+
+    # a forked child sees a different pid and must not reuse the parent's sockets
+    registry._pid = -1
+    assert registry.get("service", factory) is not first
+    assert factory.call_count == 2
+
+
+@patch("backend.src.cache.create_redis_client")
+def test_get_redis_client_is_shared_and_does_not_ping(mock_create):
+    from backend.src.cache import get_redis_client
+    from backend.src.clients import registry
+
+    registry.reset()
+    client = get_redis_client(host="redis-test")
+
+    assert get_redis_client(host="redis-test") is client
+    mock_create.assert_called_once()
+    client.ping.assert_not_called()
+    registry.reset()
@@ -0,0 +1,72 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+def test_normalize_text_and_cache_key():
+    from backend.src.embedding_cache import (get_embedding_cache_key,
+                                             normalize_text)
+
+    assert normalize_text("  Triệu   chứng\ntiểu đường ") == "Triệu chứng tiểu đường"
+    assert get_embedding_cache_key("a  b", model="m") == get_embedding_cache_key("a b\n", model="m")
+    assert get_embedding_cache_key("a b", model="m1") != get_embedding_cache_key("a b", model="m2")
+
+
+@pytest.mark.parametrize("dtype,size", [("float32", 4), ("float16", 2)])
+def test_embedding_encoding_roundtrip(dtype, size):
+    from backend.src.embedding_cache import decode_embedding, encode_embedding
+
+    embedding = [0.5, -0.25, 1.0]
+    data = encode_embedding(embedding, dtype=dtype)
+
+    assert len(data) == len(embedding) * size
+    assert decode_embedding(data, dtype=dtype) == embedding
+
+
+def test_local_lru_cache_evicts_least_recently_used():
+    from backend.src.cache import LocalLRUCache
+
+    cache = LocalLRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+
+@patch("backend.src.embedding_cache.get_redis_client")
+@patch("backend.src.embedding_cache.openai_generate_embeddings")
+def test_get_cached_embeddings_only_embeds_misses(mock_embed, mock_get_redis):
+    from backend.src import embedding_cache
+
+    embedding_cache._local_cache.clear()
+    redis_client = MagicMock()
+    cached_key = embedding_cache.get_embedding_cache_key("cached", model="m")
+    redis_client.mget.side_effect = lambda keys: [
+        embedding_cache.encode_embedding([1.0]) if key == cached_key else None for key in keys
+    ]
+    mock_get_redis.return_value = redis_client
+    mock_embed.side_effect = lambda texts, model, dimensions: [[float(len(text))] for text in texts]
+
+    embeddings = embedding_cache.get_cached_embeddings(["cached", "new", "new "], model="m")
+
+    assert embeddings == [[1.0], [3.0], [3.0]]
+    mock_embed.assert_called_once_with(["new"], model="m", dimensions=1536)
+
+    # second call is served entirely from the local tier
+    mock_embed.reset_mock()
+    redis_client.mget.reset_mock()
+    assert embedding_cache.get_cached_embeddings(["new"], model="m") == [[3.0]]
+    mock_embed.assert_not_called()
+    redis_client.mget.assert_not_called()
+
+
+def test_cache_key_depends_on_dimensions():
+    from backend.src.embedding_cache import get_embedding_cache_key
+
+    assert get_embedding_cache_key("sốt", model="m", dimensions=512) != get_embedding_cache_key(
+        "sốt", model="m", dimensions=1536
+    )
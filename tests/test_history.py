@@ -0,0 +1,136 @@
+from unittest.mock import patch
+
+
+def test_get_recent_start_keeps_newest_messages_within_budget():
+    from backend.src.history import get_recent_start
+
+    assert get_recent_start([100, 50, 30, 20], budget=60) == 2
+    assert get_recent_start([100, 50, 30, 20], budget=1000) == 0
+    # the newest message is kept even when it alone is over budget
+    assert get_recent_start([10, 500], budget=100) == 1
+    assert get_recent_start([], budget=100) == 0
+
+
+@patch("backend.src.history.count_tokens", side_effect=lambda text, model=None: len(text))
+def test_trim_history_drops_system_messages_and_old_turns(mock_count):
+    from backend.src.history import trim_history
+
+    history = [
+        {"role": "system", "content": "x" * 1000},
+        {"role": "user", "content": "a" * 50},
+        {"role": "assistant", "content": "b" * 50},
+        {"role": "user", "content": "c" * 20},
+    ]
+
+    assert trim_history(history, budget=80) == history[2:]
+
+
+@patch("backend.src.history.count_tokens", side_effect=ValueError("offline"))
+def test_count_message_tokens_estimates_without_tokenizer(mock_count):
+    from backend.src.history import count_message_tokens
+
+    assert count_message_tokens("a" * 30) == 11
+
+
+def make_entry(seq, message, token_count, is_request=True):
+    return {
+        "seq": seq,
+        "message": message,
+        "token_count": token_count,
+        "is_request": is_request,
+        "created_at": 0.0,
+    }
+
+
+@patch("backend.src.models.get_history_entries")
+def test_get_conversation_history_fits_summary_and_recent_turns(mock_entries):
+    from backend.src.models import get_conversation_history
+
+    meta = {"summary": "Người dùng bị sốt 3 ngày.", "summary_seq": 10, "summary_tokens": 100}
+    entries = [
+        make_entry(11, "câu hỏi cũ", 400),
+        make_entry(12, "câu trả lời cũ", 400, is_request=False),
+        make_entry(13, "câu hỏi", 200),
+        make_entry(14, "câu trả lời", 200, is_request=False),
+        make_entry(15, "câu hỏi mới", 100),
+    ]
+    mock_entries.return_value = (meta, entries)
+
+    messages, older = get_conversation_history("conversation-1", token_budget=700)
+
+    mock_entries.assert_called_once_with("conversation-1")
+    assert older == entries[:2]
+    assert messages[0] == {
+        "role": "system",
+        "content": "Summary of the earlier conversation:\nNgười dùng bị sốt 3 ngày.",
+    }
+    assert [msg["content"] for msg in messages[1:]] == [
+        "câu hỏi",
+        "câu trả lời",
+        "câu hỏi mới",
+    ]
+
+
+@patch("backend.src.tasks.update_conversation_summary")
+@patch("backend.src.tasks.acquire_history_summary_lock", return_value=True)
+def test_schedule_history_summary_waits_for_enough_tokens(mock_lock, mock_task):
+    from backend.src.tasks import schedule_history_summary
+
+    with patch("backend.src.tasks.settings.history_summary_min_tokens", 500):
+        schedule_history_summary("conversation-1", [make_entry(11, "cũ", 300)])
+        mock_task.delay.assert_not_called()
+
+        schedule_history_summary(
+            "conversation-1", [make_entry(11, "cũ", 300), make_entry(12, "cũ", 300)]
+        )
+    mock_task.delay.assert_called_once_with("conversation-1", 12)
+
+
+@patch("backend.src.tasks.release_history_summary_lock")
+@patch("backend.src.tasks.save_conversation_summary")
+@patch("backend.src.tasks.update_rolling_summary", return_value="tóm tắt mới")
+@patch("backend.src.tasks.get_history_entries")
+def test_update_conversation_summary_folds_new_turns(
+    mock_entries, mock_update, mock_save, mock_release
+):
+    from backend.src.tasks import update_conversation_summary
+
+    mock_entries.return_value = (
+        {"summary": "tóm tắt cũ", "summary_seq": 10, "summary_tokens": 20},
+        [
+            make_entry(11, "Tôi bị sốt.", 5),
+            make_entry(12, "Bạn nên uống nhiều nước.", 8, is_request=False),
+            make_entry(13, "Còn ho thì sao?", 6),
+        ],
+    )
+
+    update_conversation_summary("conversation-1", 12)
+
+    previous, messages = mock_update.call_args.args
+    assert previous == "tóm tắt cũ"
+    assert messages == [
+        {"role": "user", "content": "Tôi bị sốt.", "token_count": 5},
+        {"role": "assistant", "content": "Bạn nên uống nhiều nước.", "token_count": 8},
+    ]
+    mock_save.assert_called_once_with("conversation-1", "tóm tắt mới", 12)
+    mock_release.assert_called_once_with("conversation-1")
+
+
+@patch("backend.src.history.count_message_tokens")
+def test_get_history_context_budgets_from_stored_token_counts(mock_count):
+    from backend.src.prompts import get_history_context
+
+    history = [
+        {"role": "user", "content": "câu hỏi cũ", "token_count": 400},
+        {"role": "assistant", "content": "câu trả lời", "token_count": 300},
+        {"role": "user", "content": "câu hỏi mới", "token_count": 100},
+    ]
+
+    _, turns, _ = get_history_context(history, budget=450)
+
+    mock_count.assert_not_called()
+    # the count is only used for budgeting, it is not sent to the LLM
+    assert turns == [
+        {"role": "assistant", "content": "câu trả lời"},
+        {"role": "user", "content": "câu hỏi mới"},
+    ]
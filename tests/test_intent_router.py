@@ -0,0 +1,60 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+EXEMPLAR_VECTORS = {
+    "sốt": [1.0, 0.0],
+    "ho": [0.9, 0.1],
+    "thời tiết": [0.0, 1.0],
+    "bóng đá": [0.1, 0.9],
+}
+
+
+def _fake_embed(texts):
+    return [EXEMPLAR_VECTORS[text] for text in texts]
+
+
+def _router():
+    from backend.src.intent_router import EmbeddingRouter
+
+    exemplars = {"medical": ["sốt", "ho"], "general": ["thời tiết", "bóng đá"]}
+    return EmbeddingRouter(exemplars, embed_fn=_fake_embed, top_k=2)
+
+
+def test_embedding_router_classifies_by_nearest_exemplars():
+    route, margin, scores = _router().classify([2.0, 0.1])
+
+    assert route == "medical"
+    assert scores["medical"] > scores["general"]
+    assert margin == pytest.approx(scores["medical"] - scores["general"])
+    assert _router().classify([0.05, 1.0])[0] == "general"
+
+
+@patch("backend.src.intent_router.detect_route", return_value="general")
+@patch("backend.src.intent_router.get_cached_embedding")
+@patch("backend.src.intent_router.get_embedding_router")
+def test_embedding_detect_route_falls_back_to_llm_on_low_margin(mock_router, mock_embed, mock_llm):
+    from backend.src.intent_router import embedding_detect_route
+
+    mock_router.return_value = _router()
+
+    mock_embed.return_value = [1.0, 0.05]
+    assert embedding_detect_route([], "Sốt cao", min_margin=0.1) == "medical"
+    mock_llm.assert_not_called()
+
+    mock_embed.return_value = [1.0, 1.0]
+    assert embedding_detect_route([], "Còn gì nữa?", min_margin=0.1) == "general"
+    mock_llm.assert_called_once_with([], "Còn gì nữa?")
+
+
+def test_load_route_exemplars(tmp_path):
+    from backend.src.intent_router import load_route_exemplars
+
+    path = tmp_path / "exemplars.json"
+    path.write_text(json.dumps({"medical": ["sốt"], "general": ["thời tiết"]}), encoding="utf-8")
+    assert load_route_exemplars(path) == {"medical": ["sốt"], "general": ["thời tiết"]}
+
+    path.write_text(json.dumps({"medical": []}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_route_exemplars(path)
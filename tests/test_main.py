@@ -1,3 +1,4 @@
+import json
 from unittest.mock import MagicMock, patch
 
 
@@ -18,9 +19,12 @@ class TestChatEndpoints:
         response = client.post("/chat/complete", json={"bot_id": "test"})
         assert response.status_code == 422  # Validation error
 
-    @patch("backend.src.main.message_handler_task")
-    def test_chat_complete_sync(self, mock_task, client, sample_chat_request):
-        mock_task.return_value = "Test response"
+    @patch("backend.src.main.async_message_handler")
+    def test_chat_complete_sync(self, mock_handler, client, sample_chat_request):
+        async def handler(*args, **kwargs):
+            return "Test response"
+
+        mock_handler.side_effect = handler
 
         response = client.post("/chat/complete", json=sample_chat_request)
         assert response.status_code == 200
@@ -39,6 +43,68 @@ class TestChatEndpoints:
         assert response.json()["status"] == "processing"
         assert response.json()["task_id"] == "test-task-123"
 
+    @patch("backend.src.main.message_handler_task")
+    def test_chat_complete_scopes_search_to_bot(self, mock_task, client, sample_chat_request):
+        mock_task.delay.return_value = type("AsyncResult", (), {"id": "test-task-123"})()
+
+        request = {
+            **sample_chat_request,
+            "is_sync_request": False,
+            "search_filter": {"doc_id": ["1"], "bot_id": "other_bot"},
+        }
+        response = client.post("/chat/complete", json=request)
+
+        assert response.status_code == 200
+        assert mock_task.delay.call_args.kwargs["search_filter"] == {
+            "doc_id": ["1"],
+            "bot_id": "test_bot",
+        }
+
+    @patch("backend.src.main.stream_message_handler")
+    def test_chat_stream(self, mock_stream, client, sample_chat_request):
+        mock_stream.return_value = iter(["Sốt ", "là ", "triệu chứng."])
+
+        response = client.post("/chat/stream", json=sample_chat_request)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            json.loads(line[len("data: ") :])
+            for line in response.text.splitlines()
+            if line.startswith("data: ")
+        ]
+        assert [e["content"] for e in events if e["type"] == "token"] == [
+            "Sốt ",
+            "là ",
+            "triệu chứng.",
+        ]
+        assert events[-1] == {"type": "done"}
+
+    @patch("backend.src.main.AsyncResult")
+    @patch("backend.src.main.get_task_notifier")
+    def test_get_chat_response_waits_for_completion(self, mock_notifier, mock_result, client):
+        pending = MagicMock(status="STARTED", result=None)
+        pending.ready.return_value = False
+        done = MagicMock(status="SUCCESS", result={"role": "assistant", "content": "ok"})
+        done.ready.return_value = True
+        mock_result.side_effect = [pending, done]
+
+        async def wait(waiter, timeout):
+            return "SUCCESS"
+
+        async def wait_subscribed(timeout):
+            return True
+
+        mock_notifier.return_value.wait.side_effect = wait
+        mock_notifier.return_value.wait_subscribed.side_effect = wait_subscribed
+
+        response = client.get("/chat/complete/task-1")
+
+        assert response.json()["status"] == "SUCCESS"
+        assert response.json()["task_result"]["content"] == "ok"
+        mock_notifier.return_value.register.assert_called_once_with("task-1")
+        mock_notifier.return_value.unregister.assert_called_once()
+
 
 class TestCollectionEndpoints:
     @patch("backend.src.main.create_collection")
@@ -49,6 +115,22 @@ class TestCollectionEndpoints:
         assert response.status_code == 200
         assert response.json()["status"] == "Success"
 
+    @patch("backend.src.main.create_collection")
+    def test_create_collection_with_quantization(self, mock_create, client):
+        mock_create.return_value = "Success"
+
+        response = client.post(
+            "/collections/create",
+            params={"quantization": "scalar", "on_disk": True, "hnsw_m": 32},
+        )
+        assert response.status_code == 200
+        assert mock_create.call_args.kwargs["quantization"] == "scalar"
+        assert mock_create.call_args.kwargs["on_disk"] is True
+        assert mock_create.call_args.kwargs["hnsw_m"] == 32
+
+        response = client.post("/collections/create", params={"quantization": "int4"})
+        assert response.status_code == 422
+
 
 class TestDocumentEndpoints:
     @patch("backend.src.main.chunk_and_index_document")
@@ -72,3 +154,100 @@ class TestDocumentEndpoints:
         assert response.status_code == 200
         assert response.json()["document_id"] == "123"
         assert "indexing started" in response.json()["status"]
+        mock_insert.assert_called_once_with("Test Doc", "Test content", "Meddy")
+        mock_chunk_and_index.delay.assert_called_once_with("123", "Test Doc", "Test content", "Meddy")
+
+    @patch("backend.src.main.get_ingest_job")
+    @patch("backend.src.main.update_ingest_job")
+    @patch("backend.src.main.create_ingest_job", return_value="job-1")
+    @patch("backend.src.main.get_queue_depth", return_value=0)
+    @patch("backend.src.main.index_documents_batch")
+    @patch("backend.src.main.insert_documents")
+    def test_bulk_insert_documents(
+        self, mock_insert, mock_index, mock_depth, mock_create, mock_update, mock_get_job, client
+    ):
+        mock_insert.side_effect = lambda batch: [{"doc_id": str(i), **doc} for i, doc in enumerate(batch)]
+        mock_get_job.return_value = {"job_id": "job-1", "status": "indexing"}
+
+        body = "\n".join(
+            [
+                '{"title": "Doc 1", "content": "Content 1"}',
+                "not json",
+                '{"title": "Doc 2", "content": "Content 2"}',
+            ]
+        )
+        response = client.post(
+            "/documents/bulk", content=body, headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        assert response.status_code == 200
+        assert response.json()["job_id"] == "job-1"
+        mock_insert.assert_called_once()
+        assert [doc["title"] for doc in mock_insert.call_args.args[0]] == ["Doc 1", "Doc 2"]
+        mock_index.delay.assert_called_once()
+        mock_update.assert_any_call("job-1", status="indexing", invalid=1)
+
+    @patch("backend.src.main.update_ingest_job")
+    @patch("backend.src.main.create_ingest_job", return_value="job-1")
+    @patch("backend.src.main.get_queue_depth", return_value=1000)
+    @patch("backend.src.main.index_documents_batch")
+    @patch("backend.src.main.insert_documents")
+    def test_bulk_insert_fails_job_when_queue_does_not_drain(
+        self, mock_insert, mock_index, mock_depth, mock_create, mock_update, client
+    ):
+        mock_insert.side_effect = lambda batch: [{"doc_id": str(i), **doc} for i, doc in enumerate(batch)]
+
+        with patch("backend.src.main.settings.bulk_ingest_backpressure_timeout", 0):
+            response = client.post(
+                "/documents/bulk",
+                content='{"title": "Doc 1", "content": "Content 1"}',
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+
+        assert response.status_code == 503
+        # nothing is stored that could not be enqueued
+        mock_insert.assert_not_called()
+        mock_index.delay.assert_not_called()
+        mock_update.assert_called_with("job-1", status="failed")
+
+    @patch("backend.src.main.update_ingest_job")
+    @patch("backend.src.main.create_ingest_job", return_value="job-1")
+    @patch("backend.src.main.get_queue_depth", return_value=0)
+    @patch("backend.src.main.index_documents_batch")
+    @patch("backend.src.main.insert_documents")
+    def test_bulk_insert_counts_documents_that_could_not_be_enqueued(
+        self, mock_insert, mock_index, mock_depth, mock_create, mock_update, client
+    ):
+        mock_insert.side_effect = lambda batch: [{"doc_id": str(i), **doc} for i, doc in enumerate(batch)]
+        mock_index.delay.side_effect = ConnectionError("broker down")
+
+        response = client.post(
+            "/documents/bulk",
+            content='{"title": "Doc 1", "content": "Content 1"}',
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+        assert response.status_code == 500
+        mock_update.assert_any_call("job-1", failed=1)
+        mock_update.assert_called_with("job-1", status="failed")
+
+    @patch("backend.src.main.get_ingest_job", return_value=None)
+    def test_get_bulk_job_not_found(self, mock_get_job, client):
+        response = client.get("/documents/bulk/missing")
+        assert response.status_code == 404
+
+    @patch("backend.src.main.invalidate_cached_answers")
+    @patch("backend.src.main.delete_document_points")
+    @patch("backend.src.main.delete_document")
+    def test_delete_document(self, mock_delete, mock_delete_points, mock_invalidate, client):
+        mock_delete.return_value = True
+        response = client.delete("/documents/5")
+        assert response.status_code == 200
+        mock_delete_points.assert_called_once_with("5")
+        mock_invalidate.assert_called_once_with(["5"])
+
+        mock_delete.return_value = False
+        mock_delete_points.reset_mock()
+        response = client.delete("/documents/6")
+        assert response.status_code == 404
+        mock_delete_points.assert_not_called()
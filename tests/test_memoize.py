@@ -0,0 +1,86 @@
+from unittest.mock import MagicMock, patch
+
+
+def test_memo_key_normalizes_inputs():
+    from backend.src.memoize import get_memo_key
+
+    history = [{"role": "user", "content": "Xin  chào\n"}]
+    key = get_memo_key("rewrite", "v1", (history, "Triệu chứng  sốt?"), {})
+
+    assert key == get_memo_key(
+        "rewrite", "v1", ([{"content": "Xin chào", "role": "user"}], " Triệu chứng sốt?"), {}
+    )
+    assert key != get_memo_key("rewrite", "v2", (history, "Triệu chứng sốt?"), {})
+    assert key != get_memo_key("route", "v1", (history, "Triệu chứng sốt?"), {})
+
+
+def test_prompt_version_changes_with_prompt_assembly():
+    from backend.src.memoize import prompt_version
+
+    version = prompt_version("gpt-4o-mini", "template")
+    assert version != prompt_version("gpt-4o-mini", "other template")
+    with patch("backend.src.memoize.PROMPT_ASSEMBLY_VERSION", "next"):
+        assert version != prompt_version("gpt-4o-mini", "template")
+
+
+@patch("backend.src.memoize.settings.memo_enabled", True)
+@patch("backend.src.memoize.get_redis_client")
+def test_memoize_caches_results_and_counts_hits(mock_redis):
+    from backend.src.memoize import _local_stats, memoize
+
+    redis_client = MagicMock()
+    pipe = redis_client.pipeline.return_value
+    pipe.get.return_value.pttl.return_value.execute.return_value = [None, -2]
+    mock_redis.return_value = redis_client
+    calls = []
+
+    @memoize("test_stage", ttl=60, version="v1")
+    def stage(question):
+        calls.append(question)
+        return {"answer": question.upper()}
+
+    assert stage("sốt cao") == {"answer": "SỐT CAO"}
+    assert stage("sốt  cao ") == {"answer": "SỐT CAO"}
+
+    assert calls == ["sốt cao"]
+    assert _local_stats["test_stage"] == {"hits": 1, "misses": 1}
+    assert redis_client.set.call_args.kwargs["ex"] == 60
+
+
+@patch("backend.src.memoize.settings.memo_enabled", True)
+@patch("backend.src.memoize.get_redis_client", side_effect=ConnectionError("redis down"))
+def test_memoize_does_not_cache_exceptions(mock_redis):
+    import pytest
+
+    from backend.src.memoize import memoize
+
+    attempts = []
+
+    @memoize("failing_stage", ttl=60)
+    def stage(question):
+        attempts.append(question)
+        raise RuntimeError("LLM unavailable")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            stage("câu hỏi")
+    assert len(attempts) == 2
+
+
+@patch("backend.src.memoize.settings.memo_enabled", True)
+@patch("backend.src.memoize.get_redis_client")
+def test_memoize_redis_hit_keeps_redis_expiry_locally(mock_redis):
+    import time
+
+    from backend.src.memoize import _local_cache, get_memo_key, memoize
+
+    pipe = mock_redis.return_value.pipeline.return_value
+    pipe.get.return_value.pttl.return_value.execute.return_value = [b'{"answer": "cached"}', 5000]
+
+    @memoize("redis_stage", ttl=3600)
+    def stage(question):
+        raise AssertionError("should be served from Redis")
+
+    assert stage("ho khan") == {"answer": "cached"}
+    expires_at, _ = _local_cache.get(get_memo_key("redis_stage", "", ("ho khan",), {}))
+    assert expires_at <= time.time() + 5
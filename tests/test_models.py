@@ -0,0 +1,252 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture
+def conversation_table():
+    from backend.src.database import engine
+    from backend.src.models import ChatConversation
+
+    ChatConversation.__table__.create(bind=engine, checkfirst=True)
+    yield ChatConversation
+    ChatConversation.__table__.drop(bind=engine)
+
+
+def insert_operation(seq, message, is_request=True):
+    return {
+        "op": "insert",
+        "conversation_id": "conversation-1",
+        "seq": seq,
+        "bot_id": "bot",
+        "user_id": "user",
+        "message": message,
+        "is_request": is_request,
+        "token_count": len(message),
+        "created_at": 1700000000.0 + seq,
+    }
+
+
+def test_apply_conversation_writes_inserts_then_updates(conversation_table):
+    from sqlalchemy import select
+
+    from backend.src.database import get_db
+    from backend.src.models import apply_conversation_writes
+
+    apply_conversation_writes(
+        [
+            insert_operation(0, "Sốt là gì?"),
+            insert_operation(1, "Câu trả lời dài.", is_request=False),
+            {
+                "op": "update",
+                "conversation_id": "conversation-1",
+                "seq": 1,
+                "message": "Tóm tắt.",
+                "token_count": 8,
+            },
+        ]
+    )
+
+    with get_db() as db:
+        rows = db.execute(
+            select(conversation_table).order_by(conversation_table.seq)
+        ).scalars().all()
+        assert [(row.seq, row.message, row.is_completed) for row in rows] == [
+            (0, "Sốt là gì?", False),
+            (1, "Tóm tắt.", True),
+        ]
+        assert rows[1].token_count == 8
+
+
+def test_get_conversation_by_id_walks_keyset_pages(conversation_table):
+    from sqlalchemy import insert
+
+    from backend.src.database import get_db
+    from backend.src.models import (get_conversation_by_id,
+                                    get_conversation_page)
+
+    created_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with get_db() as db:
+        db.execute(
+            insert(conversation_table),
+            [
+                # equal timestamps are ordered by id, so no page drops a row
+                {
+                    "conversation_id": "conversation-1",
+                    "message": f"tin nhắn {seq}",
+                    "seq": seq,
+                    "created_at": created_at.replace(second=seq // 2),
+                }
+                for seq in range(5)
+            ]
+            + [
+                {
+                    "conversation_id": "conversation-2",
+                    "message": "khác",
+                    "seq": 0,
+                    "created_at": created_at,
+                }
+            ],
+        )
+        db.commit()
+
+    with patch(
+        "backend.src.models.get_conversation_page", wraps=get_conversation_page
+    ) as mock_page:
+        rows = get_conversation_by_id("conversation-1", page_size=2)
+
+    assert [row.seq for row in rows] == [0, 1, 2, 3, 4]
+    assert mock_page.call_count == 3
+    assert mock_page.call_args.args[1] == (rows[3].created_at, rows[3].id)
+    # only the history columns are read
+    assert set(rows[0]._fields) == {
+        "id", "seq", "message", "is_request", "token_count", "created_at"
+    }
+    assert get_conversation_by_id("conversation-3") is None
+
+
+@patch("backend.src.models.queue_conversation_write")
+@patch("backend.src.models.load_conversation_into_cache")
+@patch("backend.src.models.append_history_entry", side_effect=[None, 4])
+def test_add_conversation_message_rebuilds_missing_history(
+    mock_append, mock_load, mock_queue
+):
+    from backend.src.models import add_conversation_message
+
+    seq = add_conversation_message("conversation-1", "bot", "user", "Ho lâu ngày?")
+
+    assert seq == 4
+    mock_load.assert_called_once_with("conversation-1")
+    operation = mock_queue.call_args.args[0]
+    assert operation["op"] == "insert"
+    assert operation["seq"] == 4
+    assert operation["message"] == "Ho lâu ngày?"
+
+
+@patch("backend.src.models.rebuild_history", return_value=True)
+@patch("backend.src.models.get_conversation_summary")
+@patch("backend.src.models.get_conversation_by_id")
+@patch("backend.src.models.peek_conversation_writes", return_value=[])
+def test_load_conversation_into_cache_rebuilds_from_postgres(
+    mock_peek, mock_rows, mock_summary, mock_rebuild
+):
+    from backend.src.models import load_conversation_into_cache
+
+    created_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    mock_rows.return_value = [
+        SimpleNamespace(message="Sốt?", is_request=True, token_count=3, seq=0, created_at=created_at),
+        SimpleNamespace(message="Nghỉ ngơi.", is_request=False, token_count=None, seq=1, created_at=created_at),
+    ]
+    mock_summary.return_value = SimpleNamespace(summary="tóm tắt", last_seq=0, token_count=5)
+
+    with patch("backend.src.models.count_message_tokens", return_value=7):
+        load_conversation_into_cache("conversation-1")
+
+    mock_peek.assert_called_once_with()
+    conversation_id, entries, meta = mock_rebuild.call_args.args
+    assert conversation_id == "conversation-1"
+    assert [entry["token_count"] for entry in entries] == [3, 7]
+    assert meta == {"summary": "tóm tắt", "summary_seq": 0, "summary_tokens": 5}
+
+
+def test_merge_conversation_entries_places_rows_at_their_seq():
+    from backend.src.models import merge_conversation_entries
+
+    created_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def row(message, seq):
+        return SimpleNamespace(
+            message=message, is_request=True, token_count=1, seq=seq, created_at=created_at
+        )
+
+    # seq 2 is still queued, e.g. while another process holds the flush lock;
+    # rows with equal timestamps may come back in any seq order
+    rows = [row("cũ", None), row("ba", 3), row("một", 1)]
+    operations = [
+        insert_operation(2, "hai"),
+        {**insert_operation(0, "khác"), "conversation_id": "conversation-2"},
+        {
+            "op": "update",
+            "conversation_id": "conversation-1",
+            "seq": 3,
+            "message": "ba (tóm tắt)",
+            "token_count": 2,
+        },
+    ]
+
+    entries = merge_conversation_entries("conversation-1", rows, operations)
+
+    assert [entry["message"] for entry in entries] == ["cũ", "một", "hai", "ba (tóm tắt)"]
+    assert entries[3]["token_count"] == 2
+
+
+@patch("backend.src.models.release_conversation_flush_lock")
+@patch("backend.src.models.trim_conversation_writes")
+@patch("backend.src.models.apply_conversation_writes")
+@patch("backend.src.models.peek_conversation_writes")
+@patch("backend.src.models.acquire_conversation_flush_lock", return_value="token-1")
+def test_flush_conversation_writes_keeps_queue_on_failure(
+    mock_lock, mock_peek, mock_apply, mock_trim, mock_release
+):
+    from sqlalchemy.exc import OperationalError
+
+    from backend.src.models import flush_conversation_writes
+
+    mock_peek.return_value = [insert_operation(0, "Sốt là gì?")]
+    mock_apply.side_effect = OperationalError("INSERT", {}, Exception("db down"))
+
+    with pytest.raises(OperationalError):
+        flush_conversation_writes(batch_size=10)
+
+    mock_peek.assert_called_once_with(10)
+    mock_trim.assert_not_called()
+    mock_release.assert_called_once_with("token-1")
+
+
+def test_apply_conversation_writes_skips_rows_already_written(conversation_table):
+    from sqlalchemy import func, select
+
+    from backend.src.database import get_db
+    from backend.src.models import apply_conversation_writes
+
+    operations = [insert_operation(0, "Sốt là gì?"), insert_operation(1, "Trả lời.", False)]
+    apply_conversation_writes(operations)
+    # the same batch again, as after a commit whose trim did not happen
+    apply_conversation_writes(operations)
+
+    with get_db() as db:
+        assert db.scalar(select(func.count()).select_from(conversation_table)) == 2
+
+
+@patch("backend.src.models.release_conversation_flush_lock")
+@patch("backend.src.models.dead_letter_conversation_write")
+@patch("backend.src.models.trim_conversation_writes")
+@patch("backend.src.models.peek_conversation_writes")
+@patch("backend.src.models.acquire_conversation_flush_lock", return_value="token-1")
+def test_flush_conversation_writes_dead_letters_failing_operation(
+    mock_lock, mock_peek, mock_trim, mock_dead_letter, mock_release, conversation_table
+):
+    from sqlalchemy import select
+
+    from backend.src.database import get_db
+    from backend.src.models import flush_conversation_writes
+
+    broken = {**insert_operation(1, "Trả lời.", False), "message": None}
+    mock_peek.return_value = [
+        insert_operation(0, "Sốt là gì?"),
+        broken,
+        insert_operation(2, "Cảm ơn."),
+    ]
+
+    assert flush_conversation_writes(batch_size=10) == 3
+
+    # the others are committed and trimmed one by one, the broken one is moved
+    assert mock_trim.call_args_list == [((1,),), ((1,),)]
+    mock_dead_letter.assert_called_once_with()
+    with get_db() as db:
+        assert db.scalars(
+            select(conversation_table.seq).order_by(conversation_table.seq)
+        ).all() == [0, 2]
+    mock_release.assert_called_once_with("token-1")
@@ -0,0 +1,189 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+
+def count_chars(text, model=None):
+    return len(text)
+
+
+@pytest.fixture(autouse=True)
+def char_token_counts():
+    from backend.src.prompts import count_text_tokens
+
+    count_text_tokens.cache_clear()
+    with patch("backend.src.history.count_tokens", side_effect=count_chars):
+        yield
+    count_text_tokens.cache_clear()
+
+
+def test_answer_prompt_sends_system_prompt_once():
+    from backend.src.prompts import count_prompt_tokens, get_prompt_stats
+    from backend.src.tasks import build_rag_messages, settings
+
+    summary = {"role": "system", "content": "Summary of the earlier conversation:\nSốt."}
+    turns = [
+        {"role": "user", "content": "Tôi bị sốt."},
+        {"role": "assistant", "content": "Bạn nên nghỉ ngơi."},
+    ]
+    # history as loaded before the assembly layer: system prompt at the head
+    legacy_history = [{"role": "system", "content": settings.system_prompt}, summary, *turns]
+    saved_before = get_prompt_stats().get("answer", {}).get("saved_tokens", 0)
+
+    messages, use_web_search = build_rag_messages(
+        legacy_history,
+        "Sốt cao phải làm gì?",
+        [SimpleNamespace(index=0, relevance_score=0.9)],
+        "Context",
+    )
+
+    assert not use_web_search
+    assert [msg["content"] for msg in messages].count(settings.system_prompt) == 1
+    assert messages[:4] == [
+        {"role": "system", "content": settings.system_prompt},
+        summary,
+        *turns,
+    ]
+    user_content = settings.rag_prompt.format(
+        context="Context", question="Sốt cao phải làm gì?"
+    )
+    assert count_prompt_tokens(messages) == (
+        len(settings.system_prompt)
+        + len(summary["content"])
+        + sum(len(msg["content"]) for msg in turns)
+        + len(user_content)
+    )
+    assert (
+        get_prompt_stats()["answer"]["saved_tokens"] - saved_before
+        == len(settings.system_prompt)
+    )
+
+
+def test_route_prompt_strips_system_prompt_from_history():
+    from backend.src.brain import build_route_messages, settings
+
+    history = [
+        {"role": "system", "content": settings.system_prompt},
+        {"role": "system", "content": "Summary of the earlier conversation:\nSốt."},
+        {"role": "user", "content": "Tôi bị sốt."},
+    ]
+
+    messages = build_route_messages(history, "Aspirin là gì?")
+
+    assert len(messages) == 2
+    assert settings.system_prompt not in messages[1]["content"]
+    assert "summary: Summary of the earlier conversation:\nSốt." in messages[1]["content"]
+    assert "user: Tôi bị sốt.\n" in messages[1]["content"]
+
+
+def test_get_history_context_drops_repeated_notes():
+    from backend.src.prompts import get_history_context
+
+    note = {"role": "system", "content": "summary"}
+    notes, turns, saved_tokens = get_history_context(
+        [note, note, {"role": "user", "content": "hi"}], system_prompt="stage"
+    )
+
+    assert notes == ["summary"]
+    assert turns == [{"role": "user", "content": "hi"}]
+    assert saved_tokens == len("summary")
+
+
+def test_answer_prompts_share_a_byte_identical_prefix():
+    from backend.src.tasks import build_rag_messages, settings
+
+    docs = [SimpleNamespace(index=0, relevance_score=0.9)]
+    first, _ = build_rag_messages([], "Sốt là gì?", docs, "Context A")
+    second, _ = build_rag_messages(
+        [{"role": "user", "content": "Tôi bị ho."}], "Ho lâu ngày?", docs, "Context B"
+    )
+
+    assert first[0] == second[0] == {"role": "system", "content": settings.system_prompt}
+    # per-request content only appears in the last message
+    assert first[-1]["content"].startswith(settings.rag_prompt.split("{context}")[0])
+    assert first[-1]["content"].endswith("Sốt là gì?")
+
+
+@patch("backend.src.brain.record_usage")
+@patch("backend.src.brain.get_openai_client")
+def test_openai_chat_complete_sends_cache_key_and_records_usage(
+    mock_get_client, mock_record
+):
+    from backend.src.brain import openai_chat_complete
+
+    response = MagicMock()
+    response.choices[0].message.content = "answer"
+    mock_get_client.return_value.chat.completions.create.return_value = response
+
+    with patch("backend.src.brain.settings.openai_prompt_cache_key", "meddy"):
+        answer = openai_chat_complete([{"role": "user", "content": "hi"}], stage="answer")
+
+    assert answer == "answer"
+    kwargs = mock_get_client.return_value.chat.completions.create.call_args.kwargs
+    assert kwargs["prompt_cache_key"] == "meddy:answer"
+    mock_record.assert_called_once()
+    assert mock_record.call_args.args[:2] == ("answer", response.usage)
+
+
+@patch("backend.src.brain.record_usage")
+@patch("backend.src.prompts.get_async_redis_client")
+@patch("backend.src.brain.get_async_openai_client")
+def test_async_openai_chat_complete_records_usage_without_blocking(
+    mock_get_client, mock_async_redis, mock_record
+):
+    from backend.src.brain import async_openai_chat_complete
+
+    response = MagicMock()
+    response.choices[0].message.content = "answer"
+    response.usage = SimpleNamespace(
+        prompt_tokens=2000,
+        completion_tokens=10,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=1536),
+    )
+    mock_get_client.return_value.chat.completions.create = AsyncMock(return_value=response)
+    pipe = mock_async_redis.return_value.pipeline.return_value
+    pipe.execute = AsyncMock()
+
+    answer = asyncio.run(
+        async_openai_chat_complete([{"role": "user", "content": "hi"}], stage="answer")
+    )
+
+    assert answer == "answer"
+    # counted through the asyncio client, the blocking one is never used
+    mock_record.assert_not_called()
+    pipe.hincrby.assert_any_call("prompts:usage", "answer:cached_tokens", 1536)
+    pipe.execute.assert_awaited_once()
+
+
+@patch("backend.src.prompts.get_redis_client")
+def test_usage_stats_report_cache_hit_ratio(mock_redis):
+    from backend.src.prompts import get_usage_stats, record_usage
+
+    store = {}
+    pipe = MagicMock()
+    pipe.hincrby.side_effect = lambda key, field, amount: store.__setitem__(
+        field, store.get(field, 0) + amount
+    )
+    pipe.hincrbyfloat.side_effect = pipe.hincrby.side_effect
+    mock_redis.return_value.pipeline.return_value = pipe
+    mock_redis.return_value.hgetall.side_effect = lambda key: {
+        field.encode(): str(value).encode() for field, value in store.items()
+    }
+
+    def usage(prompt_tokens, cached_tokens):
+        return SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=10,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+        )
+
+    record_usage("answer", usage(2000, 0), 2.0)
+    record_usage("answer", usage(2000, 1536), 1.5)
+
+    stats = get_usage_stats()["answer"]
+    assert stats["calls"] == 2
+    assert stats["cached_tokens"] == 1536
+    assert stats["cache_hit_ratio"] == 1536 / 4000
+    assert stats["latency_saved"] == 0.5
@@ -0,0 +1,73 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+def test_notifier_wakes_every_waiter_of_a_task():
+    from backend.src.task_events import TaskCompletionNotifier
+
+    async def scenario():
+        notifier = TaskCompletionNotifier()
+        # no Redis here: pretend the listener is already running
+        notifier._listener = asyncio.get_running_loop().create_future()
+
+        waiters = [notifier.register("task-1") for _ in range(3)]
+        other = notifier.register("task-2")
+        asyncio.get_running_loop().call_later(0.01, notifier.dispatch, "task-1", "SUCCESS")
+
+        states = await asyncio.gather(*(notifier.wait(w, timeout=1) for w in waiters))
+        timed_out = await notifier.wait(other, timeout=0.01)
+        notifier.unregister("task-2", other)
+        return states, timed_out, dict(notifier._waiters)
+
+    states, timed_out, remaining = asyncio.run(scenario())
+
+    assert states == ["SUCCESS"] * 3
+    assert timed_out is None
+    assert remaining == {}
+
+
+@patch("backend.src.task_events.aioredis.Redis")
+def test_notifier_reports_subscription_only_after_psubscribe(mock_redis):
+    from backend.src.task_events import TaskCompletionNotifier
+
+    psubscribed = asyncio.Event()
+
+    async def psubscribe(pattern):
+        await asyncio.sleep(0.01)
+        psubscribed.set()
+
+    async def listen():
+        await asyncio.Event().wait()
+        yield
+
+    pubsub = MagicMock()
+    pubsub.__aenter__.return_value = pubsub
+    pubsub.psubscribe.side_effect = psubscribe
+    pubsub.listen.side_effect = listen
+    mock_redis.return_value.pubsub.return_value = pubsub
+    mock_redis.return_value.aclose = AsyncMock()
+
+    async def scenario():
+        notifier = TaskCompletionNotifier()
+        notifier.register("task-1")
+        subscribed = await notifier.wait_subscribed(timeout=1)
+        was_psubscribed = psubscribed.is_set()
+        notifier._listener.cancel()
+        return subscribed, was_psubscribed
+
+    assert asyncio.run(scenario()) == (True, True)
+
+
+@patch("backend.src.task_events.get_redis_client")
+def test_publish_task_done(mock_redis):
+    from backend.src.task_events import publish_task_done
+
+    redis_client = MagicMock()
+    mock_redis.return_value = redis_client
+
+    publish_task_done("task-1", "SUCCESS")
+    redis_client.publish.assert_called_once_with("task_done:task-1", "SUCCESS")
+
+    # a broken broker connection must not fail the task
+    mock_redis.side_effect = ConnectionError("redis down")
+    publish_task_done("task-1", "SUCCESS")
@@ -0,0 +1,348 @@
+from unittest.mock import patch
+
+import pytest
+from llama_index.core.schema import TextNode
+
+
+def _nodes(doc_id, title, texts):
+    return [TextNode(text=text, metadata={"doc_id": doc_id, "title": title}) for text in texts]
+
+
+@patch("backend.src.tasks.invalidate_cached_answers")
+@patch("backend.src.tasks.set_document_payload")
+@patch("backend.src.tasks.delete_stale_document_points")
+@patch("backend.src.tasks.upsert_points")
+@patch("backend.src.tasks.get_cached_embeddings")
+@patch("backend.src.tasks.get_document_tenant", return_value=None)
+@patch("backend.src.tasks.get_document_point_ids")
+@patch("backend.src.tasks.dynamic_chunking")
+def test_reindex_document_only_embeds_changed_chunks(
+    mock_chunking, mock_point_ids, mock_tenant, mock_embed, mock_upsert, mock_delete, mock_set_payload,
+    mock_invalidate
+):
+    from backend.src.tasks import reindex_document
+    from backend.src.utils import generate_chunk_id
+
+    old_texts = ["Đoạn một.", "Đoạn hai.", "Đoạn ba."]
+    new_texts = ["Đoạn một.", "Đoạn hai đã sửa.", "Đoạn ba."]
+    mock_point_ids.return_value = [generate_chunk_id("7", text) for text in old_texts]
+    mock_chunking.return_value = _nodes("7", "Title", new_texts)
+    mock_embed.side_effect = lambda texts, model: [[0.1] for _ in texts]
+
+    reindex_document("7", "Title", " ".join(new_texts))
+
+    # points are embedded lazily, as the upsert consumes them
+    upserted = list(mock_upsert.call_args.args[0])
+    assert [point["id"] for point in upserted] == [generate_chunk_id("7", "Đoạn hai đã sửa.")]
+    mock_embed.assert_called_once()
+    assert mock_embed.call_args.args[0] == ["Đoạn hai đã sửa."]
+    assert set(mock_delete.call_args.kwargs["keep_ids"]) == {generate_chunk_id("7", text) for text in new_texts}
+    mock_set_payload.assert_called_once_with("7", {"title": "Title"})
+    mock_invalidate.assert_called_once_with(["7"])
+
+
+@patch("backend.src.tasks.invalidate_cached_answers")
+@patch("backend.src.tasks.set_document_payload")
+@patch("backend.src.tasks.delete_stale_document_points")
+@patch("backend.src.tasks.upsert_points")
+@patch("backend.src.tasks.get_cached_embeddings")
+@patch("backend.src.tasks.get_document_tenant", return_value="bot-a")
+@patch("backend.src.tasks.get_document_point_ids")
+@patch("backend.src.tasks.dynamic_chunking")
+def test_reindex_document_keeps_tenant_of_indexed_document(
+    mock_chunking, mock_point_ids, mock_tenant, mock_embed, mock_upsert, mock_delete, mock_set_payload,
+    mock_invalidate
+):
+    from backend.src.tasks import reindex_document, settings
+
+    mock_point_ids.return_value = []
+    mock_chunking.side_effect = lambda text, metadata: [TextNode(text=text, metadata=metadata)]
+    mock_embed.side_effect = lambda texts, model: [[0.1] for _ in texts]
+
+    reindex_document("7", "Title", "Đoạn đã sửa.")
+
+    mock_tenant.assert_called_once_with("7")
+    upserted = list(mock_upsert.call_args.args[0])
+    assert [point["metadata"][settings.qdrant_tenant_field] for point in upserted] == ["bot-a"]
+    mock_set_payload.assert_called_once_with(
+        "7", {"title": "Title", settings.qdrant_tenant_field: "bot-a"}
+    )
+
+
+@patch("backend.src.tasks.get_cached_embeddings")
+def test_iter_chunk_points_embeds_one_batch_at_a_time(mock_embed):
+    from backend.src.tasks import iter_chunk_points
+
+    chunks = {str(i): TextNode(text=f"Đoạn {i}.", metadata={"doc_id": "7"}) for i in range(5)}
+    mock_embed.side_effect = lambda texts, model: [[0.1] for _ in texts]
+
+    points = iter_chunk_points(chunks, batch_size=2)
+    first = [next(points), next(points)]
+
+    # the next batch is only embedded once the previous one has been consumed
+    assert mock_embed.call_count == 1
+    rest = list(points)
+    assert [point["id"] for point in first + rest] == ["0", "1", "2", "3", "4"]
+    assert [len(call.args[0]) for call in mock_embed.call_args_list] == [2, 2, 1]
+    assert rest[-1]["metadata"] == {"doc_id": "7", "content": "Đoạn 4."}
+
+
+@patch("backend.src.tasks.settings.route_strategy", "llm")
+@patch("backend.src.tasks.rag_qa_task", return_value="rag answer")
+@patch("backend.src.tasks.enhance_query_quality", return_value="rewritten question")
+@patch("backend.src.tasks.detect_route")
+def test_bot_route_runs_route_and_rewrite_concurrently(mock_route, mock_rewrite, mock_rag):
+    import threading
+
+    from backend.src.tasks import bot_route_answer_message
+
+    rewrite_started = threading.Event()
+    mock_rewrite.side_effect = lambda history, question: rewrite_started.set() or "rewritten question"
+    # routing only finishes once the rewrite has started, i.e. they overlap
+    mock_route.side_effect = lambda history, question: rewrite_started.wait(timeout=5) and "medical"
+
+    answer = bot_route_answer_message([], "Triệu chứng sốt?")
+
+    assert answer == "rag answer"
+    assert mock_rag.call_args.kwargs["rewritten_question"] == "rewritten question"
+
+
+@patch("backend.src.tasks.settings.route_strategy", "llm")
+@patch("backend.src.tasks.ai_agent_handle", return_value="agent answer")
+@patch("backend.src.tasks.rag_qa_task")
+@patch("backend.src.tasks.enhance_query_quality", return_value="rewritten question")
+@patch("backend.src.tasks.detect_route", return_value="general")
+def test_bot_route_discards_rewrite_for_general_questions(mock_route, mock_rewrite, mock_rag, mock_agent):
+    from backend.src.tasks import bot_route_answer_message
+
+    assert bot_route_answer_message([], "Thủ đô của Pháp?") == "agent answer"
+    mock_agent.assert_called_once_with("Thủ đô của Pháp?")
+    mock_rag.assert_not_called()
+
+
+@patch("backend.src.tasks.settings.route_strategy", "combined")
+@patch("backend.src.tasks.rag_qa_task", return_value="rag answer")
+@patch("backend.src.tasks.enhance_query_quality")
+@patch("backend.src.tasks.detect_route")
+@patch("backend.src.brain.openai_chat_complete")
+def test_bot_route_uses_single_structured_call(mock_chat, mock_route, mock_rewrite, mock_rag):
+    from backend.src.tasks import bot_route_answer_message
+
+    mock_chat.return_value = '{"route": "medical", "rewritten_question": "Triệu chứng sốt xuất huyết?"}'
+
+    assert bot_route_answer_message([], "Triệu chứng sốt?") == "rag answer"
+    mock_chat.assert_called_once()
+    assert mock_chat.call_args.kwargs["response_format"] == {"type": "json_object"}
+    assert mock_rag.call_args.kwargs["rewritten_question"] == "Triệu chứng sốt xuất huyết?"
+    mock_route.assert_not_called()
+    mock_rewrite.assert_not_called()
+
+
+@patch("backend.src.tasks.settings.route_strategy", "combined")
+@patch("backend.src.tasks.rag_qa_task", return_value="rag answer")
+@patch("backend.src.tasks.enhance_query_quality", return_value="rewritten question")
+@patch("backend.src.tasks.detect_route", return_value="medical")
+@patch("backend.src.brain.openai_chat_complete", return_value='{"route": "other"}')
+def test_bot_route_falls_back_on_invalid_structured_output(mock_chat, mock_route, mock_rewrite, mock_rag):
+    from backend.src.tasks import bot_route_answer_message
+
+    assert bot_route_answer_message([], "Triệu chứng sốt?") == "rag answer"
+    mock_route.assert_called_once()
+    assert mock_rag.call_args.kwargs["rewritten_question"] == "rewritten question"
+
+
+@patch("backend.src.tasks.persist_assistant_answer")
+@patch("backend.src.tasks.store_cached_answer")
+@patch("backend.src.tasks.openai_chat_complete_stream", return_value=iter(["Sốt ", "cao."]))
+@patch("backend.src.tasks.prepare_rag_answer")
+@patch("backend.src.tasks.resolve_route")
+@patch("backend.src.tasks.load_conversation_history")
+@patch("backend.src.tasks.update_conversation", return_value=1)
+def test_stream_message_handler_persists_full_answer(
+    mock_update, mock_messages, mock_route, mock_prepare, mock_stream, mock_store, mock_persist
+):
+    from concurrent.futures import Future
+
+    from backend.src.tasks import stream_message_handler
+
+    rewrite_future = Future()
+    rewrite_future.set_result("Triệu chứng sốt là gì?")
+    mock_route.return_value = ("medical", rewrite_future)
+    mock_messages.return_value = [{"role": "user", "content": "Triệu chứng sốt?"}]
+    mock_prepare.return_value = {
+        "question": "Triệu chứng sốt là gì?",
+        "question_embedding": [0.1],
+        "cached_answer": None,
+        "use_web_search": False,
+        "doc_ids": ["1"],
+        "messages": [],
+    }
+
+    tokens = list(stream_message_handler("bot", "user", "Triệu chứng sốt?"))
+
+    assert tokens == ["Sốt ", "cao."]
+    mock_persist.assert_called_once_with("bot", "user", "Sốt cao.")
+    assert mock_store.call_args.args[2] == "Sốt cao."
+
+
+@patch("backend.src.tasks.persist_assistant_answer")
+@patch("backend.src.tasks.store_cached_answer")
+@patch("backend.src.tasks.openai_chat_complete_stream", return_value=iter(["Sốt ", "cao."]))
+@patch("backend.src.tasks.prepare_rag_answer")
+@patch("backend.src.tasks.resolve_route")
+@patch("backend.src.tasks.load_conversation_history")
+@patch("backend.src.tasks.update_conversation", return_value=1)
+def test_stream_message_handler_persists_partial_answer_on_disconnect(
+    mock_update, mock_messages, mock_route, mock_prepare, mock_stream, mock_store, mock_persist
+):
+    from concurrent.futures import Future
+
+    from backend.src.tasks import stream_message_handler
+
+    rewrite_future = Future()
+    rewrite_future.set_result("Triệu chứng sốt là gì?")
+    mock_route.return_value = ("medical", rewrite_future)
+    mock_messages.return_value = [{"role": "user", "content": "Triệu chứng sốt?"}]
+    mock_prepare.return_value = {
+        "question": "Triệu chứng sốt là gì?",
+        "question_embedding": [0.1],
+        "cached_answer": None,
+        "use_web_search": False,
+        "doc_ids": ["1"],
+        "messages": [],
+    }
+
+    stream = stream_message_handler("bot", "user", "Triệu chứng sốt?")
+    assert next(stream) == "Sốt "
+    stream.close()
+
+    mock_persist.assert_called_once_with("bot", "user", "Sốt ")
+    mock_store.assert_not_called()
+
+
+@patch("backend.src.tasks.persist_assistant_answer")
+@patch("backend.src.tasks.store_cached_answer")
+@patch("backend.src.tasks.openai_chat_complete_stream")
+@patch("backend.src.tasks.prepare_rag_answer")
+@patch("backend.src.tasks.resolve_route")
+@patch("backend.src.tasks.load_conversation_history")
+@patch("backend.src.tasks.update_conversation", return_value=1)
+def test_stream_message_handler_persists_nothing_on_error(
+    mock_update, mock_messages, mock_route, mock_prepare, mock_stream, mock_store, mock_persist
+):
+    from concurrent.futures import Future
+
+    from backend.src.tasks import stream_message_handler
+
+    def failing_stream(*args, **kwargs):
+        yield "Sốt "
+        raise RuntimeError("connection reset")
+
+    rewrite_future = Future()
+    rewrite_future.set_result("Triệu chứng sốt là gì?")
+    mock_route.return_value = ("medical", rewrite_future)
+    mock_messages.return_value = [{"role": "user", "content": "Triệu chứng sốt?"}]
+    mock_prepare.return_value = {
+        "question": "Triệu chứng sốt là gì?",
+        "question_embedding": [0.1],
+        "cached_answer": None,
+        "use_web_search": False,
+        "doc_ids": ["1"],
+        "messages": [],
+    }
+    mock_stream.side_effect = failing_stream
+
+    stream = stream_message_handler("bot", "user", "Triệu chứng sốt?")
+    assert next(stream) == "Sốt "
+    with pytest.raises(RuntimeError):
+        next(stream)
+
+    mock_persist.assert_not_called()
+    mock_store.assert_not_called()
+
+
+@patch("backend.src.tasks.get_summarized_contents")
+@patch("backend.src.tasks.schedule_summary")
+@patch("backend.src.tasks.add_assistant_message", return_value="conversation-1:1")
+@patch("backend.src.tasks.bot_route_answer_message", return_value="Câu trả lời đầy đủ.")
+@patch("backend.src.tasks.load_conversation_history")
+@patch("backend.src.tasks.update_conversation", return_value="conversation-1")
+def test_message_handler_returns_before_summarizing(
+    mock_update, mock_messages, mock_answer, mock_add, mock_schedule, mock_summarize
+):
+    from backend.src.tasks import message_handler_task
+
+    mock_messages.return_value = [{"role": "user", "content": "Sốt là gì?"}]
+
+    result = message_handler_task("bot", "user", "Sốt là gì?")
+
+    assert result == {"role": "assistant", "content": "Câu trả lời đầy đủ."}
+    # the full answer is stored right away, the summary is deferred
+    mock_add.assert_called_once_with("bot", "user", "Câu trả lời đầy đủ.")
+    mock_schedule.assert_called_once_with("conversation-1:1")
+    mock_summarize.assert_not_called()
+
+
+@patch("backend.src.tasks.summarize_assistant_messages")
+@patch("backend.src.tasks.enqueue_pending_summary")
+def test_schedule_summary_batches(mock_enqueue, mock_summarize):
+    from backend.src.tasks import schedule_summary
+
+    schedule_summary(1, batch_size=1)
+    mock_summarize.delay.assert_called_once_with([1])
+    mock_enqueue.assert_not_called()
+
+    mock_summarize.reset_mock()
+    mock_enqueue.side_effect = [1, 2, 3]
+    for message_id in (1, 2, 3):
+        schedule_summary(message_id, batch_size=3)
+    # a delayed flush for the first message, an immediate one once the batch is full
+    mock_summarize.apply_async.assert_called_once()
+    mock_summarize.delay.assert_called_once_with()
+
+
+@patch("backend.src.tasks.update_conversation_message")
+@patch("backend.src.tasks.get_summarized_contents", return_value=["tóm tắt 1", "tóm tắt 2"])
+@patch("backend.src.tasks.get_conversation_messages")
+def test_summarize_assistant_messages_replaces_answers(mock_get, mock_summarize, mock_update):
+    from backend.src.tasks import summarize_assistant_messages
+
+    mock_get.return_value = {"c1:1": "câu trả lời 1", "c2:3": "câu trả lời 2"}
+
+    summarize_assistant_messages(["c1:1", "c2:3"])
+
+    mock_summarize.assert_called_once_with(["câu trả lời 1", "câu trả lời 2"])
+    mock_update.assert_any_call("c1:1", "tóm tắt 1")
+    mock_update.assert_any_call("c2:3", "tóm tắt 2")
+
+
+@patch("backend.src.tasks.get_pending_summary_count", return_value=2)
+@patch("backend.src.tasks.requeue_pending_summaries")
+@patch("backend.src.tasks.pop_pending_summaries", return_value=["c1:1", "c2:3"])
+@patch("backend.src.tasks.get_summarized_contents", side_effect=RuntimeError("timeout"))
+@patch("backend.src.tasks.get_conversation_messages")
+def test_summarize_assistant_messages_requeues_batch_on_failure(
+    mock_get, mock_summarize, mock_pop, mock_requeue, mock_count
+):
+    from backend.src.tasks import summarize_assistant_messages
+
+    mock_get.return_value = {"c1:1": "câu trả lời 1", "c2:3": "câu trả lời 2"}
+
+    with patch.object(summarize_assistant_messages, "apply_async") as mock_retry:
+        with pytest.raises(RuntimeError):
+            summarize_assistant_messages()
+
+    mock_requeue.assert_called_once_with(["c1:1", "c2:3"])
+    mock_retry.assert_called_once()
+
+
+@patch("backend.src.tasks.persist_conversation_writes")
+def test_schedule_conversation_flush_batches_writes(mock_persist):
+    from backend.src.tasks import schedule_conversation_flush
+
+    for queued in range(1, 8):
+        schedule_conversation_flush(queued, batch_size=3)
+
+    # delayed flush for the first write, immediate ones for each full batch
+    mock_persist.apply_async.assert_called_once()
+    assert mock_persist.delay.call_count == 2
@@ -22,3 +22,15 @@ class TestUtilityFunctions:
 
         id_custom = generate_request_id(max_length=16)
         assert len(id_custom) == 17  # 16 + 1
+
+    def test_generate_chunk_id(self):
+        import uuid
+
+        from backend.src.utils import generate_chunk_id
+
+        chunk_id = generate_chunk_id("42", "Sốt là triệu chứng thường gặp.")
+
+        assert chunk_id == generate_chunk_id("42", "Sốt là triệu chứng thường gặp.")
+        assert chunk_id != generate_chunk_id("43", "Sốt là triệu chứng thường gặp.")
+        assert chunk_id != generate_chunk_id("42", "Ho là triệu chứng thường gặp.")
+        assert uuid.UUID(chunk_id).version == 5
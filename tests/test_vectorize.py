@@ -0,0 +1,108 @@
+from unittest.mock import MagicMock, patch
+
+
+def _points(n):
+    return ({"id": i, "embedding": [0.1], "metadata": {"doc_id": "1"}} for i in range(n))
+
+
+@patch("backend.src.vectorize.get_qdrant_client")
+def test_upsert_points_streams_batches_with_barrier(mock_get_client):
+    from backend.src.vectorize import upsert_points
+
+    client = MagicMock()
+    mock_get_client.return_value = client
+
+    total = upsert_points(_points(10), collection_name="docs", batch_size=4, parallel=2, wait=False)
+
+    assert total == 10
+    calls = client.upsert.call_args_list
+    # three streamed batches without waiting, then the last batch again as a barrier
+    assert sorted(len(call.kwargs["points"]) for call in calls[:3]) == [2, 4, 4]
+    assert all(call.kwargs["wait"] is False for call in calls[:3])
+    assert calls[3].kwargs["wait"] is True
+    assert [point.id for point in calls[3].kwargs["points"]] == [8, 9]
+
+
+@patch("backend.src.vectorize.time.sleep")
+@patch("backend.src.vectorize.get_qdrant_client")
+def test_upsert_points_retries_failed_batch(mock_get_client, mock_sleep):
+    from backend.src.vectorize import upsert_points
+
+    client = MagicMock()
+    client.upsert.side_effect = [RuntimeError("timeout"), MagicMock()]
+    mock_get_client.return_value = client
+
+    total = upsert_points(_points(3), collection_name="docs", batch_size=10, parallel=1, wait=True)
+
+    assert total == 3
+    assert client.upsert.call_count == 2
+    mock_sleep.assert_called_once_with(1)
+
+
+def test_build_quantization_config():
+    import pytest
+    from qdrant_client.models import ProductQuantization, ScalarQuantization
+
+    from backend.src.vectorize import build_quantization_config
+
+    assert build_quantization_config("") is None
+    assert isinstance(build_quantization_config("scalar"), ScalarQuantization)
+    assert isinstance(build_quantization_config("product", product_compression="x32"), ProductQuantization)
+    assert build_quantization_config("binary", always_ram=False).binary.always_ram is False
+    with pytest.raises(ValueError):
+        build_quantization_config("int4")
+
+
+@patch("backend.src.vectorize.get_qdrant_client")
+def test_search_vectors_passes_rescoring_params(mock_get_client):
+    from backend.src.vectorize import search_vectors
+
+    client = MagicMock()
+    client.search.return_value = []
+    mock_get_client.return_value = client
+
+    search_vectors([0.1], top_k=3, collection_name="docs", hnsw_ef=128, oversampling=3.0)
+
+    search_params = client.search.call_args.kwargs["search_params"]
+    assert search_params.hnsw_ef == 128
+    assert search_params.quantization.oversampling == 3.0
+    assert search_params.quantization.rescore is True
+
+
+def test_build_filter():
+    from qdrant_client.models import Filter, MatchAny, MatchValue
+
+    from backend.src.vectorize import build_filter
+
+    assert build_filter(None) is None
+    assert build_filter({}) is None
+
+    query_filter = build_filter({"doc_id": ["1", "2"], "bot_id": "Meddy"})
+    assert isinstance(query_filter, Filter)
+    assert query_filter.must[0].key == "doc_id"
+    assert query_filter.must[0].match == MatchAny(any=["1", "2"])
+    assert query_filter.must[1].match == MatchValue(value="Meddy")
+
+
+def test_scope_search_filter_overrides_client_tenant():
+    from backend.src.vectorize import scope_search_filter
+
+    assert scope_search_filter(None, "Meddy") == {"bot_id": "Meddy"}
+    assert scope_search_filter({"doc_id": ["1"], "bot_id": ["Meddy", "other"]}, "Meddy") == {
+        "doc_id": ["1"],
+        "bot_id": "Meddy",
+    }
+
+
+@patch("backend.src.vectorize.get_qdrant_client")
+def test_ensure_payload_indexes_creates_missing_indexes(mock_get_client):
+    from backend.src.vectorize import ensure_payload_indexes
+
+    client = MagicMock()
+    client.get_collection.return_value.payload_schema = {"doc_id": MagicMock()}
+    mock_get_client.return_value = client
+
+    ensure_payload_indexes("docs")
+
+    created = {call.kwargs["field_name"] for call in client.create_payload_index.call_args_list}
+    assert created == {"title", "bot_id"}